@@ -0,0 +1,125 @@
+"""Benchmark: /prospects latency while /search, /compose or /export.csv run alongside.
+
+    python bench/bench_concurrency.py [--rows 20000] [--readers 4] [--seconds 5] [--llm-ms 400]
+
+Readers page through /prospects back to back for ``--seconds`` per phase:
+first on an idle app, then with each kind of background traffic looping
+beside them. All of it shares one event loop, as in a single uvicorn
+worker, so anything that blocks the loop shows up as reader latency and
+as loop lag (how late a 5 ms ticker wakes up). YouTube is replayed from a
+synthetic fixture (bench_pipeline.py) and the LLM is a stand-in that
+answers after ``--llm-ms``, with the compose cache's DB tier on.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench_pipeline import pct, write_fixture  # noqa: E402
+from bench_upsert import make_rows  # noqa: E402
+
+
+class SlowLLM:
+    """Answers every chat after a fixed delay, like a remote model would."""
+    model = 'bench'
+    temperature = 0.0
+    available = True
+
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+
+    async def chat(self, system: str, prompt: str):
+        await asyncio.sleep(self.latency_s)
+        return 'Yo, bench message.'
+
+
+async def loop_lag(stop: asyncio.Event, out: list, tick: float = 0.005):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(tick)
+        out.append((time.perf_counter() - t0 - tick) * 1000)
+
+
+async def reader(client, stop: asyncio.Event, out: list):
+    cursor = None
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        r = await client.get('/prospects', params=dict(limit=50, **({'cursor': cursor} if cursor else {})))
+        out.append((time.perf_counter() - t0) * 1000)
+        r.raise_for_status()
+        cursor = r.headers.get('x-next-cursor')
+
+
+async def background(kind: str, client, stop: asyncio.Event, body: dict, done: list):
+    while not stop.is_set():
+        if kind == 'search':
+            r = await client.post('/search', json=body)
+        elif kind == 'compose':
+            r = await client.post('/compose', json=dict(name=f'Artist {uuid.uuid4().hex[:8]}', video_title='Song'))
+        else:
+            r = await client.get('/export.csv')
+        r.raise_for_status()
+        done.append(1)
+
+
+async def run(args):
+    import httpx
+    import main
+    from persist import upsert_prospects
+
+    await main.migrate_db()  # ASGITransport doesn't run startup hooks
+    main.lang_gate.load()
+    main.llm = SlowLLM(args.llm_ms / 1000)
+    async with main.engine.begin() as cx:
+        for i in range(0, args.rows, 5000):
+            await cx.run_sync(upsert_prospects, make_rows(min(args.rows, i + 5000))[i:])
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url='http://bench', timeout=None)
+    body = dict(queries=[f'bench query {i}' for i in range(args.queries)], region_codes=['GB', 'US'],
+                max_results_per_query=100, min_subs=0, max_subs=10 ** 9, min_video_views=0, incremental=False)
+
+    print(f'{"alongside":<10} {"reads":>6} {"p50 ms":>8} {"p95 ms":>8} {"max ms":>8} {"lag p99":>8} {"lag max":>8} {"bg done":>8}')
+    for kind in ('idle', 'search', 'compose', 'export'):
+        stop = asyncio.Event()
+        lat, lag, done = [], [], []
+        tasks = [asyncio.create_task(loop_lag(stop, lag))]
+        tasks += [asyncio.create_task(reader(client, stop, lat)) for _ in range(args.readers)]
+        if kind != 'idle':
+            tasks += [asyncio.create_task(background(kind, client, stop, body, done)) for _ in range(args.background)]
+        await asyncio.sleep(args.seconds)
+        stop.set()
+        await asyncio.gather(*tasks)
+        print(f'{kind:<10} {len(lat):>6} {pct(lat, 50):>8.1f} {pct(lat, 95):>8.1f} {max(lat, default=0):>8.1f} '
+              f'{pct(lag, 99):>8.1f} {max(lag, default=0):>8.1f} {len(done):>8}')
+
+    await client.aclose()
+    await main.engine.dispose()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--rows', type=int, default=20000, help='prospects in the table')
+    ap.add_argument('--readers', type=int, default=4, help='concurrent /prospects clients')
+    ap.add_argument('--background', type=int, default=2, help='concurrent background clients per phase')
+    ap.add_argument('--seconds', type=float, default=5.0, help='length of each phase')
+    ap.add_argument('--llm-ms', type=float, default=400.0, help='stand-in LLM latency')
+    ap.add_argument('--queries', type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture = os.path.join(tmp, 'yt.jsonl')
+        write_fixture(fixture, [f'bench query {i}' for i in range(args.queries)], ['GB', 'US'], 2)
+        # configure the app before it is imported
+        os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'leads.db')}", YT_API_KEY='replay',
+                          YT_REPLAY_PATH=fixture, COMPOSE_CACHE_DB='1')
+        os.environ.pop('YT_RECORD_PATH', None)
+        asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
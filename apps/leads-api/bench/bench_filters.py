@@ -0,0 +1,148 @@
+"""Microbenchmark: compiled CandidateFilter vs the old per-regex filter chain.
+
+    python bench/bench_filters.py [items.jsonl] [--n 5000] [--keywords 20]
+
+Items are ``{"video": {...}, "channel": {...}}`` pairs as returned by the
+videos/channels endpoints. Without a file a deterministic synthetic set is
+generated. Language detection is left out of both sides; it is measured
+separately.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from filters import (CandidateFilter, EXCLUDE_BIG_ARTISTS, EXCLUDE_CHANNEL, EXCLUDE_HANDLE,  # noqa: E402
+                     EXCLUDE_REPOST, EXCLUDE_TOPIC_CH, EXCLUDE_VIDEO, INCLUDE_VIDEO)
+
+WORDS = ('love night city heart slow drive summer rain golden echo midnight soul river blue fire gold '
+         'wave dream home alone light dark stay run').split()
+TITLE_TAGS = ['(Official Audio)', '(Official Video)', 'Visualizer', '[Lyric Video]', 'type beat', 'Live Performance',
+              'Fan Edit', 'slowed + reverb', '', '', '']
+CH_SUFFIX = ['', '', '', ' Beats', ' - Topic', ' Records', ' Music']
+BIOS = ['Independent R&B singer and songwriter from London.', 'Official channel.', 'Producer. Beats for sale.',
+        'New music every friday', 'I do not own the rights to this music', 'Alt soul artist. Booking: mgmt@example.com']
+
+
+def synth_items(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    for i in range(n):
+        words = ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 5)))
+        title = f"{words.title()} {rnd.choice(TITLE_TAGS)}".strip()
+        desc = '\n'.join(' '.join(rnd.choice(WORDS) for _ in range(12)) for _ in range(rnd.randint(1, 8)))
+        ch_name = f"{rnd.choice(WORDS).title()} {rnd.choice(WORDS).title()}{rnd.choice(CH_SUFFIX)}"
+        yield {
+            'video': {'id': f'v{i}', 'snippet': {'title': title, 'description': desc, 'channelId': f'c{i % 400}',
+                                                 'publishedAt': '2024-05-01T00:00:00Z',
+                                                 'categoryId': rnd.choice(['10', '10', '10', '22']),
+                                                 'liveBroadcastContent': rnd.choice(['none'] * 9 + ['live'])},
+                      'statistics': {'viewCount': str(rnd.randint(0, 20000))}},
+            'channel': {'id': f'c{i % 400}', 'snippet': {'title': ch_name, 'description': rnd.choice(BIOS),
+                                                         'customUrl': '@' + ch_name.replace(' ', '').lower()},
+                        'statistics': {'subscriberCount': str(rnd.randint(200, 200000))},
+                        'brandingSettings': {'channel': {'description': rnd.choice(BIOS)}}},
+        }
+
+
+def legacy_accept(req, v, ch) -> bool:
+    """The filter chain as it used to run inline in search() (minus langid)."""
+    snip = v['snippet']
+    v_title = snip['title']
+    v_desc = snip.get('description', '') or ''
+    ch_title = ch['snippet']['title']
+    ch_desc = (ch['snippet'].get('description', '') + '\n' +
+               ch.get('brandingSettings', {}).get('channel', {}).get('description', ''))
+    handle = ch['snippet'].get('customUrl') or ''
+    subs = int(ch.get('statistics', {}).get('subscriberCount', 0))
+    views = int(v.get('statistics', {}).get('viewCount', 0))
+    live = snip.get('liveBroadcastContent', 'none')
+    cat = snip.get('categoryId')
+    if subs < req.min_subs or subs > req.max_subs:
+        return False
+    if live and live.lower() != 'none':
+        return False
+    if cat and str(cat) != '10':
+        return False
+    if EXCLUDE_CHANNEL.search(ch_title) or EXCLUDE_CHANNEL.search(ch_desc):
+        return False
+    if EXCLUDE_HANDLE.search(handle):
+        return False
+    if EXCLUDE_VIDEO.search(v_title):
+        return False
+    if EXCLUDE_REPOST.search(v_title) or EXCLUDE_REPOST.search(v_desc) or EXCLUDE_REPOST.search(ch_desc):
+        return False
+    if EXCLUDE_BIG_ARTISTS.search(v_title) or EXCLUDE_BIG_ARTISTS.search(ch_title):
+        return False
+    if EXCLUDE_TOPIC_CH.search(ch_title):
+        return False
+    if req.exclude_keywords:
+        joined = f"{v_title}\n{v_desc}\n{ch_title}\n{handle}"
+        if any(kw.lower() in joined.lower() for kw in req.exclude_keywords):
+            return False
+    looks_official = bool(INCLUDE_VIDEO.search(v_title))
+    looks_artist_bio = bool(re.search(r"(?i)\b(artist|singer|songwriter|musician|official)\b", ch_desc))
+    if req.strict_artist_filter and not (looks_official or looks_artist_bio):
+        return False
+    if views < req.min_video_views:
+        return False
+    return True
+
+
+class _Req:
+    min_subs = 1000
+    max_subs = 120000
+    min_video_views = 300
+    strict_artist_filter = True
+    exclude_keywords = []
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('items', nargs='?')
+    ap.add_argument('--n', type=int, default=5000)
+    ap.add_argument('--keywords', type=int, default=20)
+    ap.add_argument('--repeat', type=int, default=5)
+    args = ap.parse_args()
+
+    if args.items:
+        with open(args.items) as fh:
+            items = [json.loads(line) for line in fh if line.strip()]
+    else:
+        items = list(synth_items(args.n))
+    req = _Req()
+    req.exclude_keywords = [f'blocked{i}' for i in range(args.keywords)]
+
+    def run_legacy():
+        return [legacy_accept(req, it['video'], it['channel']) for it in items]
+
+    def run_compiled():
+        flt = CandidateFilter.from_request(req)
+        return [flt.evaluate(it['video'], it['channel'])[0] is None for it in items]
+
+    assert run_legacy() == run_compiled(), 'filter results differ'
+    flt = CandidateFilter.from_request(req)
+    for it in items:
+        flt.evaluate(it['video'], it['channel'])
+
+    timings = {}
+    for name, fn in (('legacy', run_legacy), ('compiled', run_compiled)):
+        best = float('inf')
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+        timings[name] = best
+    n = len(items)
+    for name, t in timings.items():
+        print(f'{name:>9}: {t * 1000:8.1f} ms  ({t / n * 1e6:6.1f} us/item)')
+    print(f'  speedup: {timings["legacy"] / timings["compiled"]:.2f}x over {n} items')
+    print('rejections:', dict(flt.rejections.most_common()))
+
+
+if __name__ == '__main__':
+    main()
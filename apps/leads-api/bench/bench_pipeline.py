@@ -0,0 +1,193 @@
+"""Benchmark: /search, /prospects and /export.csv through the ASGI app, offline.
+
+    python bench/bench_pipeline.py [--fixture yt.jsonl] [--sizes 0,10000,100000] [--reps 10]
+
+YouTube is served by the replay transport (replay.py) from a JSONL fixture:
+either one recorded against the real API by running the app with
+``YT_RECORD_PATH=yt.jsonl``, or, by default, a deterministic synthetic one
+written to a temp dir. The app runs on a throwaway SQLite file, topped up
+with filler prospects to each size in ``--sizes`` before that size's runs.
+
+Every /search rep starts cold for the searched videos (their prospects and
+cursors are deleted) but with the metadata cache warm after the first rep,
+which is reported on its own line. Stage times come from the Server-Timing
+header; stages run by concurrent tasks add up, so they can exceed the total.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench_filters import synth_items  # noqa: E402
+from bench_upsert import make_rows  # noqa: E402
+
+STAGES = ('fetch', 'filter', 'lang', 'dedupe', 'persist', 'total')
+SEARCH_PARAMS = dict(part='id,snippet', type='video', order='date', maxResults='50',
+                     videoDuration='medium', relevanceLanguage='en')
+
+
+def write_fixture(path: str, queries, regions, pages: int, seed: int = 3):
+    """Search pages for each (query, region) plus the videos/channels they reference.
+
+    Regions of one query share half their videos, as they do on YouTube.
+    """
+    rnd = random.Random(seed)
+    items = synth_items(len(queries) * pages * 50 * 2, seed)
+    with open(path, 'w') as f:
+        def emit(endpoint, params, body):
+            f.write(json.dumps(dict(endpoint=endpoint, params=params, status=200, body=body)) + '\n')
+
+        for qi, q in enumerate(queries):
+            pool = [next(items) for _ in range(pages * 50 * 2)]
+            for v in pool:
+                v['video']['id'] = f"q{qi}{v['video']['id']}"
+            emit('videos', {}, dict(items=[p['video'] for p in pool]))
+            emit('channels', {}, dict(items=list({p['channel']['id']: p['channel'] for p in pool}.values())))
+            for ri, rc in enumerate(regions):
+                start = (ri % 2) * pages * 25  # every other region shifted by half
+                vids = [p['video']['id'] for p in pool[start:start + pages * 50]]
+                rnd.shuffle(vids)
+                for page in range(pages):
+                    params = dict(SEARCH_PARAMS, q=q, regionCode=rc)
+                    if page:
+                        params['pageToken'] = f'p{page}'
+                    body = dict(items=[{'id': {'videoId': v}, 'snippet': {'publishedAt': '2024-05-01T00:00:00Z'}}
+                                       for v in vids[page * 50:(page + 1) * 50]])
+                    if page + 1 < pages:
+                        body['nextPageToken'] = f'p{page + 1}'
+                    emit('search', params, body)
+
+
+def fixture_queries(path: str):
+    queries, regions = {}, {}  # ordered sets
+    with open(path) as f:
+        for line in f:
+            rec = json.loads(line)
+            if rec['endpoint'] == 'search':
+                queries[rec['params']['q']] = regions[rec['params']['regionCode']] = None
+    return list(queries), list(regions)
+
+
+def pct(xs, p: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))] if xs else 0.0
+
+
+def server_timing(header: str) -> dict:
+    out = {}
+    for part in filter(None, (p.strip() for p in header.split(','))):
+        name, _, dur = part.partition(';dur=')
+        out[name] = float(dur or 0)
+    return out
+
+
+def report(label: str, size: int, lat_ms, stages=None):
+    cols = ''.join(f' {sum(s.get(k, 0) for s in stages) / len(stages):>8.1f}' for k in STAGES) if stages else ''
+    print(f'{label:<14} {size:>7} {len(lat_ms):>4} {pct(lat_ms, 50):>8.1f} {pct(lat_ms, 95):>8.1f}{cols}')
+
+
+async def run(args, fixture: str):
+    import httpx
+    import main
+    from persist import upsert_prospects
+
+    queries, regions = fixture_queries(fixture)
+    await main.migrate_db()  # ASGITransport doesn't run startup hooks
+    main.lang_gate.load()
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url='http://bench', timeout=None)
+    body = dict(queries=queries, region_codes=regions, max_results_per_query=args.pages * 50,
+                min_subs=0, max_subs=10 ** 9, min_video_views=0)
+
+    async def reset_search():
+        async with main.engine.begin() as cx:
+            await cx.execute(main.prospects_table.delete().where(main.prospects_table.c.query_source.in_(queries)))
+            await cx.exec_driver_sql('DELETE FROM search_cursors')
+        await main.known_ids.load()
+
+    print(f'{"":<14} {"rows":>7} {"n":>4} {"p50 ms":>8} {"p95 ms":>8}' + ''.join(f' {k:>8}' for k in STAGES))
+    have = 0
+    for size in args.sizes:
+        if size > have:
+            async with main.engine.begin() as cx:
+                for i in range(have, size, 5000):
+                    rows = make_rows(min(size, i + 5000))[i:]
+                    for r in rows:
+                        r['query_source'] = 'bench-filler'
+                    await cx.run_sync(upsert_prospects, rows)
+            have = size
+
+        lat, stages = [], []
+        for rep in range(args.reps + 1):
+            await reset_search()
+            t0 = time.perf_counter()
+            r = await client.post('/search', json=body)
+            ms = (time.perf_counter() - t0) * 1000
+            r.raise_for_status()
+            if rep == 0:
+                report('search (cold)', size, [ms], [server_timing(r.headers.get('server-timing', ''))])
+                found = len(r.json())
+            else:
+                lat.append(ms)
+                stages.append(server_timing(r.headers.get('server-timing', '')))
+        report('search', size, lat, stages)
+
+        lat = []
+        for _ in range(args.reps):
+            cursor = None
+            for _ in range(args.pages_read):
+                t0 = time.perf_counter()
+                r = await client.get('/prospects', params=dict(limit=200, **({'cursor': cursor} if cursor else {})))
+                lat.append((time.perf_counter() - t0) * 1000)
+                cursor = r.headers.get('x-next-cursor')
+                if not cursor:
+                    break
+        report('prospects', size, lat)
+
+        lat = []
+        for _ in range(args.export_reps):
+            t0 = time.perf_counter()
+            r = await client.get('/export.csv')
+            lat.append((time.perf_counter() - t0) * 1000)
+        report('export.csv', size, lat)
+        print(f'{"":<14} prospects found per search: {found}, export bytes: {len(r.content)}')
+
+    import replay
+    if replay._replay is not None and replay._replay.misses:
+        print(f'warning: {replay._replay.misses} searches were not in the fixture')
+    await client.aclose()
+    await main.engine.dispose()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--fixture', help='recorded JSONL (default: synthetic)')
+    ap.add_argument('--sizes', default='0,10000,100000')
+    ap.add_argument('--reps', type=int, default=10)
+    ap.add_argument('--export-reps', type=int, default=3)
+    ap.add_argument('--pages-read', type=int, default=5, help='/prospects pages walked per rep')
+    ap.add_argument('--queries', type=int, default=3, help='synthetic fixture only')
+    ap.add_argument('--regions', default='GB,US', help='synthetic fixture only')
+    ap.add_argument('--pages', type=int, default=2, help='search pages per (query, region)')
+    args = ap.parse_args()
+    args.sizes = [int(x) for x in args.sizes.split(',')]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture = args.fixture
+        if not fixture:
+            fixture = os.path.join(tmp, 'yt.jsonl')
+            write_fixture(fixture, [f'bench query {i}' for i in range(args.queries)], args.regions.split(','), args.pages)
+        # configure the app before it is imported
+        os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'leads.db')}", YT_API_KEY='replay',
+                          YT_REPLAY_PATH=os.path.abspath(fixture))
+        os.environ.pop('YT_RECORD_PATH', None)
+        asyncio.run(run(args, fixture))
+
+
+if __name__ == '__main__':
+    main()
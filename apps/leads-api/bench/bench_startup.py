@@ -0,0 +1,98 @@
+"""Startup budget: how long ``import main`` takes, and how long until /readyz.
+
+    python bench/bench_startup.py [--budget-ms 1200] [--runs 5]
+
+Imports the app in fresh interpreters with ``-X importtime`` and a DB URL
+that can't be opened (importing must not touch the DB), then reports the
+median and the slowest top-level imports. Exits 1 if the median is over
+the budget (IMPORT_BUDGET_MS) or if any of LAZY was imported on the way, so
+it can gate CI. Last, it starts the app on a throwaway SQLite file and
+times each warmup step until /readyz answers 200.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# loaded on first use or by a warmup step, never by the import itself
+LAZY = ('openai', 'sendgrid', 'langid', 'numpy', 'aiohttp')
+IMPORT_BUDGET_MS = float(os.getenv('IMPORT_BUDGET_MS', '1200'))
+
+
+def import_once(env: dict):
+    """Cumulative ms of ``main``, {top-level import: ms}, and every module imported."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=APP_DIR, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode:
+        raise SystemExit(f'import main failed:\n{proc.stderr[-2000:]}')
+    total, top, seen = 0.0, {}, set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue  # header
+        mod = name.strip()
+        seen.add(mod.split('.')[0])
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0 and mod == 'main':
+            total = int(cumulative) / 1000
+        elif depth == 1:
+            top[mod] = int(cumulative) / 1000
+    return total, top, seen
+
+
+def time_to_ready(tmp: str):
+    os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'leads.db')}", EMAIL_SENDER='stub')
+    sys.path.insert(0, APP_DIR)
+    t0 = time.perf_counter()
+    import main
+    from fastapi.testclient import TestClient
+    imported = time.perf_counter() - t0
+    with TestClient(main.app) as c:
+        up = time.perf_counter() - t0
+        while c.get('/readyz').status_code != 200:
+            time.sleep(0.02)
+        ready = time.perf_counter() - t0
+        steps = c.get('/readyz').json()['steps']
+    print(f'imported {imported * 1000:.0f} ms, up {up * 1000:.0f} ms, ready {ready * 1000:.0f} ms')
+    for name, st in steps.items():
+        print(f'  {name:<12} {st.get("seconds", 0) * 1000:>8.0f} ms')
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS)
+    ap.add_argument('--runs', type=int, default=5)
+    ap.add_argument('--no-ready', action='store_true', help='skip the time-to-ready run')
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'missing', 'leads.db')}")
+        runs = [import_once(env) for _ in range(args.runs)]
+        median = statistics.median(r[0] for r in runs)
+        top = runs[-1][1]
+        eager = sorted(set(LAZY) & set().union(*(r[2] for r in runs)))
+
+        print(f'import main: median {median:.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)')
+        for mod, ms in sorted(top.items(), key=lambda kv: -kv[1])[:8]:
+            print(f'  {mod:<24} {ms:>8.1f} ms')
+        failed = False
+        if eager:
+            print('imported eagerly, should be lazy:', ', '.join(eager))
+            failed = True
+        if median > args.budget_ms:
+            print('over budget')
+            failed = True
+        if not args.no_ready:
+            time_to_ready(tmp)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark: bulk prospect upsert vs the old per-row DELETE + INSERT loop.
+
+    python bench/bench_upsert.py [--url sqlite:///bench.db] [--sizes 1000,10000,100000]
+
+Each size is written twice per strategy, once into an empty table (all
+inserts) and once more over the same ids (all updates). Defaults to a
+throwaway SQLite file; pass a Postgres URL to measure the real thing (this
+runs the helpers on a plain sync engine, so that needs psycopg2 installed).
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+import sqlalchemy as sa
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from persist import metadata, upsert_prospects  # noqa: E402
+
+
+def make_rows(n: int):
+    now = datetime.datetime.utcnow()
+    return [dict(id=f'yt_bench{i}', name=f'Artist {i}', platform='youtube', handle=f'@artist{i}',
+                 email=f'artist{i}@example.com' if i % 3 == 0 else None, instagram=None,
+                 subs=1000 + i, last_video_at=(now - datetime.timedelta(minutes=i)).isoformat() + 'Z',
+                 video_title=f'Song {i} (Official Audio)', video_url=f'https://www.youtube.com/watch?v=bench{i}',
+                 channel_url=f'https://www.youtube.com/channel/C{i}', query_source='bench', created_at=now)
+            for i in range(n)]
+
+
+def legacy_store(engine, rows):
+    with engine.begin() as cx:
+        for r in rows:
+            cx.execute(text('DELETE FROM prospects WHERE id=:id'), {'id': r['id']})
+            cols = ','.join(r.keys())
+            vals = ','.join([f":{k}" for k in r.keys()])
+            cx.execute(text(f'INSERT INTO prospects ({cols}) VALUES ({vals})'), r)
+
+
+def bulk_store(engine, rows):
+    with engine.begin() as cx:
+        return upsert_prospects(cx, rows)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--url')
+    ap.add_argument('--sizes', default='1000,10000,100000')
+    args = ap.parse_args()
+
+    tmp = None
+    url = args.url
+    if not url:
+        tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        url = f'sqlite:///{tmp.name}'
+    engine = sa.create_engine(url, future=True)
+    metadata.create_all(engine)
+
+    print(f'{"rows":>8} {"strategy":>8} {"insert s":>10} {"update s":>10}')
+    try:
+        for n in (int(x) for x in args.sizes.split(',')):
+            rows = make_rows(n)
+            for name, fn in (('legacy', legacy_store), ('bulk', bulk_store)):
+                with engine.begin() as cx:
+                    cx.execute(text('DELETE FROM prospects'))
+                t0 = time.perf_counter()
+                fn(engine, rows)
+                t1 = time.perf_counter()
+                fn(engine, rows)
+                t2 = time.perf_counter()
+                print(f'{n:>8} {name:>8} {t1 - t0:>10.2f} {t2 - t1:>10.2f}')
+    finally:
+        engine.dispose()
+        if tmp:
+            os.unlink(tmp.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import asyncio
+import datetime
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import sqlalchemy as sa
+
+import outbox
+from instrumentation import count_error
+from persist import metadata
+
+CAMPAIGN_CONCURRENCY = int(os.getenv('CAMPAIGN_CONCURRENCY', '16'))
+CAMPAIGN_FLUSH_SECONDS = 2.0  # how often live progress is written back to the DB
+
+campaigns = sa.Table(
+    'campaigns', metadata,
+    sa.Column('id', sa.Text, primary_key=True),
+    sa.Column('status', sa.Text, nullable=False),
+    sa.Column('total', sa.Integer), sa.Column('composed', sa.Integer), sa.Column('queued', sa.Integer),
+    sa.Column('skipped', sa.Integer), sa.Column('failed', sa.Integer),
+    sa.Column('params_json', sa.Text), sa.Column('error', sa.Text),
+    sa.Column('created_at', sa.DateTime, nullable=False), sa.Column('finished_at', sa.DateTime),
+)
+
+PROGRESS_FIELDS = ('status', 'total', 'composed', 'queued', 'skipped', 'failed', 'error')
+
+# progress of campaigns running in this process, served before the DB row
+_live: Dict[str, Dict] = {}
+_tasks: set = set()
+
+
+async def create(engine, cid: str, total: int, skipped: int, params: dict) -> Dict:
+    state = dict(status='composing', total=total, composed=0, queued=0, skipped=skipped, failed=0, error=None)
+    async with engine.begin() as cx:
+        await cx.execute(campaigns.insert().values(id=cid, params_json=json.dumps(params),
+                                             created_at=datetime.datetime.utcnow(), **state))
+    _live[cid] = state
+    return state
+
+
+async def progress(engine, cid: str) -> Optional[Dict]:
+    if cid in _live:
+        return dict(_live[cid], id=cid)
+    async with engine.connect() as cx:
+        row = (await cx.execute(sa.select(campaigns).where(campaigns.c.id == cid))).mappings().first()
+    if not row:
+        return None
+    return dict({k: row[k] for k in PROGRESS_FIELDS}, id=cid)
+
+
+async def _flush(engine, cid: str, finished: bool = False):
+    values = {k: _live[cid][k] for k in PROGRESS_FIELDS}
+    if finished:
+        values['finished_at'] = datetime.datetime.utcnow()
+    async with engine.begin() as cx:
+        await cx.execute(campaigns.update().where(campaigns.c.id == cid).values(**values))
+
+
+async def run(engine, cid: str, prospects: List[Dict], compose: Callable[[Dict], Awaitable[Optional[Dict]]],
+              concurrency: int = CAMPAIGN_CONCURRENCY, on_queued: Optional[Callable[[], None]] = None):
+    """Compose every prospect concurrently, then enqueue all messages in one transaction.
+
+    ``compose`` returns an outbox row (id, prospect_id, to_addr, subject,
+    body) or None to skip the prospect.
+    """
+    state = _live[cid]
+    sem = asyncio.Semaphore(max(1, concurrency))
+    last_flush = time.monotonic()
+
+    async def one(p):
+        nonlocal last_flush
+        async with sem:
+            try:
+                row = await compose(p)
+            except Exception as e:
+                count_error('campaign_compose_error')
+                print('campaign_compose_error', cid, p.get('id'), repr(e))
+                row = None
+                state['failed'] += 1
+        if row is not None:
+            state['composed'] += 1
+        if time.monotonic() - last_flush >= CAMPAIGN_FLUSH_SECONDS:
+            last_flush = time.monotonic()
+            await _flush(engine, cid)
+        return row
+
+    try:
+        rows = [r for r in await asyncio.gather(*(one(p) for p in prospects)) if r is not None]
+        state['status'] = 'queueing'
+        if rows:
+            async with engine.begin() as cx:
+                await cx.run_sync(outbox.enqueue, rows)
+        state['queued'] = len(rows)
+        state['status'] = 'queued'
+        if on_queued and rows:
+            on_queued()
+    except Exception as e:
+        state.update(status='error', error=str(e) or repr(e))
+        count_error('campaign_error')
+        print('campaign_error', cid, repr(e))
+    finally:
+        try:
+            await _flush(engine, cid, True)
+        finally:
+            _live.pop(cid, None)
+
+
+def start(engine, cid: str, prospects: List[Dict], compose, on_queued=None) -> asyncio.Task:
+    task = asyncio.create_task(run(engine, cid, prospects, compose, on_queued=on_queued))
+    _tasks.add(task)  # keep a reference until it finishes
+    task.add_done_callback(_tasks.discard)
+    return task
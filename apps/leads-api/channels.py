@@ -0,0 +1,171 @@
+import datetime
+import math
+import os
+from typing import Dict, Iterable, Optional, Tuple
+
+import sqlalchemy as sa
+
+from persist import PUBLIC_COLUMNS, UPSERT_CHUNK, apply_filters, decode_cursor, dialect_insert, metadata, parse_ts
+
+# one row per YouTube channel, however many of its videos were stored as
+# prospects; mirrors the CREATE TABLE in migrations.py
+channels = sa.Table(
+    'channels', metadata,
+    sa.Column('channel_id', sa.Text, primary_key=True),
+    sa.Column('channel_url', sa.Text), sa.Column('name', sa.Text), sa.Column('handle', sa.Text),
+    sa.Column('email', sa.Text), sa.Column('instagram', sa.Text), sa.Column('subs', sa.Integer),
+    sa.Column('official', sa.Integer), sa.Column('artist_bio', sa.Integer), sa.Column('views_per_day', sa.Float),
+    sa.Column('videos', sa.Integer), sa.Column('sightings', sa.Integer),
+    sa.Column('last_video_at', sa.DateTime),
+    sa.Column('video_title', sa.Text), sa.Column('video_url', sa.Text), sa.Column('query_source', sa.Text),
+    sa.Column('score', sa.Float, nullable=False),
+    sa.Column('created_at', sa.DateTime, nullable=False), sa.Column('updated_at', sa.DateTime),
+)
+
+CHANNEL_COLUMNS = [c.name for c in channels.columns]
+_KEEP_ON_UPDATE = {'channel_id', 'created_at'}
+
+OFFICIAL_WEIGHT = 3.0
+ARTIST_BIO_WEIGHT = 2.0
+# recency bonus: RECENCY_WEIGHT for an upload today, falling linearly to 0 at RECENCY_DAYS old
+RECENCY_WEIGHT = float(os.getenv('CHANNEL_RECENCY_WEIGHT', '1'))
+RECENCY_DAYS = float(os.getenv('CHANNEL_RECENCY_DAYS', '90'))
+
+
+def views_per_day(views: int, published_at, now: Optional[datetime.datetime] = None) -> float:
+    """Views a video gathered per day since it went up (at least a day, so fresh uploads don't spike)."""
+    published_at = parse_ts(published_at)
+    if published_at is None:
+        return 0.0
+    age = ((now or datetime.datetime.utcnow()) - published_at).total_seconds() / 86400
+    return views / max(1.0, age)
+
+
+def score(ch: dict, now: Optional[datetime.datetime] = None) -> float:
+    """Stored ranking score: official-video and artist-bio signals, view velocity and recency.
+
+    Recency is capped at RECENCY_WEIGHT, so it orders channels whose other
+    signals are close but never outweighs them. It is taken at ``now`` (the
+    time of the write) and is only refreshed when the channel is seen again,
+    so a stored score overstates a quiet channel by at most that cap.
+    Signals that are unknown (NULL, as for backfilled channels) count as
+    absent.
+    """
+    s = OFFICIAL_WEIGHT * bool(ch.get('official')) + ARTIST_BIO_WEIGHT * bool(ch.get('artist_bio'))
+    s += math.log10(1 + (ch.get('views_per_day') or 0)) / 2
+    last = parse_ts(ch.get('last_video_at'))
+    if last is not None:
+        age = ((now or datetime.datetime.utcnow()) - last).total_seconds() / 86400
+        s += RECENCY_WEIGHT * min(1.0, max(0.0, 1 - age / RECENCY_DAYS))
+    return round(s, 6)
+
+
+def _max(a, b):
+    # max where None means "not known" rather than zero
+    return b if a is None else a if b is None else max(a, b)
+
+
+def aggregate(records: Iterable[dict], now: Optional[datetime.datetime] = None) -> Dict[str, dict]:
+    """Fold candidate videos into one entry per channel in a single pass.
+
+    ``best`` is the channel's top video by ``(_score, last_video_at)``, the
+    first one on ties; ``first`` is the position of that video so callers
+    can break score ties in arrival order. The rest is channel state for
+    ``upsert_channels``, scored on this batch alone.
+    """
+    now = now or datetime.datetime.utcnow()
+    out: Dict[str, dict] = {}
+    for i, r in enumerate(records):
+        cid = r['_channel_id']
+        rank = (r.get('_score', 0), parse_ts(r['last_video_at']) or datetime.datetime.min)
+        a = out.get(cid)
+        if a is None:
+            out[cid] = a = dict(channel_id=cid, official=0, artist_bio=None, views_per_day=None, videos=0,
+                                sightings=1, last_video_at=None, best=r, first=i, _rank=rank)
+        elif rank > a['_rank']:
+            a.update(best=r, first=i, _rank=rank)
+        a['official'] = max(a['official'], int(bool(r.get('_official'))))
+        if r.get('_artist_bio') is not None:
+            a['artist_bio'] = _max(a['artist_bio'], int(bool(r['_artist_bio'])))
+        a['views_per_day'] = _max(a['views_per_day'], r.get('_views_per_day'))
+        a['videos'] += 1
+        ts = parse_ts(r['last_video_at'])
+        if ts is not None and (a['last_video_at'] is None or ts > a['last_video_at']):
+            a['last_video_at'] = ts
+    for a in out.values():
+        a.pop('_rank')
+        b = a['best']
+        a.update({k: b.get(k) for k in ('channel_url', 'name', 'handle', 'email', 'instagram', 'subs',
+                                        'video_title', 'video_url', 'query_source')})
+        a['score'] = score(a, now)
+    return out
+
+
+def _merge(old: Optional[dict], new: dict, now: datetime.datetime) -> dict:
+    """Stored channel + this batch; O(1) per channel, nothing is re-read from prospects."""
+    m = {c: new.get(c) for c in CHANNEL_COLUMNS}
+    m['updated_at'] = now
+    if old is None:
+        m['created_at'] = now
+    else:
+        m['created_at'] = old['created_at']
+        for k in ('official', 'artist_bio', 'views_per_day'):
+            m[k] = _max(old[k], new[k])
+        for k in ('handle', 'email', 'instagram'):
+            m[k] = new[k] or old[k]
+        m['videos'] = (old['videos'] or 0) + new['videos']
+        m['sightings'] = (old['sightings'] or 0) + new['sightings']
+        if old['last_video_at'] is not None and (m['last_video_at'] is None or old['last_video_at'] > m['last_video_at']):
+            m['last_video_at'] = old['last_video_at']
+    m['score'] = score(m, now)
+    return m
+
+
+def upsert_channels(cx, aggregates: Iterable[dict]) -> Tuple[int, int]:
+    """Fold per-channel batches (``aggregate`` values) into ``channels``; returns ``(inserted, updated)``.
+
+    Stored rows are read locked (``FOR UPDATE`` on Postgres), merged in
+    Python and written back with the same dialect upsert as prospects.
+    """
+    aggregates = list(aggregates)
+    insert = dialect_insert(cx.dialect.name)
+    now = datetime.datetime.utcnow()
+    inserted = updated = 0
+    for i in range(0, len(aggregates), UPSERT_CHUNK):
+        chunk = aggregates[i:i + UPSERT_CHUNK]
+        ids = [a['channel_id'] for a in chunk]
+        q = sa.select(channels).where(channels.c.channel_id.in_(ids)).with_for_update()
+        stored = {r['channel_id']: r for r in cx.execute(q).mappings()}
+        recs = [_merge(stored.get(a['channel_id']), a, now) for a in chunk]
+        if insert is not None:
+            stmt = insert(channels)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[channels.c.channel_id],
+                set_={c: stmt.excluded[c] for c in CHANNEL_COLUMNS if c not in _KEEP_ON_UPDATE},
+            )
+            cx.execute(stmt, recs)
+        else:
+            if stored:
+                cx.execute(channels.delete().where(channels.c.channel_id.in_(list(stored))))
+            cx.execute(channels.insert(), recs)
+        updated += len(stored)
+        inserted += len(chunk) - len(stored)
+    return inserted, updated
+
+
+def channel_query(cursor: Optional[str] = None, query_source: Optional[str] = None,
+                  min_subs: Optional[int] = None, max_subs: Optional[int] = None,
+                  has_email: Optional[bool] = None):
+    """Best-first channels with keyset pagination on ``(score, channel_id)``, served by ix_channels_score.
+
+    Selects the prospect columns (best video, latest query) plus ``score``
+    and ``channel_id`` for the next cursor.
+    """
+    c = channels.c
+    q = sa.select(*[c[name] for name in PUBLIC_COLUMNS], c.score, c.channel_id)
+    q = apply_filters(q, c, query_source=query_source, min_subs=min_subs, max_subs=max_subs, has_email=has_email)
+    if cursor:
+        s, cid = decode_cursor(cursor, float)
+        q = q.where(sa.tuple_(c.score, c.channel_id) < (s, cid))
+    return q.order_by(c.score.desc(), c.channel_id.desc())
+
@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import text
+
+from instrumentation import CACHE_LOOKUPS, count_error
+
+COMPOSE_CACHE_SIZE = int(os.getenv('COMPOSE_CACHE_SIZE', '5000'))
+COMPOSE_CACHE_TTL = int(os.getenv('COMPOSE_CACHE_TTL', str(7 * 86400)))
+COMPOSE_CACHE_DB = os.getenv('COMPOSE_CACHE_DB', '0') == '1'
+
+_WS = re.compile(r'\s+')
+
+
+def _norm(v):
+    return _WS.sub(' ', v).strip() if isinstance(v, str) else v
+
+
+def cache_key(fields: Dict, model: str, temperature: float) -> str:
+    """Content address for a composed message: normalized inputs + model settings."""
+    payload = {k: _norm(v) for k, v in sorted(fields.items())}
+    raw = json.dumps([payload, model, round(float(temperature), 3)], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf8')).hexdigest()
+
+
+class ComposeCache:
+    """LRU of composed messages with single-flight and an optional DB tier.
+
+    Concurrent requests for the same key share one in-flight computation;
+    if its leader is cancelled, a waiting request takes over.
+    ``compute`` returns ``(message, cacheable)``; template fallbacks are
+    returned but not stored, so a transient LLM failure isn't pinned.
+    """
+
+    def __init__(self, engine=None, size: int = COMPOSE_CACHE_SIZE, ttl: int = COMPOSE_CACHE_TTL):
+        self.engine = engine
+        self.size = size
+        self.ttl = ttl
+        self._lru: 'OrderedDict[str, Tuple[str, float, float]]' = OrderedDict()  # key -> (message, stored_at, latency)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = dict(hits=0, db_hits=0, misses=0, coalesced=0, stored=0, latency_saved_s=0.0, compute_s=0.0)
+
+    def _get(self, key: str) -> Optional[Tuple[str, float, float]]:
+        hit = self._lru.get(key)
+        if hit is None:
+            return None
+        if time.time() - hit[1] >= self.ttl:
+            del self._lru[key]
+            return None
+        self._lru.move_to_end(key)
+        return hit
+
+    def _put(self, key: str, value: Tuple[str, float, float]):
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.size:
+            self._lru.popitem(last=False)
+
+    async def _db_get(self, key: str) -> Optional[Tuple[str, float, float]]:
+        try:
+            async with self.engine.connect() as cx:
+                row = (await cx.execute(text('SELECT message, created_at, latency FROM compose_cache WHERE key=:k'), dict(k=key))).first()
+        except Exception as db_err:
+            count_error('compose_cache_load_error')
+            print('compose_cache_load_error', repr(db_err))
+            return None
+        if row and time.time() - (row[1] or 0) < self.ttl:
+            return row[0], row[1], row[2] or 0.0
+        return None
+
+    async def _db_put(self, key: str, value: Tuple[str, float, float]):
+        try:
+            async with self.engine.begin() as cx:
+                await cx.execute(text('''INSERT INTO compose_cache (key, message, created_at, latency) VALUES (:k, :m, :t, :l)
+                                         ON CONFLICT (key) DO UPDATE SET message=excluded.message, created_at=excluded.created_at,
+                                           latency=excluded.latency'''),
+                                 dict(k=key, m=value[0], t=value[1], l=value[2]))
+        except Exception as db_err:
+            count_error('compose_cache_store_error')
+            print('compose_cache_store_error', repr(db_err))
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Tuple[str, bool]]]) -> str:
+        hit = self._get(key)
+        if hit is not None:
+            self.stats['hits'] += 1
+            CACHE_LOOKUPS.inc(cache='compose', result='hit')
+            self.stats['latency_saved_s'] += hit[2]
+            return hit[0]
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.stats['coalesced'] += 1
+            CACHE_LOOKUPS.inc(cache='compose', result='coalesced')
+            try:
+                return await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                if not fut.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                # the leader was cancelled, not us: start over, one of the waiters leads now
+                return await self.get_or_compute(key, compute)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            if self.engine is not None:
+                hit = await self._db_get(key)
+                if hit is not None:
+                    self.stats['db_hits'] += 1
+                    CACHE_LOOKUPS.inc(cache='compose', result='db_hit')
+                    self.stats['latency_saved_s'] += hit[2]
+                    self._put(key, hit)
+                    fut.set_result(hit[0])
+                    return hit[0]
+            self.stats['misses'] += 1
+            CACHE_LOOKUPS.inc(cache='compose', result='miss')
+            t0 = time.perf_counter()
+            message, cacheable = await compute()
+            latency = time.perf_counter() - t0
+            self.stats['compute_s'] += latency
+            if cacheable:
+                value = (message, time.time(), latency)
+                self._put(key, value)
+                self.stats['stored'] += 1
+                if self.engine is not None:
+                    await self._db_put(key, value)
+            fut.set_result(message)
+            return message
+        except asyncio.CancelledError:
+            # the leader's caller went away; that says nothing about the
+            # followers' requests, so they recompute instead of failing
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def snapshot(self) -> dict:
+        s = dict(self.stats, size=len(self._lru), db_tier=self.engine is not None)
+        lookups = s['hits'] + s['db_hits'] + s['misses'] + s['coalesced']
+        s['hit_ratio'] = round((lookups - s['misses']) / lookups, 3) if lookups else None
+        s['latency_saved_s'] = round(s['latency_saved_s'], 3)
+        s['compute_s'] = round(s['compute_s'], 3)
+        return s
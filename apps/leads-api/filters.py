@@ -0,0 +1,160 @@
+import hashlib
+import json
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# --- artist-focused filters (add these) ---
+EXCLUDE_VIDEO = re.compile(
+    r"(?i)\b(type\s*beat|instrumental|mix|playlist|full\s*album|dj\s*mix|karaoke|cover|tribute|sped\s*up|slowed|8d|remaster|remastered|199\d|200\d)\b"
+)
+EXCLUDE_CHANNEL = re.compile(
+    r"(?i)\b(beats?|type\s*beats?|instrumentals?|producer|prod\.?|beatmaker|records|mixtapes?)\b"
+)
+INCLUDE_VIDEO = re.compile(
+    r"(?i)\b(official (audio|video)|visualizer|lyric video|single|performance)\b"
+)
+EXCLUDE_HANDLE = re.compile(r"(?i)(beats|prod|producer)")
+
+# NEW: fan/reupload/fancam filters
+EXCLUDE_REPOST = re.compile(
+    r"(?i)\b(fan[\s-]?cam|fan[\s-]?made|fan[\s-]?edit|edit|re[-\s]?upload|"
+    r"no\s+copyright|i\s+do\s+not\s+own\s+the\s+rights|credits?\s+to)\b"
+)
+
+# NEW: block huge/fandom keywords that skew results toward big acts
+EXCLUDE_BIG_ARTISTS = re.compile(
+    r"(?i)\b(blackpink|bts|stray\s*kids|twice|seventeen|nct|taylor\s*swift|"
+    r"billie\s*eilish|olivia\s*rodrigo|ariana\s*grande|drake|bad\s*bunny|doja\s*cat|eminem|rihanna|dua\s*lipa)\b"
+)
+
+# Skip auto-generated “- Topic” channels
+EXCLUDE_TOPIC_CH = re.compile(r"(?i)\b\-?\s*topic\b")
+
+ARTIST_BIO = re.compile(r"(?i)\b(artist|singer|songwriter|musician|official)\b")
+
+# rejection reason codes, in the order the gates run
+REJECT_SUBS = 'subs'
+REJECT_VIEWS = 'views'
+REJECT_LIVE = 'live'
+REJECT_CATEGORY = 'category'
+REJECT_CHANNEL = 'channel'
+REJECT_HANDLE = 'handle'
+REJECT_VIDEO = 'video'
+REJECT_REPOST = 'repost'
+REJECT_BIG_ARTIST = 'big_artist'
+REJECT_TOPIC = 'topic_channel'
+REJECT_KEYWORD = 'keyword'
+REJECT_NOT_ARTIST = 'not_artist'
+REJECT_LANGUAGE = 'language'
+
+# which exclude patterns apply to which text field
+FIELD_RULES: Dict[str, List[Tuple[str, re.Pattern]]] = {
+    'ch_title': [(REJECT_CHANNEL, EXCLUDE_CHANNEL), (REJECT_BIG_ARTIST, EXCLUDE_BIG_ARTISTS), (REJECT_TOPIC, EXCLUDE_TOPIC_CH)],
+    'ch_desc': [(REJECT_CHANNEL, EXCLUDE_CHANNEL), (REJECT_REPOST, EXCLUDE_REPOST)],
+    'handle': [(REJECT_HANDLE, EXCLUDE_HANDLE)],
+    'v_title': [(REJECT_VIDEO, EXCLUDE_VIDEO), (REJECT_REPOST, EXCLUDE_REPOST), (REJECT_BIG_ARTIST, EXCLUDE_BIG_ARTISTS)],
+    'v_desc': [(REJECT_REPOST, EXCLUDE_REPOST)],
+}
+
+
+def merge_patterns(rules: Iterable[Tuple[str, re.Pattern]]) -> re.Pattern:
+    """Fold case-insensitive patterns into one alternation with a named group per reason.
+
+    A single ``search`` then tells whether any of them matches and, through
+    ``lastgroup``, which one matched first in the text.
+    """
+    parts = []
+    for code, pat in rules:
+        body = pat.pattern[4:] if pat.pattern.startswith('(?i)') else pat.pattern
+        parts.append(f'(?P<{code}>{body})')
+    return re.compile('|'.join(parts), re.IGNORECASE)
+
+
+FIELD_MATCHERS = {field: merge_patterns(rules) for field, rules in FIELD_RULES.items()}
+
+
+class CandidateFilter:
+    """Single-pass accept/reject for one (video, channel) pair.
+
+    Built once per /search so the runtime blocklist is compiled once. Numeric
+    gates run before any text is touched and every text field is scanned by
+    one merged pattern. The language check is not part of this pass: callers
+    batch it over the survivors and record it with ``count``. Rejection
+    counts per reason code are kept in ``rejections``.
+    """
+
+    def __init__(self, min_subs: int, max_subs: int, min_video_views: int = 300,
+                 strict_artist_filter: bool = True, exclude_keywords: Optional[List[str]] = None):
+        self.min_subs = min_subs
+        self.max_subs = max_subs
+        self.min_video_views = min_video_views
+        self.strict_artist_filter = strict_artist_filter
+        self.keywords = (re.compile('|'.join(re.escape(kw.lower()) for kw in exclude_keywords))
+                         if exclude_keywords else None)
+        self.rejections: Counter = Counter()
+        # the settings as a short key: search cursors are only reused under the filters they were built with
+        settings = [min_subs, max_subs, min_video_views, bool(strict_artist_filter),
+                    sorted({kw.lower() for kw in exclude_keywords or ()})]
+        self.key = hashlib.sha1(json.dumps(settings).encode()).hexdigest()[:16]
+
+    @classmethod
+    def from_request(cls, req) -> 'CandidateFilter':
+        return cls(req.min_subs, req.max_subs,
+                   min_video_views=getattr(req, 'min_video_views', 300),
+                   strict_artist_filter=getattr(req, 'strict_artist_filter', True),
+                   exclude_keywords=getattr(req, 'exclude_keywords', None))
+
+    def count(self, code: str):
+        self.rejections[code] += 1
+
+    def _reject(self, code: str) -> Tuple[str, None]:
+        self.count(code)
+        return code, None
+
+    def evaluate(self, v: dict, ch: dict) -> Tuple[Optional[str], Optional[dict]]:
+        """Return ``(None, fields)`` for an accepted pair, else ``(reason, None)``."""
+        snip = v['snippet']
+        csnip = ch['snippet']
+
+        # cheap numeric gates first
+        subs = int(ch.get('statistics', {}).get('subscriberCount', 0))
+        if subs < self.min_subs or subs > self.max_subs:
+            return self._reject(REJECT_SUBS)
+        views = int(v.get('statistics', {}).get('viewCount', 0))
+        if views < self.min_video_views:
+            return self._reject(REJECT_VIEWS)
+        live = snip.get('liveBroadcastContent', 'none')
+        if live and live.lower() != 'none':
+            return self._reject(REJECT_LIVE)
+        cat = snip.get('categoryId')
+        if cat and str(cat) != '10':  # 10 = Music
+            return self._reject(REJECT_CATEGORY)
+
+        f = dict(
+            v_title=snip['title'],
+            v_desc=snip.get('description', '') or '',
+            ch_title=csnip['title'],
+            ch_desc=(csnip.get('description', '') + '\n' +
+                     ch.get('brandingSettings', {}).get('channel', {}).get('description', '')),
+            handle=csnip.get('customUrl') or '',
+        )
+
+        # producer / repost / giant-artist filters, one scan per field
+        for field, matcher in FIELD_MATCHERS.items():
+            m = matcher.search(f[field])
+            if m:
+                return self._reject(m.lastgroup)
+        # runtime custom blocklist
+        if self.keywords is not None:
+            joined = f"{f['v_title']}\n{f['v_desc']}\n{f['ch_title']}\n{f['handle']}"
+            if self.keywords.search(joined.lower()):
+                return self._reject(REJECT_KEYWORD)
+
+        looks_official = bool(INCLUDE_VIDEO.search(f['v_title']))
+        looks_artist_bio = bool(ARTIST_BIO.search(f['ch_desc']))
+        if self.strict_artist_filter and not (looks_official or looks_artist_bio):
+            return self._reject(REJECT_NOT_ARTIST)
+
+        f.update(subs=subs, views=views, looks_official=looks_official, looks_artist_bio=looks_artist_bio)
+        return None, f
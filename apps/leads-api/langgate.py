@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Sequence, Tuple
+
+LANG_MIN_PROB = float(os.getenv('LANG_MIN_PROB', '0.85'))
+LANG_PREFIX_CHARS = int(os.getenv('LANG_PREFIX_CHARS', '600'))  # per text part
+LANG_MEMO_SIZE = int(os.getenv('LANG_MEMO_SIZE', '50000'))
+LANG_WORKERS = int(os.getenv('LANG_WORKERS', '2'))
+# share of letters outside the Latin blocks above which text is rejected without the model
+LANG_NON_LATIN_MAX = float(os.getenv('LANG_NON_LATIN_MAX', '0.5'))
+
+# (video_title, video_description, channel_id, channel_title, channel_description)
+LangItem = Tuple[str, str, str, str, str]
+
+
+def _is_latin(cp: int) -> bool:
+    # Basic Latin .. Latin Extended-B, IPA/diacritics, Latin Extended Additional
+    return cp < 0x0370 or 0x1E00 <= cp < 0x1F00
+
+
+def non_latin_share(text: str) -> float:
+    letters = other = 0
+    for ch in text:
+        if ch.isalpha():
+            letters += 1
+            if not _is_latin(ord(ch)):
+                other += 1
+    return other / letters if letters else 0.0
+
+
+class _LRU(OrderedDict):
+    def __init__(self, size: int):
+        super().__init__()
+        self.size = size
+
+    def get_item(self, key):
+        v = self.get(key)
+        if v is not None:
+            self.move_to_end(key)
+        return v
+
+    def put(self, key, value):
+        self[key] = value
+        self.move_to_end(key)
+        while len(self) > self.size:
+            self.popitem(last=False)
+
+
+class LanguageGate:
+    """English check for search candidates, built around langid's naive Bayes model.
+
+    langid's feature vector is a bag of byte n-gram counts, so the vector of
+    ``video text + channel text`` is (up to the n-grams spanning the join) the
+    sum of the two parts. The channel part is computed once per channel id and
+    reused for every video from that channel; final verdicts are memoized by a
+    hash of the truncated text. Text that is mostly non-Latin script is
+    rejected before the model is consulted at all.
+    """
+
+    def __init__(self, min_prob: float = LANG_MIN_PROB, prefix_chars: int = LANG_PREFIX_CHARS,
+                 memo_size: int = LANG_MEMO_SIZE, workers: int = LANG_WORKERS):
+        self.min_prob = min_prob
+        self.prefix_chars = prefix_chars
+        self._ident = None
+        self._en = None
+        self._load_lock = threading.Lock()
+        self._memo_lock = threading.Lock()
+        self._channel_fv = _LRU(memo_size)
+        self._verdicts = _LRU(memo_size)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='langid')
+
+    @property
+    def loaded(self) -> bool:
+        return self._ident is not None
+
+    def load(self):
+        """Unpack the langid model (takes a couple of seconds); safe to call repeatedly."""
+        if self._ident is not None:
+            return
+        with self._load_lock:
+            if self._ident is None:
+                from langid.langid import LanguageIdentifier, model
+                ident = LanguageIdentifier.from_modelstring(model, norm_probs=True)
+                self._en = list(ident.nb_classes).index('en')
+                self._ident = ident
+
+    def _join(self, *parts: str) -> str:
+        n = self.prefix_chars
+        return ' '.join(p[:n] for p in parts if p)
+
+    def _fv(self, text: str):
+        return self._ident.instance2fv(text)
+
+    def _channel_vector(self, channel_id: str, text: str):
+        key = channel_id or hashlib.sha1(text.encode('utf8')).hexdigest()
+        with self._memo_lock:
+            fv = self._channel_fv.get_item(key)
+        if fv is None:
+            fv = self._fv(text)
+            with self._memo_lock:
+                self._channel_fv.put(key, fv)
+        return fv
+
+    def check(self, item: LangItem) -> bool:
+        v_title, v_desc, channel_id, ch_title, ch_desc = item
+        video_text = self._join(v_title, v_desc)
+        channel_text = self._join(ch_title, ch_desc)
+        if not (video_text + channel_text).strip():
+            return True  # empty text: don't falsely block
+
+        key = hashlib.sha1(f'{channel_id}\0{video_text}\0{channel_text}'.encode('utf8')).digest()
+        with self._memo_lock:
+            verdict = self._verdicts.get_item(key)
+        if verdict is not None:
+            return verdict
+
+        if non_latin_share(video_text + channel_text) > LANG_NON_LATIN_MAX:
+            verdict = False
+        else:
+            self.load()
+            fv = self._fv(video_text) + self._channel_vector(channel_id, channel_text)
+            probs = self._ident.norm_probs(self._ident.nb_classprobs(fv))
+            verdict = bool(probs.argmax() == self._en and probs[self._en] >= self.min_prob)
+        with self._memo_lock:
+            self._verdicts.put(key, verdict)
+        return verdict
+
+    def check_batch(self, items: Sequence[LangItem]) -> List[bool]:
+        return [self.check(it) for it in items]
+
+    async def check_many(self, items: Sequence[LangItem]) -> List[bool]:
+        """Classify a batch on the langid pool so the event loop stays free."""
+        if not items:
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self.check_batch, list(items))
+
@@ -0,0 +1,132 @@
+"""Startup split into "up" and "warmed", and versioned schema migrations.
+
+Shared by leads-api and mastering-api: each app deploys from its own
+directory, so each carries a copy of this file; keep the copies identical.
+Each app lists its own migrations in migrations.py.
+"""
+import asyncio
+import datetime
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Sequence, Tuple
+
+from sqlalchemy import text
+
+from instrumentation import count_error
+
+WARMUP_RETRY_SECONDS = float(os.getenv('WARMUP_RETRY_SECONDS', '5'))
+# pg_advisory_xact_lock key, so instances starting together migrate one at a time
+MIGRATION_LOCK_ID = 72_310_455
+
+Migration = Tuple[int, str, Callable]  # (version, name, fn(sync connection))
+
+
+def migrate(cx, migrations: Sequence[Migration]) -> List[int]:
+    """Apply the migrations not yet recorded in ``schema_migrations``, in version order.
+
+    Runs on a sync connection inside the caller's transaction (from an async
+    engine, through ``run_sync``) and returns the versions it applied.
+    Migrations are append-only: a change to the schema is a new entry, never
+    an edit to one that may have run somewhere.
+    """
+    if cx.dialect.name == 'postgresql':
+        cx.exec_driver_sql(f'SELECT pg_advisory_xact_lock({MIGRATION_LOCK_ID})')
+    cx.exec_driver_sql('''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+      version INTEGER PRIMARY KEY,
+      name TEXT,
+      applied_at TIMESTAMP
+    );''')
+    done = set(cx.execute(text('SELECT version FROM schema_migrations')).scalars())
+    applied = []
+    for version, name, fn in sorted(migrations, key=lambda m: m[0]):
+        if version in done:
+            continue
+        fn(cx)
+        cx.execute(text('INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)'),
+                   dict(v=version, n=name, t=datetime.datetime.utcnow()))
+        applied.append(version)
+        print('migration_applied', version, name)
+    return applied
+
+
+class Warmup:
+    """Startup steps run in order in the background while the app already serves.
+
+    A failing step (the DB not reachable yet, say) is retried every
+    ``retry_seconds`` and the steps after it wait, so a cold start or a DB
+    blip never keeps the process from coming up. ``/healthz`` answers as
+    soon as requests are served, ``/readyz`` only once every step is done.
+    """
+
+    def __init__(self, retry_seconds: float = WARMUP_RETRY_SECONDS):
+        self.retry_seconds = retry_seconds
+        self.steps: List[Tuple[str, Callable[[], Awaitable]]] = []
+        self.state: Dict[str, dict] = {}
+        self.started = time.monotonic()
+        self._task = None
+
+    def step(self, name: str):
+        """Decorator adding an async function as the next step."""
+        def add(fn):
+            self.steps.append((name, fn))
+            self.state[name] = dict(status='pending')
+            return fn
+        return add
+
+    @property
+    def ready(self) -> bool:
+        return all(s['status'] == 'ok' for s in self.state.values())
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run(self):
+        for name, fn in self.steps:
+            attempts = 0
+            while True:
+                attempts += 1
+                t0 = time.perf_counter()
+                try:
+                    await fn()
+                    self.state[name] = dict(status='ok', seconds=round(time.perf_counter() - t0, 3))
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    count_error('warmup_error')
+                    print('warmup_error', name, repr(e))
+                    self.state[name] = dict(status='retrying', attempts=attempts, error=str(e) or repr(e))
+                    await asyncio.sleep(self.retry_seconds)
+        print('warmup_done', round(time.monotonic() - self.started, 3), {k: v.get('seconds') for k, v in self.state.items()})
+
+    def snapshot(self) -> dict:
+        return dict(status='ready' if self.ready else 'warming', uptime_s=round(time.monotonic() - self.started, 3),
+                    steps=self.state)
+
+
+def install(app, warmup: Warmup):
+    """Add ``GET /healthz`` (process up) and ``GET /readyz`` (warmed; 503 until then), and run ``warmup`` on startup."""
+    from fastapi.responses import JSONResponse
+
+    @app.on_event('startup')
+    async def _start_warmup():
+        warmup.start()
+
+    @app.on_event('shutdown')
+    async def _stop_warmup():
+        await warmup.stop()
+
+    @app.get('/healthz', include_in_schema=False)
+    async def healthz():
+        return dict(status='up', uptime_s=round(time.monotonic() - warmup.started, 3))
+
+    @app.get('/readyz', include_in_schema=False)
+    async def readyz():
+        return JSONResponse(warmup.snapshot(), status_code=200 if warmup.ready else 503)
@@ -0,0 +1,65 @@
+import asyncio
+import importlib.util
+import os
+from typing import Optional
+
+from instrumentation import API_CALLS, count_error
+
+# Optional deps; the SDK takes ~0.4 s to import (aiohttp, numpy), so it loads on
+# first use or from LLMClient.warm, not with this module
+OPENAI_AVAILABLE = importlib.util.find_spec('openai') is not None
+
+LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-3.5-turbo')
+LLM_TEMPERATURE = float(os.getenv('LLM_TEMPERATURE', '0.6'))
+LLM_MAX_TOKENS = int(os.getenv('LLM_MAX_TOKENS', '180'))
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '8'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '20'))
+
+
+class LLMClient:
+    """Async chat completions with a cap on concurrent calls and a hard timeout.
+
+    ``chat`` never raises: any failure (no key, timeout, API error) returns
+    None so callers can fall back to a template.
+    """
+
+    def __init__(self, api_key: Optional[str], model: str = LLM_MODEL, temperature: float = LLM_TEMPERATURE,
+                 max_tokens: int = LLM_MAX_TOKENS, concurrency: int = LLM_CONCURRENCY, timeout: float = LLM_TIMEOUT):
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+
+    @property
+    def available(self) -> bool:
+        return OPENAI_AVAILABLE and bool(self.api_key)
+
+    def warm(self):
+        """Import the SDK now (blocking) so the first chat doesn't pay for it."""
+        if self.available:
+            import openai  # noqa: F401
+
+    async def chat(self, system: str, prompt: str) -> Optional[str]:
+        if not self.available:
+            return None
+        async with self._sem:
+            try:
+                import openai
+                completion = await asyncio.wait_for(openai.ChatCompletion.acreate(
+                    api_key=self.api_key,
+                    model=self.model,
+                    messages=[{"role": "system", "content": system},
+                              {"role": "user", "content": prompt}],
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    request_timeout=self.timeout,
+                ), timeout=self.timeout)
+                API_CALLS.inc(api='openai', endpoint='chat', result='ok')
+                return completion.choices[0].message["content"].strip()
+            except Exception as e:
+                API_CALLS.inc(api='openai', endpoint='chat', result='error')
+                count_error('llm_error')
+                print('llm_error', repr(e))
+                return None
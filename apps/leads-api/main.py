@@ -1,109 +1,122 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
-import os, re, datetime, httpx, csv, io, time, random
+from typing import List, Optional, Tuple
+import os, re, datetime, httpx, csv, io, time, random, asyncio, uuid, heapq, importlib.util
 import sqlalchemy as sa
 from sqlalchemy import text
-
-import langid, unicodedata
-
-def is_english_text(*parts: str, min_prob: float = 0.85) -> bool:
-    text = ' '.join([p for p in parts if p])
-    if not text.strip():
-        return True  # empty text: don't falsely block
-    lang, prob = langid.classify(text)
-    return (lang == 'en') and (prob >= min_prob)
-
-# Optional deps
-SENDGRID_AVAILABLE = True
-try:
-    from sendgrid import SendGridAPIClient
-    from sendgrid.helpers.mail import Mail
-except Exception:
-    SENDGRID_AVAILABLE = False
-
-OPENAI_AVAILABLE = True
-try:
-    import openai
-except Exception:
-    OPENAI_AVAILABLE = False
-
-# --- artist-focused filters (add these) ---
-EXCLUDE_VIDEO = re.compile(
-    r"(?i)\b(type\s*beat|instrumental|mix|playlist|full\s*album|dj\s*mix|karaoke|cover|tribute|sped\s*up|slowed|8d|remaster|remastered|199\d|200\d)\b"
-)
-EXCLUDE_CHANNEL = re.compile(
-    r"(?i)\b(beats?|type\s*beats?|instrumentals?|producer|prod\.?|beatmaker|records|mixtapes?)\b"
-)
-INCLUDE_VIDEO = re.compile(
-    r"(?i)\b(official (audio|video)|visualizer|lyric video|single|performance)\b"
-)
-EXCLUDE_HANDLE = re.compile(r"(?i)(beats|prod|producer)")
-
-# NEW: fan/reupload/fancam filters
-EXCLUDE_REPOST = re.compile(
-    r"(?i)\b(fan[\s-]?cam|fan[\s-]?made|fan[\s-]?edit|edit|re[-\s]?upload|"
-    r"no\s+copyright|i\s+do\s+not\s+own\s+the\s+rights|credits?\s+to)\b"
-)
-
-# NEW: block huge/fandom keywords that skew results toward big acts
-EXCLUDE_BIG_ARTISTS = re.compile(
-    r"(?i)\b(blackpink|bts|stray\s*kids|twice|seventeen|nct|taylor\s*swift|"
-    r"billie\s*eilish|olivia\s*rodrigo|ariana\s*grande|drake|bad\s*bunny|doja\s*cat|eminem|rihanna|dua\s*lipa)\b"
-)
-
-# Skip auto-generated “- Topic” channels
-EXCLUDE_TOPIC_CH = re.compile(r"(?i)\b\-?\s*topic\b")
-
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from youtube import YouTubeClient, QuotaMeter, gather_ordered, record_daily, daily_usage
+from ytcache import MetadataCache
+from filters import CandidateFilter, REJECT_LANGUAGE
+from langgate import LanguageGate
+from persist import prospects as prospects_table, upsert_prospects, prospect_queries, read_page, encode_cursor, parse_ts, async_url, PUBLIC_COLUMNS
+import instrumentation
+import lifecycle
+from migrations import MIGRATIONS
+from instrumentation import REGISTRY, StageTimer, count_error, stage
+from searchstate import KnownIds, load_cursors, save_cursors, next_state, token_fits
+import outbox, campaigns, channels
+from llm import LLMClient
+from composecache import ComposeCache, cache_key, COMPOSE_CACHE_DB
+
+# Optional deps; sendgrid is imported on first send
+SENDGRID_AVAILABLE = importlib.util.find_spec('sendgrid') is not None
 
 DATABASE_URL = os.getenv('DATABASE_URL')
 ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS','*')
 YT_API_KEY = os.getenv('YT_API_KEY')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-if OPENAI_AVAILABLE and OPENAI_API_KEY:
-    openai.api_key = OPENAI_API_KEY
 
 EMAIL_FROM = os.getenv('EMAIL_FROM','beats@yourdomain.com')
 EMAIL_FROM_NAME = os.getenv('EMAIL_FROM_NAME','Kade')
 EMAIL_RATE_SECONDS = int(os.getenv('EMAIL_RATE_SECONDS','45'))
+EMAIL_BURST = int(os.getenv('EMAIL_BURST','1'))
 SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
+EMAIL_SENDER = os.getenv('EMAIL_SENDER','sendgrid')  # 'sendgrid' or 'stub' (records, never sends)
 
 app = FastAPI(title='Leads API', version='2.0.0')
 app.add_middleware(
     CORSMiddleware,
     allow_origins=['*'] if ALLOWED_ORIGINS=='*' else ALLOWED_ORIGINS.split(','),
-    allow_credentials=True, allow_methods=['*'], allow_headers=['*']
+    allow_credentials=True, allow_methods=['*'], allow_headers=['*'],
+    expose_headers=['X-Next-Cursor', 'X-Quota-Spent', 'X-Quota-Saved', 'X-Prospects-Inserted', 'X-Prospects-Updated',
+                    'X-Search-Known', 'X-Search-Resumed', 'Server-Timing'],
 )
-engine = sa.create_engine(DATABASE_URL, pool_pre_ping=True, future=True)
-
-with engine.begin() as cx:
-    cx.exec_driver_sql('''
-    CREATE TABLE IF NOT EXISTS prospects (
-      id TEXT PRIMARY KEY,
-      name TEXT, platform TEXT, handle TEXT,
-      email TEXT, instagram TEXT,
-      subs INTEGER, last_video_at TIMESTAMP, video_title TEXT,
-      video_url TEXT, channel_url TEXT, query_source TEXT,
-      created_at TIMESTAMP NOT NULL
-    );''')
-    cx.exec_driver_sql('''
-    CREATE TABLE IF NOT EXISTS outbox (
-      id TEXT PRIMARY KEY,
-      prospect_id TEXT,
-      channel TEXT,
-      to_addr TEXT,
-      body TEXT,
-      status TEXT,
-      error TEXT,
-      created_at TIMESTAMP NOT NULL,
-      sent_at TIMESTAMP
-    );''')
+instrumentation.install(app)
+# asyncpg / aiosqlite: queries are awaited on the event loop instead of blocking it
+engine = create_async_engine(async_url(DATABASE_URL), pool_pre_ping=True)
+
+async def migrate_db():
+    async with engine.begin() as cx:
+        await cx.run_sync(lifecycle.migrate, MIGRATIONS)
+
+meta_cache = MetadataCache(engine)
+llm = LLMClient(OPENAI_API_KEY)
+compose_cache = ComposeCache(engine if COMPOSE_CACHE_DB else None)
+lang_gate = LanguageGate()
+known_ids = KnownIds(engine)
+
+def _email_sender():
+    if EMAIL_SENDER == 'stub':
+        return outbox.StubSender()
+    if SENDGRID_AVAILABLE and SENDGRID_API_KEY:
+        return outbox.SendGridSender(SENDGRID_API_KEY, EMAIL_FROM, EMAIL_FROM_NAME)
+    return None
+
+outbox_worker = outbox.OutboxWorker(engine, _email_sender(), EMAIL_RATE_SECONDS, burst=EMAIL_BURST)
+
+async def _outbox_depth():
+    async with engine.connect() as cx:
+        return dict((await cx.execute(sa.select(outbox.outbox.c.status, sa.func.count()).group_by(outbox.outbox.c.status))).all())
+
+REGISTRY.gauge('outbox_depth', 'Outbox rows by status', ('status',)).set_function(_outbox_depth)
+REGISTRY.gauge('known_video_ids', 'Video ids held in memory to skip known videos').set_function(lambda: len(known_ids))
+
+# runs after startup, in order, while the app already answers /healthz; /readyz once done
+warmup = lifecycle.Warmup()
+
+@warmup.step('migrations')
+async def _migrate():
+    await migrate_db()
+
+@warmup.step('outbox')
+async def _start_outbox():
+    outbox_worker.start()
+
+@warmup.step('known_ids')
+async def _load_known_ids():
+    await known_ids.load()
+    print('known_ids_loaded', len(known_ids))
+
+@warmup.step('langid')
+async def _load_langid():
+    # unpack the langid model up front so the first /search doesn't pay for it
+    await asyncio.get_running_loop().run_in_executor(None, lang_gate.load)
+
+@warmup.step('llm')
+async def _load_llm():
+    await asyncio.to_thread(llm.warm)
+
+lifecycle.install(app, warmup)
+
+@app.on_event('shutdown')
+async def _stop_outbox():
+    await outbox_worker.stop()
+    if outbox_worker.sender is not None:
+        await outbox_worker.sender.aclose()
+
+@app.on_event('shutdown')
+async def _close_db():
+    await engine.dispose()
 
 
 EMAIL_RE = re.compile(r"[a-zA-Z0-9._%+\-]+@[a-zA-Z0-9.\-]+\.[a-zA-Z]{2,}")
 IG_RE = re.compile(r"https?://(?:www\.)?instagram\.com/[A-Za-z0-9_.]+")
 
+DEFAULT_REGION_CODES = ['GB','US','CA','AU','IE','NZ']
+
 class SearchRequest(BaseModel):
     queries: List[str]
     days_back: int = 90
@@ -113,6 +126,10 @@ class SearchRequest(BaseModel):
     strict_artist_filter: bool = True
     min_video_views: int = 300
     exclude_keywords: List[str] = []  # runtime blocklist
+    region_codes: List[str] = DEFAULT_REGION_CODES
+    mode: str = 'concurrent'  # 'concurrent' fan-out or 'sequential' (one request at a time)
+    incremental: bool = True  # resume from stored cursors; False rescans the whole window
+    top_k: Optional[int] = None  # return only the best N channels (all are still stored)
 
 
 class Prospect(BaseModel):
@@ -125,6 +142,7 @@ class Prospect(BaseModel):
     instagram: Optional[str]
     last_video_at: Optional[str]
     query_source: str
+    score: Optional[float] = None  # channel score, where the row comes from channels
 
 class ComposeRequest(BaseModel):
     name: str
@@ -148,6 +166,28 @@ class OutboxItem(BaseModel):
     id: str
     status: str
 
+class CampaignRequest(BaseModel):
+    # either explicit prospect ids, or a filter over stored prospects
+    prospect_ids: Optional[List[str]] = None
+    query_source: Optional[str] = None
+    min_subs: Optional[int] = None
+    max_subs: Optional[int] = None
+    limit: int = 500
+    subject: str = "Beats for {name} – quick pack"
+    lane: Optional[str] = None
+    offer: Optional[str] = None
+    include_demo_master: bool = True
+
+class CampaignStatus(BaseModel):
+    id: str
+    status: str
+    total: int
+    composed: int
+    queued: int
+    skipped: int
+    failed: int
+    error: Optional[str] = None
+
 def _compose_template(req: ComposeRequest)->str:
     headline = f"Yo {req.name}," if req.channel=='email' else f"Yo {req.name.split(' ')[0]},"
     ref = f" heard “{req.video_title}”" if req.video_title else ""
@@ -162,276 +202,446 @@ def _compose_template(req: ComposeRequest)->str:
 — Kade
 """
 
-@app.post('/compose', response_model=ComposeResponse)
-async def compose(req: ComposeRequest):
-    # LLM if available, else template
-    if OPENAI_AVAILABLE and OPENAI_API_KEY:
-        try:
-            prompt = f"""
+COMPOSE_SYSTEM = "You write concise music outreach messages that never overpromise."
+
+def _compose_prompt(req: ComposeRequest) -> str:
+    return f"""
 Write a 70–100 word outgoing message from a producer (Kade) to an artist named {req.name}. Tone: concise, friendly, zero fluff, no emojis. Lane: {req.lane}. Reference title: {req.video_title}. Offer: {req.offer}. {"Include a 'Demo Master' note." if req.include_demo_master else ""} Channel: {req.channel}. Do not add links. End with a clear yes/no question.
 """
-            completion = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role":"system","content":"You write concise music outreach messages that never overpromise."},
-                          {"role":"user","content": prompt}],
-                temperature=0.6,
-                max_tokens=180
-            )
-            msg = completion.choices[0].message["content"].strip()
-            return ComposeResponse(message=msg)
-        except Exception as e:
-            pass
-    return ComposeResponse(message=_compose_template(req))
+
+# channel_url never reaches the prompt or the template, so it isn't part of the cache key
+COMPOSE_KEY_FIELDS = {'name', 'video_title', 'lane', 'offer', 'include_demo_master', 'channel'}
+
+async def _compose_message(req: ComposeRequest) -> str:
+    async def compute():
+        # LLM if available, else template (not cached)
+        with stage('llm'):
+            msg = await llm.chat(COMPOSE_SYSTEM, _compose_prompt(req))
+        return (msg, True) if msg else (_compose_template(req), False)
+    if not llm.available:
+        return _compose_template(req)
+    key = cache_key(req.model_dump(include=COMPOSE_KEY_FIELDS), llm.model, llm.temperature)
+    return await compose_cache.get_or_compute(key, compute)
+
+@app.post('/compose', response_model=ComposeResponse)
+async def compose(req: ComposeRequest):
+    with StageTimer('compose').active():
+        return ComposeResponse(message=await _compose_message(req))
+
+@app.get('/compose/stats')
+async def compose_stats():
+    return compose_cache.snapshot()
+
+def _prospect(r) -> Prospect:
+    d = dict(r._mapping)
+    if isinstance(d.get('last_video_at'), datetime.datetime):
+        d['last_video_at'] = d['last_video_at'].isoformat() + 'Z'
+    return Prospect(score=d.get('score'), **{k: d[k] for k in PUBLIC_COLUMNS})
 
 @app.get('/prospects', response_model=List[Prospect])
-async def list_prospects(limit: int = 200):
-    with engine.begin() as cx:
-        rows = cx.execute(text('SELECT name, video_title, video_url, channel_url, subs, email, instagram, last_video_at, query_source FROM prospects ORDER BY last_video_at DESC LIMIT :lim'), dict(lim=limit)).all()
-    return [Prospect(**dict(r)) for r in rows]
+async def list_prospects(response: Response, limit: int = 200, cursor: Optional[str] = None,
+                         query_source: Optional[str] = None, min_subs: Optional[int] = None,
+                         max_subs: Optional[int] = None, has_email: Optional[bool] = None,
+                         order: str = 'recent'):
+    # order=recent: stored videos, newest first; order=score: one row per channel, best first
+    if order not in ('recent', 'score'):
+        raise HTTPException(400, "order must be 'recent' or 'score'")
+    limit = max(1, min(limit, 1000))
+    filters = dict(query_source=query_source, min_subs=min_subs, max_subs=max_subs, has_email=has_email)
+    try:
+        queries = [channels.channel_query(cursor, **filters)] if order == 'score' else prospect_queries(cursor, **filters)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    async with engine.connect() as cx:
+        rows = await cx.run_sync(read_page, queries, limit + 1)
+    # one extra row tells us whether there is a next page
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers['X-Next-Cursor'] = (encode_cursor(last.score, last.channel_id) if order == 'score'
+                                             else encode_cursor(last.last_video_at, last.id))
+    return [_prospect(r) for r in rows]
 
 @app.post('/send-email', response_model=OutboxItem)
 async def send_email(req: SendEmailRequest):
-    if not SENDGRID_AVAILABLE or not SENDGRID_API_KEY:
+    if outbox_worker.sender is None:
         raise HTTPException(400, 'Email sending not configured (SendGrid)')
     to_email = req.to_email.strip()
     if not to_email or '@' not in to_email:
         raise HTTPException(400, 'Invalid email')
-    # naive rate limit: check last sent
-    now = datetime.datetime.utcnow()
-    with engine.begin() as cx:
-        last = cx.execute(text('SELECT sent_at FROM outbox WHERE status=:st ORDER BY sent_at DESC LIMIT 1'), dict(st='sent')).first()
-    if last and last[0]:
-        delta = (now - last[0]).total_seconds()
-        if delta < EMAIL_RATE_SECONDS:
-            import time, random
-            time.sleep(EMAIL_RATE_SECONDS - delta + random.uniform(0,3))
-    # send
-    sg = SendGridAPIClient(SENDGRID_API_KEY)
-    mail = Mail(
-        from_email=(EMAIL_FROM, EMAIL_FROM_NAME),
-        to_emails=[to_email],
-        subject=req.subject.strip(),
-        plain_text_content=req.body.strip(),
-    )
-    oid = f"email_{int(time.time()*1000)}"
-    with engine.begin() as cx:
-        cx.execute(text('INSERT INTO outbox (id, prospect_id, channel, to_addr, body, status, created_at) VALUES (:id,:pid,:ch,:to,:body,:st,:ts)'),
-                   dict(id=oid, pid=req.prospect_id, ch='email', to=to_email, body=req.body, st='sending', ts=now))
-    try:
-        resp = sg.send(mail)
-        ok = 200 <= resp.status_code < 300
-        with engine.begin() as cx:
-          cx.execute(text('UPDATE outbox SET status=:st, sent_at=:ts, error=:er WHERE id=:id'),
-                     dict(st='sent' if ok else 'error', ts=datetime.datetime.utcnow(), er=None if ok else f"status {resp.status_code}", id=oid))
-        if not ok:
-            raise HTTPException(500, f"SendGrid status {resp.status_code}")
-    except Exception as e:
-        with engine.begin() as cx:
-            cx.execute(text('UPDATE outbox SET status=:st, sent_at=:ts, error=:er WHERE id=:id'),
-                       dict(st='error', ts=datetime.datetime.utcnow(), er=str(e), id=oid))
-        raise HTTPException(500, f"Email send failed: {e}")
-    return OutboxItem(id=oid, status='sent')
+    # queued here, sent by the outbox worker at EMAIL_RATE_SECONDS pacing
+    oid = f"email_{int(time.time()*1000)}_{uuid.uuid4().hex[:8]}"
+    with StageTimer('send_email').active(), stage('enqueue'):
+        async with engine.begin() as cx:
+            await cx.run_sync(outbox.enqueue, [dict(id=oid, prospect_id=req.prospect_id, to_addr=to_email,
+                                                    subject=req.subject.strip(), body=req.body)])
+    outbox_worker.wake()
+    return OutboxItem(id=oid, status='queued')
+
+@app.get('/outbox/stats')
+async def outbox_stats():
+    return await outbox_worker.stats()
+
+@app.get('/outbox/{oid}', response_model=OutboxItem)
+async def outbox_item(oid: str):
+    async with engine.connect() as cx:
+        row = (await cx.execute(text('SELECT id, status FROM outbox WHERE id=:id'), dict(id=oid))).first()
+    if not row:
+        raise HTTPException(404, 'not found')
+    return OutboxItem(id=row[0], status=row[1])
+
+CAMPAIGN_MAX_PROSPECTS = int(os.getenv('CAMPAIGN_MAX_PROSPECTS','2000'))
+
+@app.post('/campaigns', response_model=CampaignStatus)
+async def create_campaign(req: CampaignRequest):
+    if outbox_worker.sender is None:
+        raise HTTPException(400, 'Email sending not configured (SendGrid)')
+    c = prospects_table.c
+    q = sa.select(c.id, c.name, c.email, c.video_title, c.channel_url)
+    # an explicit list, even an empty one, never falls back to the filter
+    if req.prospect_ids is not None:
+        if not req.prospect_ids:
+            raise HTTPException(400, 'prospect_ids is empty')
+        ids = list(dict.fromkeys(req.prospect_ids))[:CAMPAIGN_MAX_PROSPECTS]
+        q = q.where(c.id.in_(ids))
+    else:
+        ids = None
+        if req.query_source is not None:
+            q = q.where(c.query_source == req.query_source)
+        if req.min_subs is not None:
+            q = q.where(c.subs >= req.min_subs)
+        if req.max_subs is not None:
+            q = q.where(c.subs <= req.max_subs)
+        q = (q.where(c.email.is_not(None), c.email != '')
+              .order_by(c.last_video_at.desc().nulls_last(), c.id.desc())
+              .limit(max(1, min(req.limit, CAMPAIGN_MAX_PROSPECTS))))
+    async with engine.connect() as cx:
+        rows = [dict(r) for r in (await cx.execute(q)).mappings()]
+    targets = [r for r in rows if r['email'] and '@' in r['email']]
+    skipped = (len(ids) if ids is not None else len(rows)) - len(targets)
+
+    cid = f"camp_{uuid.uuid4().hex[:12]}"
+    state = await campaigns.create(engine, cid, len(targets), skipped, req.model_dump())
+    overrides = req.model_dump(include={'lane', 'offer', 'include_demo_master'}, exclude_none=True)
+
+    async def compose_one(p: dict) -> dict:
+        creq = ComposeRequest(name=p['name'] or '', video_title=p['video_title'], channel_url=p['channel_url'],
+                              channel='email', **overrides)
+        return dict(id=f"email_{int(time.time()*1000)}_{uuid.uuid4().hex[:8]}", prospect_id=p['id'],
+                    to_addr=p['email'].strip(), subject=req.subject.replace('{name}', p['name'] or '').strip(),
+                    body=await _compose_message(creq))
+
+    campaigns.start(engine, cid, targets, compose_one, on_queued=outbox_worker.wake)
+    return CampaignStatus(id=cid, **state)
+
+@app.get('/campaigns/{cid}', response_model=CampaignStatus)
+async def campaign_status(cid: str):
+    st = await campaigns.progress(engine, cid)
+    if not st:
+        raise HTTPException(404, 'campaign not found')
+    return CampaignStatus(**st)
 
 from fastapi import HTTPException
 import datetime, httpx, re
 
+def _candidate_record(f: dict, q: str, vid: str, v: dict) -> dict:
+    snip = v['snippet']
+    v_desc, ch_desc = f['v_desc'], f['ch_desc']
+
+    video_url   = f"https://www.youtube.com/watch?v={vid}"
+    channel_url = f"https://www.youtube.com/channel/{snip['channelId']}"
+
+    return dict(
+        id=f"yt_{vid}", name=f['ch_title'], platform='youtube', handle=f['handle'],
+        email=(EMAIL_RE.findall(v_desc) or EMAIL_RE.findall(ch_desc) or [None])[0],
+        instagram=(IG_RE.findall(v_desc) or IG_RE.findall(ch_desc) or [None])[0],
+        subs=f['subs'], last_video_at=snip['publishedAt'], video_title=f['v_title'],
+        video_url=video_url, channel_url=channel_url, query_source=q,
+        created_at=datetime.datetime.utcnow(),
+        _score=(3 if f['looks_official'] else 0) + (2 if f['looks_artist_bio'] else 0) + (1 if f['views'] >= 2000 else 0),
+        # signals for the channel's stored score (channels.py)
+        _channel_id=snip['channelId'], _official=f['looks_official'], _artist_bio=f['looks_artist_bio'],
+        _views_per_day=channels.views_per_day(f['views'], snip['publishedAt']),
+    )
+
+async def _enrich_page(yt: YouTubeClient, flt: CandidateFilter, q: str, video_ids: List[str]) -> List[dict]:
+    # need statistics for viewCount; served from the metadata cache where fresh
+    vitems = await meta_cache.lookup(yt, 'videos', video_ids)
+
+    channel_ids = list({ vitems[v]['snippet']['channelId'] for v in vitems })
+    citems = {}
+    if channel_ids:
+        citems = await meta_cache.lookup(yt, 'channels', channel_ids)
+
+    passed = []
+    with stage('filter'):
+        for vid in video_ids:
+            v = vitems.get(vid)
+            if not v:
+                continue
+            ch = citems.get(v['snippet']['channelId'])
+            if not ch:
+                continue
+            reason, f = flt.evaluate(v, ch)
+            if not reason:
+                passed.append((vid, v, ch, f))
+
+    # language check last and batched, off the event loop
+    with stage('lang'):
+        english = await lang_gate.check_many([(f['v_title'], f['v_desc'], ch['id'], f['ch_title'], f['ch_desc'])
+                                              for _, _, ch, f in passed])
+    recs = []
+    for (vid, v, ch, f), ok in zip(passed, english):
+        if not ok:
+            flt.count(REJECT_LANGUAGE)
+            continue
+        recs.append(_candidate_record(f, q, vid, v))
+    return recs
+
+def _rfc3339(ts: datetime.datetime) -> str:
+    return ts.isoformat('T') + 'Z'
+
+async def _walk_pages(yt: YouTubeClient, flt: CandidateFilter, q: str, params: dict, budget: int,
+                      stop_at_known: bool, prefetch: bool = True) -> Tuple[List[dict], dict]:
+    """Page through one search, enriching videos not already stored as prospects.
+
+    Returns the records and a summary: items fetched, videos skipped as
+    known, the newest ``publishedAt`` seen, and the page token to continue
+    from if the budget ran out first. With ``stop_at_known`` paging ends at
+    the first page holding a known video (results are newest first).
+    """
+    out: List[dict] = []
+    walk = dict(fetched=0, known=0, newest=None, token=None)
+    page = asyncio.ensure_future(yt.get('search', **params))
+    try:
+        while page is not None:
+            data = await page
+            page = None
+            items = data.get('items', [])
+            if not items:
+                break
+            walk['fetched'] += len(items)
+            for it in items:
+                published = parse_ts((it.get('snippet') or {}).get('publishedAt'))
+                if published and (walk['newest'] is None or published > walk['newest']):
+                    walk['newest'] = published
+            video_ids = [it['id'].get('videoId') for it in items if it.get('id') and it['id'].get('videoId')]
+            fresh = [v for v in video_ids if v not in known_ids]
+            walk['known'] += len(video_ids) - len(fresh)
+            page_token = data.get('nextPageToken')
+            walk['token'] = None
+            if stop_at_known and len(fresh) < len(video_ids):
+                page_token = None
+            elif page_token and walk['fetched'] >= budget:
+                walk['token'] = page_token  # more results left: resume here next time
+                page_token = None
+            next_params = dict(params, pageToken=page_token) if page_token else None
+            if next_params and prefetch:
+                # pull the next page while this one is being enriched
+                page = asyncio.ensure_future(yt.get('search', **next_params))
+
+            if fresh:
+                out.extend(await _enrich_page(yt, flt, q, fresh))
+
+            if next_params and not prefetch:
+                page = asyncio.ensure_future(yt.get('search', **next_params))
+    finally:
+        if page is not None:
+            page.cancel()
+    return out, walk
+
+async def _search_region(yt: YouTubeClient, req: SearchRequest, flt: CandidateFilter, q: str, rc: str,
+                         window_start: datetime.datetime, cursor: Optional[dict] = None,
+                         prefetch: bool = True) -> Tuple[List[dict], dict]:
+    """Search one (query, region); returns its records and the cursor to store.
+
+    With a stored cursor only videos newer than the last one seen are
+    searched, stopping at known videos; then, if results were left unread
+    last time and budget remains, the stored page token picks up where
+    that walk stopped.
+    """
+    out: List[dict] = []
+    stats = dict(fetched=0, known=0, resumed=False)
+    if req.max_results_per_query <= 0:
+        return out, dict(state=cursor, **stats)
+    # tighter search to avoid long mixes
+    params = dict(
+        part='id,snippet',
+        q=q, type='video', order='date', maxResults=50,
+        videoDuration='medium',
+        relevanceLanguage='en',    # <— bias English
+        regionCode=rc)
+
+    newest_seen = (cursor or {}).get('newest_published_at')
+    after = window_start
+    if newest_seen and newest_seen >= window_start:
+        after = newest_seen + datetime.timedelta(seconds=1)  # publishedAfter is inclusive
+    recs, fresh = await _walk_pages(yt, flt, q, dict(params, publishedAfter=_rfc3339(after)),
+                                    req.max_results_per_query, stop_at_known=cursor is not None, prefetch=prefetch)
+    out.extend(recs)
+    stats['fetched'], stats['known'] = fresh['fetched'], fresh['known']
+
+    resume_token = None
+    resume_after = (cursor or {}).get('page_after')
+    budget = req.max_results_per_query - fresh['fetched']
+    if cursor and cursor.get('page_token') and not fresh['token'] and budget > 0 and token_fits(cursor, window_start):
+        stats['resumed'] = True
+        try:
+            recs, rest = await _walk_pages(yt, flt, q, dict(params, publishedAfter=_rfc3339(resume_after),
+                                                            pageToken=cursor['page_token']),
+                                           budget, stop_at_known=False, prefetch=prefetch)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 400:
+                raise
+            recs, rest = [], dict(fetched=0, known=0, token=None)  # token expired; forget it
+        out.extend(recs)
+        resume_token = rest['token']
+        stats['fetched'] += rest['fetched']
+        stats['known'] += rest['known']
+
+    state = next_state(cursor, fresh['newest'], fresh['token'], after, stats['resumed'], resume_token)
+    return out, dict(state=state, **stats)
+
 @app.post('/search', response_model=List[Prospect])
-async def search(req: SearchRequest):
+async def search(req: SearchRequest, response: Response):
+    # per-stage wall times go out as Server-Timing (see bench/bench_pipeline.py)
+    timer = StageTimer('search')
+    with timer.active():
+        try:
+            return await _search(req, response)
+        finally:
+            response.headers['Server-Timing'] = timer.header()
+            print('search_stages', timer.as_dict())
+
+async def _search(req: SearchRequest, response: Response):
     if not YT_API_KEY:
         # This should be a clean client error, not a 500
         raise HTTPException(400, 'YT_API_KEY not set')
 
-    published_after = (datetime.datetime.utcnow() - datetime.timedelta(days=req.days_back)).isoformat('T') + 'Z'
+    window_start = datetime.datetime.utcnow() - datetime.timedelta(days=req.days_back)
     out: List[dict] = []
+    region_codes = req.region_codes or DEFAULT_REGION_CODES
+    pairs = [(q, rc) for q in req.queries if q.strip() for rc in region_codes]
+    meter = QuotaMeter()
+    flt = CandidateFilter.from_request(req)
 
     try:
-        async with httpx.AsyncClient(timeout=20) as http:
-            for q in req.queries:
-                if not q.strip():
-                    continue
-                page_token = None
-                fetched = 0
-                while fetched < req.max_results_per_query:
-                    region_codes = getattr(req, 'region_codes', None) or ['GB','US','CA','AU','IE','NZ']
-                    for rc in region_codes:
-                        page_token = None
-                        fetched = 0
-
-        # ... use params with this rc ...
-
-                    # tighter search to avoid long mixes
-                    params = dict(
-                    part='id,snippet',
-                    q=q, type='video', order='date', maxResults=50,
-                    publishedAfter=published_after, key=YT_API_KEY,
-                    videoDuration='medium',
-                    relevanceLanguage='en',    # <— bias English
-                    regionCode=rc)
-
-                    if page_token:
-                        params['pageToken'] = page_token
-
-                    r = await http.get('https://www.googleapis.com/youtube/v3/search', params=params)
-                    r.raise_for_status()
-                    data = r.json()
-                    items = data.get('items', [])
-                    if not items:
-                        break
-
-                    video_ids = [it['id'].get('videoId') for it in items if it.get('id') and it['id'].get('videoId')]
-                    if not video_ids:
-                        fetched += len(items)
-                        page_token = data.get('nextPageToken')
-                        if not page_token:
-                            break
-                        continue
-
-                    # need statistics for viewCount
-                    vr = await http.get('https://www.googleapis.com/youtube/v3/videos',
-                        params=dict(part='snippet,statistics', id=','.join(video_ids), key=YT_API_KEY))
-                    vr.raise_for_status()
-                    vitems = {it['id']: it for it in vr.json().get('items', [])}
-
-                    channel_ids = list({ vitems[v]['snippet']['channelId'] for v in vitems })
-                    citems = {}
-                    if channel_ids:
-                        cr = await http.get('https://www.googleapis.com/youtube/v3/channels',
-                            params=dict(part='snippet,statistics,brandingSettings', id=','.join(channel_ids), key=YT_API_KEY))
-                        cr.raise_for_status()
-                        citems = {it['id']: it for it in cr.json().get('items', [])}
-
-                    for vid in video_ids:
-                        v = vitems.get(vid)
-                        if not v: 
-                            continue
-                        snip = v['snippet']
-                        ch = citems.get(snip['channelId'])
-                        if not ch:
-                            continue
-
-                        # -------- filters (tight) --------
-                        v_title = snip['title']
-                        v_desc  = snip.get('description','') or ''
-                        ch_title = ch['snippet']['title']
-                        ch_desc  = (ch['snippet'].get('description','') + '\n' +
-                                    ch.get('brandingSettings',{}).get('channel',{}).get('description',''))
-                        handle   = ch['snippet'].get('customUrl') or ''
-                        subs     = int(ch.get('statistics',{}).get('subscriberCount', 0))
-                        views    = int(v.get('statistics',{}).get('viewCount', 0))
-                        live     = snip.get('liveBroadcastContent','none')
-                        cat      = snip.get('categoryId')
-
-                        # bounds
-                        if subs < req.min_subs or subs > req.max_subs:
-                            continue
-                        if not is_english_text(v_title, v_desc, ch_title, ch_desc):
-                            continue
-
-                        if live and live.lower() != 'none':
-                            continue
-                        if cat and str(cat) != '10':  # 10 = Music
-                            continue
-
-                        # producer / repost / giant-artist filters
-                        if EXCLUDE_CHANNEL.search(ch_title) or EXCLUDE_CHANNEL.search(ch_desc):
-                            continue
-                        if EXCLUDE_HANDLE.search(handle):
-                            continue
-                        if EXCLUDE_VIDEO.search(v_title):
-                            continue
-                        if EXCLUDE_REPOST.search(v_title) or EXCLUDE_REPOST.search(v_desc) or EXCLUDE_REPOST.search(ch_desc):
-                            continue
-                        if EXCLUDE_BIG_ARTISTS.search(v_title) or EXCLUDE_BIG_ARTISTS.search(ch_title):
-                            continue
-                        if EXCLUDE_TOPIC_CH.search(ch_title):
-                            continue
-                        # runtime custom blocklist
-                        if getattr(req, 'exclude_keywords', None):
-                            joined = f"{v_title}\n{v_desc}\n{ch_title}\n{handle}"
-                            if any(kw.lower() in joined.lower() for kw in req.exclude_keywords):
-                                continue
-
-                        looks_official = bool(INCLUDE_VIDEO.search(v_title))
-                        looks_artist_bio = bool(re.search(r"(?i)\b(artist|singer|songwriter|musician|official)\b", ch_desc))
-                        if getattr(req, 'strict_artist_filter', True) and not (looks_official or looks_artist_bio):
-                            continue
-                        if views < getattr(req, 'min_video_views', 300):
-                            continue
-
-                        video_url   = f"https://www.youtube.com/watch?v={vid}"
-                        channel_url = f"https://www.youtube.com/channel/{snip['channelId']}"
-
-                        rec = dict(
-                            id=f"yt_{vid}", name=ch_title, platform='youtube', handle=handle,
-                            email=(EMAIL_RE.findall(v_desc) or EMAIL_RE.findall(ch_desc) or [None])[0],
-                            instagram=(IG_RE.findall(v_desc) or IG_RE.findall(ch_desc) or [None])[0],
-                            subs=subs, last_video_at=snip['publishedAt'], video_title=v_title,
-                            video_url=video_url, channel_url=channel_url, query_source=q,
-                            created_at=datetime.datetime.utcnow(),
-                            _score=(3 if looks_official else 0) + (2 if looks_artist_bio else 0) + (1 if views >= 2000 else 0)
-                        )
-                        out.append(rec)
-
-                    fetched += len(items)
-                    page_token = data.get('nextPageToken')
-                    if not page_token:
-                        break
-
-        # ----- dedupe + sort -----
-        seen, deduped = set(), []
-        for r in sorted(out, key=lambda x: (x.get('_score', 0), x['last_video_at']), reverse=True):
-            k = r['channel_url']
-            if k in seen:
-                continue
-            seen.add(k)
-            r.pop('_score', None)
-            deduped.append(r)
+        cursors = {}
+        if req.incremental:
+            try:
+                with stage('cursors'):
+                    async with engine.connect() as cx:
+                        cursors = await cx.run_sync(load_cursors, pairs, flt.key)
+            except Exception as db_err:
+                count_error('search_cursor_load_error')
+                print('search_cursor_load_error', repr(db_err))
+        if req.mode == 'sequential':
+            # one request at a time, kept for comparing against the fan-out path
+            async with YouTubeClient(YT_API_KEY, max_in_flight=1, meter=meter) as yt:
+                parts = [await _search_region(yt, req, flt, q, rc, window_start, cursors.get((q, rc)), prefetch=False)
+                         for q, rc in pairs]
+        else:
+            async with YouTubeClient(YT_API_KEY, meter=meter) as yt:
+                # results are concatenated in (query, region) order so the
+                # stable sort below ranks ties exactly like the sequential path
+                parts = await gather_ordered(_search_region(yt, req, flt, q, rc, window_start, cursors.get((q, rc)))
+                                             for q, rc in pairs)
+        for recs, _ in parts:
+            out.extend(recs)
+        walked = {pair: info for pair, (_, info) in zip(pairs, parts)}
+        response.headers['X-Search-Known'] = str(sum(w['known'] for w in walked.values()))
+        response.headers['X-Search-Resumed'] = str(sum(w['resumed'] for w in walked.values()))
+        print('search_incremental', dict(cursors=len(cursors), known=response.headers['X-Search-Known'],
+                                         resumed=response.headers['X-Search-Resumed'],
+                                         fetched=sum(w['fetched'] for w in walked.values())))
+        # ----- one entry per channel, best first -----
+        with stage('dedupe'):
+            by_channel = channels.aggregate(out)
+            # a heap picks the top k without sorting every channel; ties go to
+            # the channel whose video arrived first, as in the sequential path
+            top = heapq.nlargest(req.top_k or len(by_channel), by_channel.values(),
+                                 key=lambda a: (a['score'], -a['first']))
+            deduped = [a['best'] for a in by_channel.values()]
 
         # store (best-effort; don't fail the response if DB write has an issue)
         try:
-            with engine.begin() as cx:
-                for r in deduped:
-                    cx.execute(text('DELETE FROM prospects WHERE id=:id'), {'id': r['id']})
-                    cols = ','.join(r.keys())
-                    vals = ','.join([f":{k}" for k in r.keys()])
-                    cx.execute(text(f'INSERT INTO prospects ({cols}) VALUES ({vals})'), r)
+            with stage('persist'):
+                async with engine.begin() as cx:
+                    inserted, updated = await cx.run_sync(upsert_prospects, deduped)
+                    await cx.run_sync(channels.upsert_channels, by_channel.values())
+                    # cursors move only together with the prospects they account for
+                    await cx.run_sync(save_cursors, {pair: w['state'] for pair, w in walked.items() if w['state']},
+                                      flt.key)
+            known_ids.add(r['id'] for r in deduped)
+            response.headers['X-Prospects-Inserted'] = str(inserted)
+            response.headers['X-Prospects-Updated'] = str(updated)
+            print('prospect_store', dict(inserted=inserted, updated=updated))
         except Exception as db_err:
+            count_error('prospect_store_error')
             print('prospect_store_error', repr(db_err))
 
         # return a LIST (even if empty)
         return [
             Prospect(
-                name=r['name'],
-                video_title=r['video_title'],
-                video_url=r['video_url'],
-                channel_url=r['channel_url'],
-                subs=r['subs'],
-                email=r.get('email'),
-                instagram=r.get('instagram'),
-                last_video_at=r.get('last_video_at'),
-                query_source=r['query_source'],
+                name=a['name'],
+                video_title=a['video_title'],
+                video_url=a['video_url'],
+                channel_url=a['channel_url'],
+                subs=a['subs'],
+                email=a.get('email'),
+                instagram=a.get('instagram'),
+                last_video_at=a['best'].get('last_video_at'),
+                query_source=a['query_source'],
+                score=a['score'],
             )
-            for r in deduped
+            for a in top
         ]
     except httpx.HTTPStatusError as e:
         # Bad API key / quota / etc. Return empty list rather than 500 so UI stays usable.
+        count_error('youtube_http_error')
         print('youtube_http_error', e.response.status_code, e.request.url)
         return []
     except Exception as e:
         # Any other unexpected issue: log and return empty list
+        count_error('search_unexpected_error')
         print('search_unexpected_error', repr(e))
         return []
+    finally:
+        record_daily(meter)
+        response.headers['X-Quota-Spent'] = str(meter.spent)
+        response.headers['X-Quota-Saved'] = str(meter.saved)
+        print('search_quota', meter.as_dict())
+        print('search_rejections', dict(flt.rejections))
 
+@app.get('/quota')
+async def quota():
+    return daily_usage()
 
-@app.get('/export.csv')
-async def export_csv():
-    with engine.begin() as cx:
-        rows = cx.execute(text('SELECT name, video_title, video_url, channel_url, subs, email, instagram, last_video_at, query_source FROM prospects ORDER BY last_video_at DESC')).all()
+
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '500'))
+
+def _csv_chunk(rows, header: bool = False) -> str:
     buf = io.StringIO()
     w = csv.writer(buf)
-    w.writerow(['name','video_title','video_url','channel_url','subs','email','instagram','last_video_at','query_source'])
-    for r in rows:
-        w.writerow(list(r))
+    if header:
+        w.writerow(PUBLIC_COLUMNS)
+    w.writerows(r[:len(PUBLIC_COLUMNS)] for r in rows)
+    return buf.getvalue()
+
+async def _export_rows():
+    # server-side cursor so memory stays flat; each partition is formatted
+    # on a thread so a big export doesn't hold up the loop between chunks
+    header = True
+    async with engine.connect() as cx:
+        for q in prospect_queries():
+            result = await cx.stream(q.execution_options(yield_per=EXPORT_CHUNK_ROWS))
+            async for part in result.partitions():
+                yield await asyncio.to_thread(_csv_chunk, part, header)
+                header = False
+    if header:
+        yield _csv_chunk([], header=True)
+
+@app.get('/export.csv')
+async def export_csv():
     from fastapi.responses import StreamingResponse
-    buf.seek(0)
-    return StreamingResponse(iter([buf.getvalue()]), media_type='text/csv', headers={'Content-Disposition':'attachment; filename=leads.csv'})
+    return StreamingResponse(_export_rows(), media_type='text/csv', headers={'Content-Disposition':'attachment; filename=leads.csv'})
@@ -0,0 +1,217 @@
+"""Schema versions of the leads DB, applied by lifecycle.migrate.
+
+Runs as the first warmup step on startup, or by hand:
+
+    DATABASE_URL=... python migrations.py
+"""
+import asyncio
+import datetime
+import math
+import os
+import re
+
+import sqlalchemy as sa
+
+from outbox import OUTBOX_COLUMNS, OUTBOX_INDEXES
+from persist import ensure_columns, async_url, parse_ts
+
+
+def _initial(cx):
+    # the schema main.py used to create on import; IF NOT EXISTS so databases
+    # from before versioning are adopted as they are
+    cx.exec_driver_sql('''
+    CREATE TABLE IF NOT EXISTS prospects (
+      id TEXT PRIMARY KEY,
+      name TEXT, platform TEXT, handle TEXT,
+      email TEXT, instagram TEXT,
+      subs INTEGER, last_video_at TIMESTAMP, video_title TEXT,
+      video_url TEXT, channel_url TEXT, query_source TEXT,
+      created_at TIMESTAMP NOT NULL
+    );''')
+    cx.exec_driver_sql('''
+    CREATE TABLE IF NOT EXISTS outbox (
+      id TEXT PRIMARY KEY,
+      prospect_id TEXT,
+      channel TEXT,
+      to_addr TEXT,
+      subject TEXT,
+      body TEXT,
+      status TEXT,
+      error TEXT,
+      attempts INTEGER,
+      next_attempt_at TIMESTAMP,
+      claimed_at TIMESTAMP,
+      created_at TIMESTAMP NOT NULL,
+      sent_at TIMESTAMP
+    );''')
+    ensure_columns(cx, 'outbox', OUTBOX_COLUMNS)
+    for ddl in OUTBOX_INDEXES:
+        cx.exec_driver_sql(ddl)
+    cx.exec_driver_sql('''
+    CREATE TABLE IF NOT EXISTS campaigns (
+      id TEXT PRIMARY KEY,
+      status TEXT NOT NULL,
+      total INTEGER, composed INTEGER, queued INTEGER,
+      skipped INTEGER, failed INTEGER,
+      params_json TEXT,
+      error TEXT,
+      created_at TIMESTAMP NOT NULL,
+      finished_at TIMESTAMP
+    );''')
+    cx.exec_driver_sql('''
+    CREATE TABLE IF NOT EXISTS compose_cache (
+      key TEXT PRIMARY KEY,
+      message TEXT NOT NULL,
+      created_at REAL,
+      latency REAL
+    );''')
+    cx.exec_driver_sql('''
+    CREATE TABLE IF NOT EXISTS yt_meta_cache (
+      kind TEXT NOT NULL,
+      id TEXT NOT NULL,
+      snippet_json TEXT,
+      stats_json TEXT,
+      snippet_at REAL,
+      stats_at REAL,
+      PRIMARY KEY (kind, id)
+    );''')
+    cx.exec_driver_sql('''
+    CREATE TABLE IF NOT EXISTS search_cursors (
+      query TEXT NOT NULL,
+      region TEXT NOT NULL,
+      newest_published_at TIMESTAMP,
+      page_token TEXT,
+      page_after TIMESTAMP,
+      updated_at TIMESTAMP,
+      PRIMARY KEY (query, region)
+    );''')
+    for ddl in ('CREATE INDEX IF NOT EXISTS ix_prospects_last_video_at ON prospects (last_video_at, id)',
+                'CREATE INDEX IF NOT EXISTS ix_prospects_channel_url ON prospects (channel_url)',
+                'CREATE INDEX IF NOT EXISTS ix_prospects_query_source ON prospects (query_source)',
+                'CREATE INDEX IF NOT EXISTS ix_prospects_email ON prospects (email)'):
+        cx.exec_driver_sql(ddl)
+
+
+def _channels(cx):
+    # DOUBLE PRECISION: keyset cursors compare score exactly, Postgres REAL would round it
+    cx.exec_driver_sql('''
+    CREATE TABLE IF NOT EXISTS channels (
+      channel_id TEXT PRIMARY KEY,
+      channel_url TEXT, name TEXT, handle TEXT,
+      email TEXT, instagram TEXT, subs INTEGER,
+      official INTEGER, artist_bio INTEGER, views_per_day DOUBLE PRECISION,
+      videos INTEGER, sightings INTEGER,
+      last_video_at TIMESTAMP,
+      video_title TEXT, video_url TEXT, query_source TEXT,
+      score DOUBLE PRECISION NOT NULL,
+      created_at TIMESTAMP NOT NULL,
+      updated_at TIMESTAMP
+    );''')
+    cx.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_channels_score ON channels (score, channel_id)')
+    # seed from the prospects stored so far, one row per channel with its
+    # newest video (the first one read on ties). Those rows kept no view
+    # counts or channel description, so views_per_day and artist_bio stay
+    # NULL; official comes from the stored video titles
+    official = re.compile(r"(?i)\b(official (audio|video)|visualizer|lyric video|single|performance)\b")
+    rows = cx.execute(sa.text('''SELECT name, handle, email, instagram, subs, last_video_at, video_title, video_url,
+                                      channel_url, query_source FROM prospects''')).mappings()
+    seeded = {}
+    for r in rows:
+        if not r['channel_url']:
+            continue
+        cid = r['channel_url'].rstrip('/').rsplit('/', 1)[-1]
+        ts = parse_ts(r['last_video_at'])
+        ch = seeded.setdefault(cid, dict(channel_id=cid, official=0, videos=0, last_video_at=None, best=r))
+        if ts is not None and (ch['last_video_at'] is None or ts > ch['last_video_at']):
+            ch.update(best=r, last_video_at=ts)
+        ch['official'] = max(ch['official'], int(bool(official.search(r['video_title'] or ''))))
+        ch['videos'] += 1
+    now = datetime.datetime.utcnow()
+    recs = []
+    for ch in seeded.values():
+        best = ch.pop('best')
+        # the score of the time: 3 points for an official video, one per 30 days since 2020
+        s = 3.0 * ch['official']
+        if ch['last_video_at'] is not None:
+            s += (ch['last_video_at'] - datetime.datetime(2020, 1, 1)).total_seconds() / 86400 / 30
+        recs.append(dict(ch, **{k: best[k] for k in ('channel_url', 'name', 'handle', 'email', 'instagram', 'subs',
+                                                     'video_title', 'video_url', 'query_source')},
+                         artist_bio=None, views_per_day=None, sightings=1, score=round(s, 6), created_at=now, updated_at=now))
+    if recs:
+        cx.execute(sa.text('''INSERT INTO channels (channel_id, channel_url, name, handle, email, instagram, subs, official,
+                                                  artist_bio, views_per_day, videos, sightings, last_video_at, video_title,
+                                                  video_url, query_source, score, created_at, updated_at)
+                               VALUES (:channel_id, :channel_url, :name, :handle, :email, :instagram, :subs, :official,
+                                       :artist_bio, :views_per_day, :videos, :sightings, :last_video_at, :video_title,
+                                       :video_url, :query_source, :score, :created_at, :updated_at)'''), recs)
+    print('channels_backfilled', len(recs))
+
+
+def _cursor_filters(cx):
+    # cursors gain the filter key in their primary key; a cursor is only a
+    # shortcut, so the old ones are dropped and the next search rescans
+    cx.exec_driver_sql('DROP TABLE IF EXISTS search_cursors')
+    cx.exec_driver_sql('''
+    CREATE TABLE search_cursors (
+      query TEXT NOT NULL,
+      region TEXT NOT NULL,
+      filters TEXT NOT NULL,
+      newest_published_at TIMESTAMP,
+      page_token TEXT,
+      page_after TIMESTAMP,
+      updated_at TIMESTAMP,
+      PRIMARY KEY (query, region, filters)
+    );''')
+
+
+def _prospects_recent_index(cx):
+    # in the order /prospects pages in, NULL timestamps last; SQLite already
+    # sorts NULL lowest (so last under DESC) and rejects NULLS LAST here
+    nulls = ' NULLS LAST' if cx.dialect.name == 'postgresql' else ''
+    cx.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS ix_prospects_recent ON prospects (last_video_at DESC{nulls}, id DESC)')
+    cx.exec_driver_sql('DROP INDEX IF EXISTS ix_prospects_last_video_at')
+
+
+def _bounded_recency(cx):
+    # scores stored so far carry an unbounded recency term (one point per 30
+    # days since 2020); rescore every channel with the capped one: 1 point
+    # for an upload today, none at 90 days
+    now = datetime.datetime.utcnow()
+    rows = cx.exec_driver_sql('SELECT channel_id, official, artist_bio, views_per_day, last_video_at FROM channels').all()
+    updates = []
+    for cid, official, artist_bio, vpd, last in rows:
+        s = 3.0 * bool(official) + 2.0 * bool(artist_bio) + math.log10(1 + (vpd or 0)) / 2
+        last = parse_ts(last)
+        if last is not None:
+            s += min(1.0, max(0.0, 1 - (now - last).total_seconds() / 86400 / 90))
+        updates.append(dict(cid=cid, s=round(s, 6)))
+    if updates:
+        cx.execute(sa.text('UPDATE channels SET score = :s WHERE channel_id = :cid'), updates)
+    print('channels_rescored', len(updates))
+
+
+# (version, name, fn): append only
+MIGRATIONS = [
+    (1, 'initial tables', _initial),
+    (2, 'channels with stored score', _channels),
+    (3, 'search cursors keyed by filters', _cursor_filters),
+    (4, 'newest-first prospects index', _prospects_recent_index),
+    (5, 'bounded channel recency', _bounded_recency),
+]
+
+
+async def run(url: str):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from lifecycle import migrate
+
+    engine = create_async_engine(async_url(url))
+    try:
+        async with engine.begin() as cx:
+            applied = await cx.run_sync(migrate, MIGRATIONS)
+        print('migrations', applied or 'up to date')
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(run(os.environ['DATABASE_URL']))
@@ -0,0 +1,251 @@
+import asyncio
+import datetime
+import os
+import random
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import httpx
+import sqlalchemy as sa
+
+from instrumentation import API_CALLS, StageTimer, count_error, stage
+from persist import metadata
+
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv('OUTBOX_BACKOFF_SECONDS', '60'))
+OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', '5'))
+# a row left in 'sending' this long belongs to a worker that died mid-send
+OUTBOX_CLAIM_TIMEOUT = int(os.getenv('OUTBOX_CLAIM_TIMEOUT', '600'))
+SENDGRID_TIMEOUT = float(os.getenv('SENDGRID_TIMEOUT', '15'))
+SENDGRID_SEND_URL = 'https://api.sendgrid.com/v3/mail/send'
+
+outbox = sa.Table(
+    'outbox', metadata,
+    sa.Column('id', sa.Text, primary_key=True),
+    sa.Column('prospect_id', sa.Text), sa.Column('channel', sa.Text), sa.Column('to_addr', sa.Text),
+    sa.Column('subject', sa.Text), sa.Column('body', sa.Text),
+    sa.Column('status', sa.Text), sa.Column('error', sa.Text),
+    sa.Column('attempts', sa.Integer), sa.Column('next_attempt_at', sa.DateTime), sa.Column('claimed_at', sa.DateTime),
+    sa.Column('created_at', sa.DateTime, nullable=False), sa.Column('sent_at', sa.DateTime),
+)
+
+# columns added to the original outbox table
+OUTBOX_COLUMNS = {'subject': 'TEXT', 'attempts': 'INTEGER', 'next_attempt_at': 'TIMESTAMP', 'claimed_at': 'TIMESTAMP'}
+OUTBOX_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS ix_outbox_status ON outbox (status, next_attempt_at)',
+    'CREATE INDEX IF NOT EXISTS ix_outbox_sent_at ON outbox (sent_at)',
+]
+
+
+class SendError(Exception):
+    pass
+
+
+class SendGridSender:
+    """Posts to the SendGrid v3 API on an async client with a timeout.
+
+    The SDK only builds the payload; its own client is synchronous.
+    """
+    name = 'sendgrid'
+
+    def __init__(self, api_key: str, from_email: str, from_name: str, timeout: float = SENDGRID_TIMEOUT):
+        self.client = httpx.AsyncClient(timeout=timeout, headers={'Authorization': f'Bearer {api_key}'})
+        self.from_email = from_email
+        self.from_name = from_name
+
+    async def send(self, to_addr: str, subject: str, body: str):
+        from sendgrid.helpers.mail import Mail
+        mail = Mail(
+            from_email=(self.from_email, self.from_name),
+            to_emails=[to_addr],
+            subject=(subject or '').strip(),
+            plain_text_content=(body or '').strip(),
+        )
+        resp = await self.client.post(SENDGRID_SEND_URL, json=mail.get())
+        if not 200 <= resp.status_code < 300:
+            raise SendError(f"SendGrid status {resp.status_code}")
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class StubSender:
+    """Stands in for SendGrid locally and in tests: records instead of sending.
+
+    ``fail_next`` makes that many upcoming sends raise, to exercise retries.
+    """
+    name = 'stub'
+
+    def __init__(self, fail_next: int = 0):
+        self.sent: List[Dict] = []
+        self.fail_next = fail_next
+
+    async def send(self, to_addr: str, subject: str, body: str):
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            raise SendError('stub failure')
+        self.sent.append(dict(to_addr=to_addr, subject=subject, body=body, at=time.time()))
+
+    async def aclose(self):
+        pass
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def take(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def enqueue(cx, rows: List[Dict]):
+    """Insert outbox rows as ``queued``; each row needs id, to_addr, subject and body."""
+    now = datetime.datetime.utcnow()
+    cx.execute(outbox.insert(), [dict(dict(prospect_id=None, channel='email', error=None, sent_at=None,
+                                           next_attempt_at=None, claimed_at=None), **r,
+                                      status='queued', attempts=0, created_at=now) for r in rows])
+
+
+class OutboxWorker:
+    """Drains the outbox table in the background at a paced rate.
+
+    Rows are claimed one at a time with ``SELECT ... FOR UPDATE SKIP LOCKED``
+    on Postgres (SQLite serializes writers, so the same UPDATE is already
+    exclusive there), sent through the sender's async client, and retried
+    with exponential backoff. The token bucket paces this process
+    only; run one API worker when the rate limit matters.
+    """
+
+    def __init__(self, engine, sender, rate_seconds: float, burst: int = 1,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS, backoff_seconds: float = OUTBOX_BACKOFF_SECONDS,
+                 poll_seconds: float = OUTBOX_POLL_SECONDS):
+        self.engine = engine
+        self.sender = sender
+        self.bucket = TokenBucket(1.0 / max(rate_seconds, 0.001), burst)
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_seconds = poll_seconds
+        self.counts = dict(sent=0, retried=0, failed=0)
+        self._recent = deque(maxlen=1000)  # monotonic timestamps of recent sends
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.sender is not None and self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def wake(self):
+        self._wake.set()
+
+    async def claim(self) -> Optional[sa.Row]:
+        now = datetime.datetime.utcnow()
+        stale = now - datetime.timedelta(seconds=OUTBOX_CLAIM_TIMEOUT)
+        c = outbox.c
+        pick = (sa.select(c.id)
+                .where(sa.or_(sa.and_(c.status == 'queued',
+                                      sa.or_(c.next_attempt_at.is_(None), c.next_attempt_at <= now)),
+                              sa.and_(c.status == 'sending', c.claimed_at < stale)))
+                .order_by(c.created_at)
+                .limit(1)
+                .with_for_update(skip_locked=True))
+        stmt = (outbox.update()
+                .where(c.id == pick.scalar_subquery())
+                .values(status='sending', claimed_at=now, attempts=sa.func.coalesce(c.attempts, 0) + 1)
+                .returning(c.id, c.to_addr, c.subject, c.body, c.attempts))
+        async with self.engine.begin() as cx:
+            return (await cx.execute(stmt)).first()
+
+    async def _finish(self, oid: str, attempts: int, error: Optional[str]):
+        now = datetime.datetime.utcnow()
+        if error is None:
+            values = dict(status='sent', sent_at=now, error=None)
+        elif attempts < self.max_attempts:
+            delay = self.backoff_seconds * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+            values = dict(status='queued', error=error, next_attempt_at=now + datetime.timedelta(seconds=delay))
+        else:
+            values = dict(status='error', error=error)
+        async with self.engine.begin() as cx:
+            await cx.execute(outbox.update().where(outbox.c.id == oid).values(**values))
+        return values['status']
+
+    async def process_one(self) -> bool:
+        """Claim and send one row; False when nothing is due."""
+        row = await self.claim()
+        if row is None:
+            return False
+        await self.bucket.take()
+        with StageTimer('outbox_send').active():
+            try:
+                with stage('deliver'):
+                    await self.sender.send(row.to_addr, row.subject, row.body)
+                error = None
+            except Exception as e:
+                error = str(e) or repr(e)
+            API_CALLS.inc(api=getattr(self.sender, 'name', 'email'), endpoint='send', result='error' if error else 'ok')
+            with stage('finish'):
+                status = await self._finish(row.id, row.attempts, error)
+        if status == 'sent':
+            self.counts['sent'] += 1
+            self._recent.append(time.monotonic())
+        elif status == 'queued':
+            self.counts['retried'] += 1
+        else:
+            self.counts['failed'] += 1
+            count_error('outbox_send_failed')
+            print('outbox_send_failed', row.id, error)
+        return True
+
+    async def run(self):
+        while True:
+            try:
+                if await self.process_one():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                count_error('outbox_worker_error')
+                print('outbox_worker_error', repr(e))
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stats(self) -> dict:
+        async with self.engine.connect() as cx:
+            depth = dict((await cx.execute(sa.select(outbox.c.status, sa.func.count()).group_by(outbox.c.status))).all())
+            hour_ago = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+            sent_last_hour = (await cx.execute(sa.select(sa.func.count()).where(outbox.c.status == 'sent', outbox.c.sent_at >= hour_ago))).scalar()
+        now = time.monotonic()
+        return dict(
+            sender=getattr(self.sender, 'name', None),
+            running=self._task is not None and not self._task.done(),
+            depth=depth,
+            queued=depth.get('queued', 0),
+            sent_last_hour=sent_last_hour,
+            sent_last_10m_this_worker=sum(1 for t in self._recent if now - t <= 600),
+            rate_per_hour=round(self.bucket.rate * 3600, 1),
+            **self.counts,
+        )
@@ -0,0 +1,181 @@
+import base64
+import datetime
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+
+metadata = sa.MetaData()
+
+# mirrors the CREATE TABLE in migrations.py; used to build dialect-specific upserts
+prospects = sa.Table(
+    'prospects', metadata,
+    sa.Column('id', sa.Text, primary_key=True),
+    sa.Column('name', sa.Text), sa.Column('platform', sa.Text), sa.Column('handle', sa.Text),
+    sa.Column('email', sa.Text), sa.Column('instagram', sa.Text),
+    sa.Column('subs', sa.Integer), sa.Column('last_video_at', sa.DateTime), sa.Column('video_title', sa.Text),
+    sa.Column('video_url', sa.Text), sa.Column('channel_url', sa.Text), sa.Column('query_source', sa.Text),
+    sa.Column('created_at', sa.DateTime, nullable=False),
+)
+
+PROSPECT_COLUMNS = [c.name for c in prospects.columns]
+# what /prospects and /export.csv hand out, in order
+PUBLIC_COLUMNS = ['name', 'video_title', 'video_url', 'channel_url', 'subs', 'email', 'instagram', 'last_video_at', 'query_source']
+
+# kept from the first time a prospect was stored
+_KEEP_ON_UPDATE = {'id', 'created_at'}
+
+UPSERT_CHUNK = 1000
+
+
+def async_url(url: str) -> str:
+    """DATABASE_URL (postgres://, postgresql://, sqlite:///...) with its asyncio driver: asyncpg or aiosqlite."""
+    u = sa.engine.make_url(url)
+    backend = u.get_backend_name()
+    if backend in ('postgres', 'postgresql'):
+        sslmode = u.query.get('sslmode')
+        u = u.set(drivername='postgresql+asyncpg').difference_update_query(['sslmode'])
+        if sslmode:
+            u = u.update_query_dict({'ssl': sslmode})  # asyncpg spells it ssl=
+    elif backend == 'sqlite':
+        u = u.set(drivername='sqlite+aiosqlite')
+    return u.render_as_string(hide_password=False)
+
+
+def ensure_columns(cx, table: str, columns: Dict[str, str]):
+    """Add columns introduced after ``table`` was first created (``{name: sql type}``)."""
+    have = {c['name'] for c in sa.inspect(cx).get_columns(table)}
+    for name, ddl in columns.items():
+        if name not in have:
+            cx.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}')
+
+
+def parse_ts(value):
+    """API timestamps ('2024-05-01T12:00:00Z') -> naive UTC datetime."""
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    ts = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def dialect_insert(dialect: str):
+    """The dialect's ``insert`` with ``on_conflict_do_update``, or None where there isn't one."""
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
+
+
+def _existing_ids(cx, ids: List[str]) -> set:
+    return set(cx.execute(sa.select(prospects.c.id).where(prospects.c.id.in_(ids))).scalars())
+
+
+def upsert_prospects(cx, rows: List[Dict]) -> Tuple[int, int]:
+    """Write prospect rows in bulk on an open connection; returns ``(inserted, updated)``.
+
+    Postgres and SQLite both get ``INSERT ... ON CONFLICT (id) DO UPDATE`` sent
+    as one executemany per chunk (batched into multi-row VALUES by SQLAlchemy's
+    insertmanyvalues). Other dialects fall back to delete + insert, still
+    batched.
+    """
+    by_id: Dict[str, Dict] = {}
+    for r in rows:
+        rec = {c: r.get(c) for c in PROSPECT_COLUMNS}
+        rec['last_video_at'] = parse_ts(rec['last_video_at'])
+        rec['created_at'] = parse_ts(rec['created_at']) or datetime.datetime.utcnow()
+        by_id[rec['id']] = rec  # last one wins; ON CONFLICT can't touch a row twice per statement
+    recs = list(by_id.values())
+
+    insert = dialect_insert(cx.dialect.name)
+    inserted = updated = 0
+    for i in range(0, len(recs), UPSERT_CHUNK):
+        chunk = recs[i:i + UPSERT_CHUNK]
+        ids = [r['id'] for r in chunk]
+        existing = _existing_ids(cx, ids)
+        if insert is not None:
+            stmt = insert(prospects)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[prospects.c.id],
+                set_={c: stmt.excluded[c] for c in PROSPECT_COLUMNS if c not in _KEEP_ON_UPDATE},
+            )
+            cx.execute(stmt, chunk)
+        else:
+            if existing:
+                cx.execute(prospects.delete().where(prospects.c.id.in_(list(existing))))
+            cx.execute(prospects.insert(), chunk)
+        updated += len(existing)
+        inserted += len(chunk) - len(existing)
+    return inserted, updated
+
+
+def encode_cursor(last_video_at, pid: str) -> str:
+    ts = last_video_at.isoformat() if isinstance(last_video_at, datetime.datetime) else last_video_at
+    return base64.urlsafe_b64encode(json.dumps([ts, pid]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, parse=parse_ts) -> Tuple[Any, str]:
+    """``(sort key, id)``; raises ValueError for anything that isn't a cursor we handed out."""
+    try:
+        key, pid = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return parse(key), str(pid)
+    except Exception as e:
+        raise ValueError(f'bad cursor: {e}') from None
+
+
+def apply_filters(q, c, query_source: Optional[str] = None, min_subs: Optional[int] = None,
+                  max_subs: Optional[int] = None, has_email: Optional[bool] = None):
+    """The /prospects filters, on any table with query_source, subs and email columns (``c``)."""
+    if query_source is not None:
+        q = q.where(c.query_source == query_source)
+    if min_subs is not None:
+        q = q.where(c.subs >= min_subs)
+    if max_subs is not None:
+        q = q.where(c.subs <= max_subs)
+    if has_email is not None:
+        q = q.where(sa.and_(c.email.is_not(None), c.email != '') if has_email
+                    else sa.or_(c.email.is_(None), c.email == ''))
+    return q
+
+
+def prospect_queries(cursor: Optional[str] = None, query_source: Optional[str] = None,
+                     min_subs: Optional[int] = None, max_subs: Optional[int] = None,
+                     has_email: Optional[bool] = None) -> List[Any]:
+    """Newest-first prospects with keyset pagination on ``(last_video_at, id)``, served by ix_prospects_recent.
+
+    Returns the selects still to read, in order. Timestamped rows come first
+    and seek on the row value alone; the NULL tail is its own phase, reached
+    by a cursor whose timestamp is None and seeking on id. Keeping the two
+    apart leaves each a single index range (an OR across them isn't one).
+    The id column is selected too so callers can build the next cursor.
+    """
+    c = prospects.c
+    q = sa.select(*[c[name] for name in PUBLIC_COLUMNS], c.id)
+    q = apply_filters(q, c, query_source=query_source, min_subs=min_subs, max_subs=max_subs, has_email=has_email)
+    q = q.order_by(c.last_video_at.desc().nulls_last(), c.id.desc())
+    ts, pid = decode_cursor(cursor) if cursor else (None, None)
+    phases = []
+    if not cursor or ts is not None:
+        dated = q.where(c.last_video_at.is_not(None))
+        if cursor:
+            dated = dated.where(sa.tuple_(c.last_video_at, c.id) < (ts, pid))
+        phases.append(dated)
+    undated = q.where(c.last_video_at.is_(None))
+    if cursor and ts is None:
+        undated = undated.where(c.id < pid)
+    phases.append(undated)
+    return phases
+
+
+def read_page(cx, queries: List[Any], n: int) -> List[Any]:
+    """Up to ``n`` rows from ``queries`` in turn, moving on only when one runs out."""
+    rows: List[Any] = []
+    for q in queries:
+        rows += cx.execute(q.limit(n - len(rows))).all()
+        if len(rows) >= n:
+            break
+    return rows
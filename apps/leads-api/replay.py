@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+# YT_RECORD_PATH appends every Data API response to a JSONL fixture;
+# YT_REPLAY_PATH serves responses from one instead of calling YouTube
+YT_RECORD_PATH = os.getenv('YT_RECORD_PATH', '')
+YT_REPLAY_PATH = os.getenv('YT_REPLAY_PATH', '')
+
+# params that don't pick the response: the key, and the window start that moves with the clock
+IGNORED_PARAMS = {'key', 'publishedAfter'}
+ITEM_ENDPOINTS = ('videos', 'channels')
+DECODED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+
+def _endpoint(request: httpx.Request) -> str:
+    return request.url.path.rstrip('/').rsplit('/', 1)[-1]
+
+
+def _params(request: httpx.Request) -> Dict[str, str]:
+    return {k: v for k, v in request.url.params.items() if k not in IGNORED_PARAMS}
+
+
+def search_key(params: Dict[str, str]) -> str:
+    return json.dumps(sorted(params.items()))
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Passes requests through to ``inner`` and appends each JSON response to ``path``.
+
+    One line per call: ``{"endpoint", "params", "status", "body"}``, with the
+    API key left out, so fixtures can be checked in.
+    """
+
+    def __init__(self, path: str, inner: Optional[httpx.AsyncBaseTransport] = None):
+        self.path = path
+        self.inner = inner or httpx.AsyncHTTPTransport(http2=True)
+        self._lock = threading.Lock()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        resp = await self.inner.handle_async_request(request)
+        body = await resp.aread()
+        line = json.dumps(dict(endpoint=_endpoint(request), params=_params(request),
+                               status=resp.status_code, body=json.loads(body or b'null')))
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line + '\n')
+        # the body has been decoded already
+        headers = [(k, v) for k, v in resp.headers.items() if k.lower() not in DECODED_HEADERS]
+        return httpx.Response(resp.status_code, headers=headers, content=body, request=request)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Serves recorded Data API responses without touching the network.
+
+    ``search`` pages are matched on their params (minus ``key`` and
+    ``publishedAfter``). ``videos`` and ``channels`` are answered item by
+    item from everything recorded, because which ids are batched together
+    depends on cache state. Unrecorded searches get a 404 and are counted
+    in ``misses``; unknown ids are left out, as the API does.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.searches: Dict[str, Tuple[int, dict]] = {}
+        self.items: Dict[str, Dict[str, dict]] = {e: {} for e in ITEM_ENDPOINTS}
+        self.misses = 0
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    self.add(json.loads(line))
+
+    def add(self, rec: dict):
+        if rec['endpoint'] in ITEM_ENDPOINTS:
+            for it in (rec.get('body') or {}).get('items', []):
+                self.items[rec['endpoint']][it['id']] = it
+        else:
+            params = {k: v for k, v in rec['params'].items() if k not in IGNORED_PARAMS}
+            self.searches[search_key(params)] = (rec.get('status', 200), rec.get('body'))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint, params = _endpoint(request), _params(request)
+        if endpoint in ITEM_ENDPOINTS:
+            known = self.items[endpoint]
+            ids: List[str] = params.get('id', '').split(',')
+            return httpx.Response(200, json=dict(items=[known[i] for i in ids if i in known]), request=request)
+        hit = self.searches.get(search_key(params))
+        if hit is None:
+            self.misses += 1
+            return httpx.Response(404, json=dict(error=dict(code=404, message='not in replay fixture')), request=request)
+        status, body = hit
+        return httpx.Response(status, json=body, request=request)
+
+
+_replay: Optional[ReplayTransport] = None
+
+
+def transport_from_env(limits: httpx.Limits) -> Optional[httpx.AsyncBaseTransport]:
+    """Replay, record, or None for the normal HTTP/2 transport.
+
+    The replay transport is loaded once and shared (closing it is a no-op);
+    a recording one wraps a fresh connection pool per client.
+    """
+    global _replay
+    if YT_REPLAY_PATH:
+        if _replay is None:
+            _replay = ReplayTransport(YT_REPLAY_PATH)
+        return _replay
+    if YT_RECORD_PATH:
+        return RecordingTransport(YT_RECORD_PATH, httpx.AsyncHTTPTransport(http2=True, limits=limits))
+    return None
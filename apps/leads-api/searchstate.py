@@ -0,0 +1,108 @@
+import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+import sqlalchemy as sa
+
+from persist import metadata, prospects
+
+# where the last /search left off for each (query, region, filters): the
+# newest video seen, and a page token into older results that weren't
+# reached yet. ``filters`` is CandidateFilter.key: a search with other
+# subs/views/keyword filters would have stored other prospects, so it
+# starts its own cursor instead of resuming this one
+search_cursors = sa.Table(
+    'search_cursors', metadata,
+    sa.Column('query', sa.Text, primary_key=True),
+    sa.Column('region', sa.Text, primary_key=True),
+    sa.Column('filters', sa.Text, primary_key=True),
+    sa.Column('newest_published_at', sa.DateTime),
+    sa.Column('page_token', sa.Text),
+    sa.Column('page_after', sa.DateTime),  # publishedAfter the page token belongs to
+    sa.Column('updated_at', sa.DateTime),
+)
+
+CURSOR_FIELDS = ('newest_published_at', 'page_token', 'page_after')
+# slack when comparing search windows, for the time a search takes to run
+WINDOW_SLACK = datetime.timedelta(minutes=5)
+
+
+def load_cursors(cx, pairs: Iterable[Tuple[str, str]], filters: str) -> Dict[Tuple[str, str], dict]:
+    pairs = list(pairs)
+    if not pairs:
+        return {}
+    c = search_cursors.c
+    rows = cx.execute(sa.select(search_cursors)
+                      .where(c.filters == filters, sa.tuple_(c.query, c.region).in_(pairs))).mappings()
+    return {(r['query'], r['region']): {k: r[k] for k in CURSOR_FIELDS + ('updated_at',)} for r in rows}
+
+
+def save_cursors(cx, states: Dict[Tuple[str, str], dict], filters: str):
+    """Write cursor state per (query, region) under ``filters``; a handful of rows, so update-else-insert."""
+    now = datetime.datetime.utcnow()
+    c = search_cursors.c
+    for (q, rc), st in states.items():
+        values = dict({k: st.get(k) for k in CURSOR_FIELDS}, updated_at=now)
+        if not cx.execute(search_cursors.update().where(c.query == q, c.region == rc, c.filters == filters)
+                          .values(**values)).rowcount:
+            cx.execute(search_cursors.insert().values(query=q, region=rc, filters=filters, **values))
+
+
+class KnownIds:
+    """YouTube video ids already stored as prospects (``yt_<videoId>``), in memory.
+
+    Loaded once from the DB and extended after each store, so /search can
+    skip videos it already has without a query per page. A plain set: at a
+    few bytes per id it stays small for any realistic prospect count, and
+    unlike a bloom filter it never drops a new video as a false positive.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.loaded = False
+        self._ids: set = set()
+
+    async def load(self):
+        c = prospects.c
+        async with self.engine.connect() as cx:
+            ids = (await cx.execute(sa.select(c.id).where(c.id.like('yt\\_%', escape='\\')))).scalars()
+            self._ids = {pid[3:] for pid in ids}
+        self.loaded = True
+
+    def add(self, prospect_ids: Iterable[str]):
+        self._ids.update(pid[3:] for pid in prospect_ids if pid.startswith('yt_'))
+
+    def __contains__(self, video_id: str) -> bool:
+        return video_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+def token_fits(cursor: dict, window_start: datetime.datetime) -> bool:
+    """Whether the stored page token's window, slid forward to now, lies within this search's.
+
+    Page tokens only work with the ``publishedAfter`` they were issued for,
+    so a token from a wider ``days_back`` than the current one is skipped.
+    """
+    after, at = cursor.get('page_after'), cursor.get('updated_at')
+    if not (cursor.get('page_token') and after and at):
+        return False
+    return at - after <= datetime.datetime.utcnow() - window_start + WINDOW_SLACK
+
+
+def next_state(cursor: Optional[dict], newest: Optional[datetime.datetime], fresh_token: Optional[str],
+               fresh_after: datetime.datetime, resumed: bool, resume_token: Optional[str]) -> dict:
+    """Cursor after a search: newest video so far, and where older results continue.
+
+    A page token left by this run's fresh pass wins (it covers the newest gap);
+    otherwise the resumed walk's leftover token, else whatever was stored.
+    """
+    cursor = cursor or {}
+    prev = cursor.get('newest_published_at')
+    state = dict(newest_published_at=max(filter(None, (prev, newest)), default=None),
+                 page_token=cursor.get('page_token'), page_after=cursor.get('page_after'))
+    if fresh_token:
+        state.update(page_token=fresh_token, page_after=fresh_after)
+    elif resumed:
+        state.update(page_token=resume_token, page_after=cursor.get('page_after') if resume_token else None)
+    return state
@@ -0,0 +1,19 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# modules sit flat next to main.py, as in the Docker image
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    """URL of a migrated SQLite DB; tests open their own async engine on it inside their event loop."""
+    import migrations
+
+    url = f"sqlite:///{tmp_path / 'leads.db'}"
+    asyncio.run(migrations.run(url))
+    return url
@@ -0,0 +1,36 @@
+import datetime
+
+import pytest
+
+from channels import RECENCY_DAYS, RECENCY_WEIGHT, aggregate, score
+
+NOW = datetime.datetime(2025, 6, 1)
+
+
+def days_ago(n):
+    return NOW - datetime.timedelta(days=n)
+
+
+@pytest.mark.parametrize('age,bonus', [(0, RECENCY_WEIGHT), (RECENCY_DAYS / 2, RECENCY_WEIGHT / 2),
+                                       (RECENCY_DAYS, 0.0), (10 * RECENCY_DAYS, 0.0), (-5, RECENCY_WEIGHT)])
+def test_recency_is_capped(age, bonus):
+    assert score(dict(last_video_at=days_ago(age)), NOW) == pytest.approx(bonus)
+    assert score(dict(last_video_at=None), NOW) == 0.0
+
+
+def test_recency_does_not_outweigh_signals():
+    stale_official = dict(official=1, last_video_at=days_ago(5 * 365))
+    fresh_unknown = dict(official=0, last_video_at=NOW)
+    assert score(stale_official, NOW) > score(fresh_unknown, NOW)
+    # with the other signals equal, the newer upload ranks first
+    assert score(dict(stale_official, last_video_at=days_ago(1)), NOW) > score(dict(stale_official, last_video_at=days_ago(30)), NOW)
+
+
+def test_aggregate_scores_at_one_time():
+    recs = [dict(_channel_id='UC1', _score=1, _official=True, _views_per_day=99.0, last_video_at=days_ago(45)),
+            dict(_channel_id='UC1', _score=2, _official=False, _views_per_day=9.0, last_video_at=days_ago(90)),
+            dict(_channel_id='UC2', _score=1, last_video_at=None)]
+    out = aggregate(recs, NOW)
+    assert out['UC1']['best'] is recs[1] and out['UC1']['first'] == 1
+    assert out['UC1']['score'] == pytest.approx(3 + 1 + RECENCY_WEIGHT / 2)
+    assert out['UC2']['score'] == 0.0
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from composecache import ComposeCache
+
+
+class Compute:
+    """Counts calls; each call waits on ``release`` so callers pile up behind it."""
+
+    def __init__(self, cacheable=True, fail=None):
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.cacheable = cacheable
+        self.fail = fail
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.fail:
+            raise self.fail
+        return f'message {self.calls}', self.cacheable
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_callers_share_one_compute():
+    async def main():
+        cache, compute = ComposeCache(), Compute()
+        tasks = [asyncio.create_task(cache.get_or_compute('k', compute)) for _ in range(20)]
+        await settle()
+        compute.release.set()
+        assert await asyncio.gather(*tasks) == ['message 1'] * 20
+        assert compute.calls == 1
+        assert await cache.get_or_compute('k', compute) == 'message 1'
+        assert cache.stats['misses'] == 1 and cache.stats['coalesced'] == 19 and cache.stats['hits'] == 1
+        assert not cache._inflight
+    asyncio.run(main())
+
+
+def test_cancelled_leader_hands_over_to_a_follower():
+    async def main():
+        cache, compute = ComposeCache(), Compute()
+        leader = asyncio.create_task(cache.get_or_compute('k', compute))
+        await settle()
+        followers = [asyncio.create_task(cache.get_or_compute('k', compute)) for _ in range(5)]
+        await settle()
+        leader.cancel()
+        await settle()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        compute.release.set()
+        assert await asyncio.gather(*followers) == ['message 2'] * 5
+        assert compute.calls == 2
+        assert not cache._inflight
+    asyncio.run(main())
+
+
+def test_cancelled_follower_leaves_the_leader_running():
+    async def main():
+        cache, compute = ComposeCache(), Compute()
+        leader = asyncio.create_task(cache.get_or_compute('k', compute))
+        await settle()
+        follower = asyncio.create_task(cache.get_or_compute('k', compute))
+        await settle()
+        follower.cancel()
+        await settle()
+        compute.release.set()
+        assert await leader == 'message 1'
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        assert compute.calls == 1
+    asyncio.run(main())
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    async def main():
+        cache, compute = ComposeCache(), Compute(fail=RuntimeError('llm down'))
+        tasks = [asyncio.create_task(cache.get_or_compute('k', compute)) for _ in range(3)]
+        await settle()
+        compute.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert [type(r) for r in results] == [RuntimeError] * 3
+        compute.fail = None
+        assert await cache.get_or_compute('k', compute) == 'message 2'
+    asyncio.run(main())
+
+
+def test_uncacheable_result_is_not_stored():
+    async def main():
+        cache, compute = ComposeCache(), Compute(cacheable=False)
+        compute.release.set()
+        assert await cache.get_or_compute('k', compute) == 'message 1'
+        assert await cache.get_or_compute('k', compute) == 'message 2'
+        assert cache.stats['stored'] == 0
+    asyncio.run(main())
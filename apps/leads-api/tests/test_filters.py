@@ -0,0 +1,84 @@
+"""The merged per-field regexes in CandidateFilter against the per-pattern checks they replaced."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+from bench_filters import legacy_accept, synth_items  # noqa: E402
+from filters import (ARTIST_BIO, FIELD_MATCHERS, FIELD_RULES, INCLUDE_VIDEO, REJECT_CATEGORY,  # noqa: E402
+                     REJECT_KEYWORD, REJECT_LIVE, REJECT_NOT_ARTIST, REJECT_SUBS, REJECT_VIEWS, CandidateFilter)
+
+
+class Req:
+    min_subs = 1000
+    max_subs = 120000
+    min_video_views = 300
+    strict_artist_filter = True
+    exclude_keywords = ['Midnight', 'golden echo']
+
+
+def reference_reason(req, v, ch):
+    """Reason code from one ``search`` per pattern: the match starting earliest in the field, rule order on ties."""
+    snip, csnip = v['snippet'], ch['snippet']
+    if not req.min_subs <= int(ch['statistics']['subscriberCount']) <= req.max_subs:
+        return REJECT_SUBS
+    if int(v['statistics']['viewCount']) < req.min_video_views:
+        return REJECT_VIEWS
+    if snip.get('liveBroadcastContent', 'none').lower() != 'none':
+        return REJECT_LIVE
+    if str(snip.get('categoryId')) != '10':
+        return REJECT_CATEGORY
+    fields = dict(v_title=snip['title'], v_desc=snip.get('description', '') or '', ch_title=csnip['title'],
+                  ch_desc=csnip.get('description', '') + '\n' + ch['brandingSettings']['channel']['description'],
+                  handle=csnip.get('customUrl') or '')
+    for field, rules in FIELD_RULES.items():
+        hits = [(m.start(), i, code) for i, (code, pat) in enumerate(rules) for m in [pat.search(fields[field])] if m]
+        if hits:
+            return min(hits)[2]
+    joined = '\n'.join(fields[k] for k in ('v_title', 'v_desc', 'ch_title', 'handle')).lower()
+    if any(kw.lower() in joined for kw in req.exclude_keywords):
+        return REJECT_KEYWORD
+    if req.strict_artist_filter and not (INCLUDE_VIDEO.search(fields['v_title']) or ARTIST_BIO.search(fields['ch_desc'])):
+        return REJECT_NOT_ARTIST
+    return None
+
+
+def corpus():
+    return list(synth_items(3000, seed=11))
+
+
+def test_keep_reject_matches_legacy_chain():
+    req = Req()
+    flt = CandidateFilter.from_request(req)
+    items = corpus()
+    got = [flt.evaluate(it['video'], it['channel'])[0] is None for it in items]
+    assert got == [legacy_accept(req, it['video'], it['channel']) for it in items]
+    assert 0 < sum(got) < len(got)
+
+
+def test_reason_codes_match_per_pattern_search():
+    req = Req()
+    flt = CandidateFilter.from_request(req)
+    items = corpus()
+    reasons = [flt.evaluate(it['video'], it['channel'])[0] for it in items]
+    expected = [reference_reason(req, it['video'], it['channel']) for it in items]
+    assert reasons == expected
+    # the corpus reaches most gates
+    assert len(set(reasons)) >= 8
+
+
+@pytest.mark.parametrize('field,text,code', [
+    ('ch_title', 'Drake Beats', 'big_artist'),       # both match; the earlier one wins
+    ('ch_title', 'Beats by Drake', 'channel'),
+    ('v_title', 'Taylor Swift cover', 'big_artist'),
+    ('v_title', 'Golden Hour (cover)', 'video'),
+    ('v_title', 'fan edit mix', 'repost'),
+    ('ch_desc', 'credits to my records label', 'repost'),
+    ('ch_title', 'Rain Soul - Topic', 'topic_channel'),
+    ('handle', '@rainprod', 'handle'),
+    ('v_title', 'Golden Hour (Official Video)', None),
+])
+def test_overlapping_patterns(field, text, code):
+    m = FIELD_MATCHERS[field].search(text)
+    assert (m.lastgroup if m else None) == code
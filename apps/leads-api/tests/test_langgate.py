@@ -0,0 +1,70 @@
+import asyncio
+
+import langid
+import pytest
+
+from langgate import LanguageGate
+
+ENGLISH = ('Golden Hour (Official Video)', 'New single out now, stream everywhere', 'UCrain', 'Rain Soul',
+           'Independent R&B singer and songwriter from London.')
+SPANISH = ('Canción nueva', 'La nueva canción de mi álbum, disponible en todas las plataformas', 'UClluvia', 'Lluvia',
+           'Cantante independiente de Madrid')
+FRENCH = ('Nouveau clip', 'Mon nouveau single est disponible partout', 'UCpluie', 'Pluie',
+          'Chanteuse indépendante de Paris')
+SHORT = ('Midnight Drive', '', 'UCecho', 'Echo', '')  # most likely English, but far from sure
+
+
+@pytest.fixture(scope='module')
+def gate():
+    g = LanguageGate()
+    g.load()
+    return g
+
+
+def _sharing_model(gate, min_prob):
+    g = LanguageGate(min_prob=min_prob)
+    g._ident, g._en = gate._ident, gate._en
+    return g
+
+
+@pytest.mark.parametrize('item,english', [(ENGLISH, True), (SPANISH, False), (FRENCH, False), (SHORT, False)])
+def test_verdicts(gate, item, english):
+    assert gate.check(item) is english
+
+
+def test_threshold(gate):
+    v_title, v_desc, _, ch_title, ch_desc = SHORT
+    fv = gate._fv(gate._join(v_title, v_desc)) + gate._fv(gate._join(ch_title, ch_desc))
+    p = gate._ident.norm_probs(gate._ident.nb_classprobs(fv))[gate._en]
+    assert p < gate.min_prob
+    assert _sharing_model(gate, p - 1e-6).check(SHORT)
+    assert not _sharing_model(gate, p + 1e-6).check(SHORT)
+
+
+def test_empty_text_is_let_through():
+    g = LanguageGate()
+    assert g.check(('', '', 'UCx', '', '')) is True
+    assert not g.loaded
+
+
+def test_non_latin_rejected_without_the_model():
+    g = LanguageGate()
+    assert g.check(('新しい曲', '新しいシングルが出ました', 'UCjp', '雨', 'シンガーソングライター')) is False
+    assert not g.loaded
+
+
+@pytest.mark.parametrize('item', [ENGLISH, SPANISH, FRENCH, SHORT])
+def test_summed_vectors_match_langid_classify(gate, item):
+    v_title, v_desc, _, ch_title, ch_desc = item
+    video, channel = gate._join(v_title, v_desc), gate._join(ch_title, ch_desc)
+    raw = gate._ident.nb_classprobs(gate._fv(video) + gate._fv(channel))
+    lang, score = langid.classify(f'{video} {channel}')
+    assert gate._ident.nb_classes[raw.argmax()] == lang
+    # only the n-grams spanning the join are missing from the sum
+    assert raw.max() == pytest.approx(score, rel=0.05)
+
+
+def test_check_many_matches_check(gate):
+    items = [ENGLISH, SPANISH, FRENCH, SHORT, ('Slow Rain (Official Audio)',) + ENGLISH[1:]]
+    fresh = _sharing_model(gate, gate.min_prob)
+    assert asyncio.run(fresh.check_many(items)) == [gate.check(i) for i in items]
@@ -0,0 +1,56 @@
+import asyncio
+import datetime
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import migrations
+from lifecycle import migrate
+from persist import async_url, upsert_prospects
+
+NOW = datetime.datetime.utcnow()
+PROSPECTS = [
+    dict(id='v1', channel_url='https://www.youtube.com/channel/UCa/', video_title='Rain (Official Video)',
+         name='A', subs=10, last_video_at=NOW - datetime.timedelta(days=45)),
+    dict(id='v2', channel_url='https://www.youtube.com/channel/UCa', video_title='Rain (live)',
+         name='A newer', subs=11, last_video_at=NOW - datetime.timedelta(days=10)),
+    dict(id='v3', channel_url='https://www.youtube.com/channel/UCa', video_title='Undated', name='A undated', subs=12),
+    dict(id='v4', channel_url='https://www.youtube.com/channel/UCb', video_title=None, name='B', subs=20),
+    dict(id='v5', channel_url=None, video_title='No channel'),
+]
+
+
+def at_version(url, n):
+    """A DB migrated up to MIGRATIONS[:n] with PROSPECTS stored, then ``{channel_id: row}``."""
+    async def main():
+        engine = create_async_engine(async_url(url))
+        try:
+            async with engine.begin() as cx:
+                await cx.run_sync(migrate, migrations.MIGRATIONS[:1])
+                await cx.run_sync(upsert_prospects, PROSPECTS)
+            async with engine.begin() as cx:
+                await cx.run_sync(migrate, migrations.MIGRATIONS[:n])
+            async with engine.connect() as cx:
+                return {r['channel_id']: r for r in (await cx.execute(sa.text('SELECT * FROM channels'))).mappings()}
+        finally:
+            await engine.dispose()
+    return asyncio.run(main())
+
+
+def test_channels_backfill(tmp_path):
+    chans = at_version(f"sqlite:///{tmp_path / 'leads.db'}", 2)
+    assert set(chans) == {'UCa', 'UCb'}
+    a, b = chans['UCa'], chans['UCb']
+    assert (a['name'], a['video_title'], a['official'], a['videos'], a['sightings']) == ('A newer', 'Rain (live)', 1, 3, 1)
+    assert a['artist_bio'] is None and a['views_per_day'] is None
+    days = (NOW - datetime.timedelta(days=10) - datetime.datetime(2020, 1, 1)).total_seconds() / 86400
+    assert a['score'] == pytest.approx(3 + days / 30, abs=1e-5)
+    # no dated video: the first one read stays, and there is no recency
+    assert (b['name'], b['official'], b['last_video_at'], b['score']) == ('B', 0, None, 0.0)
+
+
+def test_rescore_bounds_recency(tmp_path):
+    chans = at_version(f"sqlite:///{tmp_path / 'leads.db'}", 5)
+    assert chans['UCa']['score'] == pytest.approx(3 + 1 - 10 / 90, abs=1e-3)
+    assert chans['UCb']['score'] == 0.0
@@ -0,0 +1,111 @@
+import asyncio
+import datetime
+import time
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from outbox import OutboxWorker, StubSender, enqueue, outbox
+from persist import async_url
+
+
+def run(url, test):
+    async def main():
+        engine = create_async_engine(async_url(url))
+        try:
+            return await test(engine)
+        finally:
+            await engine.dispose()
+    return asyncio.run(main())
+
+
+async def add(engine, n):
+    async with engine.begin() as cx:
+        await cx.run_sync(enqueue, [dict(id=f'm{i}', to_addr=f'a{i}@example.com', subject='s', body='b')
+                                    for i in range(n)])
+
+
+async def rows(engine):
+    async with engine.connect() as cx:
+        return {r.id: r for r in await cx.execute(sa.select(outbox))}
+
+
+async def drain(workers, sender, n, timeout=5.0):
+    for w in workers:
+        w.start()
+    deadline = time.monotonic() + timeout
+    while len(sender.sent) < n and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    # anything claimed twice would be sent by now; idle workers wait on the
+    # wake event (OUTBOX_POLL_SECONDS), so stopping them never cuts a query short
+    await asyncio.sleep(0.05)
+    for w in workers:
+        await w.stop()
+
+
+def test_each_message_is_claimed_and_sent_once(db_url):
+    async def test(engine):
+        await add(engine, 20)
+        sender = StubSender()
+        workers = [OutboxWorker(engine, sender, rate_seconds=0.001, burst=100) for _ in range(3)]
+        await drain(workers, sender, 20)
+        stored = await rows(engine)
+        assert sorted(s['to_addr'] for s in sender.sent) == sorted(f'a{i}@example.com' for i in range(20))
+        assert {r.status for r in stored.values()} == {'sent'}
+        assert {r.attempts for r in stored.values()} == {1}
+        assert sum(w.counts['sent'] for w in workers) == 20
+    run(db_url, test)
+
+
+def test_failures_retry_with_backoff(db_url):
+    async def test(engine):
+        await add(engine, 1)
+        sender = StubSender(fail_next=2)
+        w = OutboxWorker(engine, sender, rate_seconds=0.001, max_attempts=3, backoff_seconds=60)
+
+        async def due_in():
+            r = (await rows(engine))['m0']
+            assert (r.status, r.error) == ('queued', 'stub failure')
+            return (r.next_attempt_at - datetime.datetime.utcnow()).total_seconds()
+
+        async def make_due():
+            async with engine.begin() as cx:
+                await cx.execute(outbox.update().values(next_attempt_at=datetime.datetime.utcnow()))
+
+        assert await w.process_one()
+        first = await due_in()
+        assert 60 * 0.8 - 1 <= first <= 60 * 1.2
+        assert not await w.process_one()  # not due yet
+        await make_due()
+        assert await w.process_one()
+        assert 120 * 0.8 - 1 <= await due_in() <= 120 * 1.2  # doubled
+        await make_due()
+        assert await w.process_one()
+        r = (await rows(engine))['m0']
+        assert (r.status, r.attempts, len(sender.sent)) == ('sent', 3, 1)
+        assert w.counts == dict(sent=1, retried=2, failed=0)
+    run(db_url, test)
+
+
+def test_gives_up_after_max_attempts(db_url):
+    async def test(engine):
+        await add(engine, 1)
+        w = OutboxWorker(engine, StubSender(fail_next=5), rate_seconds=0.001, max_attempts=2, backoff_seconds=0)
+        assert await w.process_one()
+        assert await w.process_one()
+        r = (await rows(engine))['m0']
+        assert (r.status, r.attempts) == ('error', 2)
+        assert not await w.process_one()
+    run(db_url, test)
+
+
+def test_token_bucket_paces_sends(db_url):
+    async def test(engine):
+        await add(engine, 5)
+        sender = StubSender()
+        w = OutboxWorker(engine, sender, rate_seconds=0.1, burst=1)
+        await drain([w], sender, 5)
+        at = sorted(s['at'] for s in sender.sent)
+        assert len(at) == 5
+        assert min(b - a for a, b in zip(at, at[1:])) >= 0.09
+    run(db_url, test)
@@ -0,0 +1,124 @@
+import asyncio
+import datetime
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import persist
+from persist import async_url, encode_cursor, prospect_queries, prospects, read_page, upsert_prospects
+
+
+def run(url, test):
+    async def main():
+        engine = create_async_engine(async_url(url))
+        try:
+            return await test(engine)
+        finally:
+            await engine.dispose()
+    return asyncio.run(main())
+
+
+def prospect(i, **kw):
+    row = dict(id=f'v{i}', name=f'Artist {i}', platform='youtube', handle=f'@artist{i}', email=None, instagram=None,
+               subs=100 + i, last_video_at=f'2024-05-{1 + i % 28:02d}T12:00:00Z', video_title=f'Song {i}',
+               video_url=f'https://youtu.be/v{i}', channel_url=f'https://www.youtube.com/channel/UC{i}',
+               query_source='first')
+    row.update(kw)
+    return row
+
+
+async def upsert(engine, rows):
+    async with engine.begin() as cx:
+        return await cx.run_sync(upsert_prospects, rows)
+
+
+async def stored(engine):
+    async with engine.connect() as cx:
+        return {r['id']: r for r in (await cx.execute(sa.select(prospects))).mappings()}
+
+
+def test_upsert_inserts_then_updates_overlap(db_url, monkeypatch):
+    monkeypatch.setattr(persist, 'UPSERT_CHUNK', 4)  # several chunks per batch
+
+    async def test(engine):
+        assert await upsert(engine, [prospect(i) for i in range(10)]) == (10, 0)
+        first = await stored(engine)
+
+        second = [prospect(i, subs=5000 + i, email=f'a{i}@example.com', query_source='second',
+                           last_video_at='2024-06-01T00:00:00+02:00')
+                  for i in range(6, 16)]
+        assert await upsert(engine, second) == (6, 4)
+        after = await stored(engine)
+
+        assert len(after) == 16
+        for i in range(6, 10):
+            r = after[f'v{i}']
+            assert r['created_at'] == first[f'v{i}']['created_at']
+            assert (r['subs'], r['email'], r['query_source']) == (5000 + i, f'a{i}@example.com', 'second')
+            assert r['last_video_at'] == datetime.datetime(2024, 5, 31, 22, 0)
+        for i in range(6):
+            assert after[f'v{i}'] == first[f'v{i}']
+        assert all(after[f'v{i}']['created_at'] >= first['v0']['created_at'] for i in range(10, 16))
+    run(db_url, test)
+
+
+def test_upsert_duplicate_ids_in_one_batch(db_url):
+    async def test(engine):
+        rows = [prospect(1, subs=1), prospect(2), prospect(1, subs=2)]
+        assert await upsert(engine, rows) == (2, 0)
+        assert (await stored(engine))['v1']['subs'] == 2
+    run(db_url, test)
+
+
+def mixed_rows():
+    # shared timestamps so ids break ties, and NULL timestamps on ids that
+    # sort both above and below the dated ones
+    return [prospect(i, last_video_at=None if i % 3 == 0 else f'2024-05-{1 + i % 4:02d}T12:00:00Z',
+                     email=f'a{i}@example.com' if i % 2 else None)
+            for i in range(40)]
+
+
+async def page_through(engine, limit, **filters):
+    seen, cursor, pages = [], None, 0
+    async with engine.connect() as cx:
+        while True:
+            rows = await cx.run_sync(read_page, prospect_queries(cursor, **filters), limit + 1)
+            pages += 1
+            seen += [r.id for r in rows[:limit]]
+            if len(rows) <= limit:
+                return seen, pages
+            last = rows[limit - 1]
+            cursor = encode_cursor(last.last_video_at, last.id)
+
+
+@pytest.mark.parametrize('limit', [1, 4, 13, 26, 27, 100])
+def test_keyset_pages_cover_null_tail(db_url, limit):
+    async def test(engine):
+        await upsert(engine, mixed_rows())
+        rows = (await stored(engine)).values()
+        dated = sorted((r for r in rows if r['last_video_at']), key=lambda r: (r['last_video_at'], r['id']), reverse=True)
+        undated = sorted((r['id'] for r in rows if not r['last_video_at']), reverse=True)
+        expected = [r['id'] for r in dated] + undated
+
+        seen, pages = await page_through(engine, limit)
+        assert seen == expected
+        assert pages == max(1, -(-len(expected) // limit))
+
+        seen, _ = await page_through(engine, limit, has_email=True)
+        assert seen == [i for i in expected if int(i[1:]) % 2]
+    run(db_url, test)
+
+
+def test_keyset_phases_use_the_index(db_url):
+    async def test(engine):
+        await upsert(engine, mixed_rows())
+        ts_cursor = encode_cursor(datetime.datetime(2024, 5, 2, 12), 'v20')
+        null_cursor = encode_cursor(None, 'v20')
+        async with engine.connect() as cx:
+            for cursor in (None, ts_cursor, null_cursor):
+                for q in prospect_queries(cursor):
+                    sql = str(q.limit(5).compile(cx.sync_engine, compile_kwargs={'literal_binds': True}))
+                    plan = ' '.join(r[-1] for r in await cx.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}'))
+                    assert 'ix_prospects_recent' in plan and 'TEMP B-TREE' not in plan, plan
+    run(db_url, test)
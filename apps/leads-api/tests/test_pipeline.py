@@ -0,0 +1,70 @@
+"""/search end to end, offline: YouTube replayed from tests/fixtures/yt_replay.jsonl (see bench/bench_pipeline.py).
+
+The fixture is synthetic, written by ``bench_pipeline.write_fixture``; one
+recorded with YT_RECORD_PATH works the same, with its own expected counts.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'yt_replay.jsonl')
+QUERY = 'alt rnb new single'
+BODY = dict(queries=[QUERY], region_codes=['GB', 'US'], max_results_per_query=100,
+            min_subs=0, max_subs=10 ** 9, min_video_views=0)
+
+
+@pytest.fixture(scope='module')
+def main(tmp_path_factory):
+    # main reads its config on import, so only this module may import it
+    assert 'main' not in sys.modules
+    db = tmp_path_factory.mktemp('pipeline') / 'leads.db'
+    with pytest.MonkeyPatch.context() as mp:
+        for k, v in dict(DATABASE_URL=f'sqlite:///{db}', YT_API_KEY='replay', YT_REPLAY_PATH=FIXTURE,
+                         EMAIL_SENDER='stub').items():
+            mp.setenv(k, v)
+        mp.delenv('YT_RECORD_PATH', raising=False)
+        # other test modules may have imported replay (via youtube) already
+        import replay
+        mp.setattr(replay, 'YT_REPLAY_PATH', FIXTURE)
+        mp.setattr(replay, 'YT_RECORD_PATH', '')
+        import main
+        yield main
+
+
+def test_search_replays_fixture(main):
+    import httpx
+    import replay
+
+    async def run():
+        await main.migrate_db()  # ASGITransport doesn't run startup hooks
+        main.lang_gate.load()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url='http://test')
+        try:
+            first = await client.post('/search', json=BODY)
+            repeat = await client.post('/search', json=BODY)
+            recent = await client.get('/prospects', params=dict(limit=1000))
+            best = await client.get('/prospects', params=dict(limit=1000, order='score'))
+        finally:
+            await client.aclose()
+            await main.engine.dispose()
+        return first, repeat, recent.json(), best.json()
+
+    first, repeat, recent, best = asyncio.run(run())
+    assert replay._replay.misses == 0
+
+    found = first.json()
+    assert len(found) == 12
+    assert len({p['channel_url'] for p in found}) == 12
+    assert [p['score'] for p in found] == sorted((p['score'] for p in found), reverse=True)
+    assert (first.headers['X-Prospects-Inserted'], first.headers['X-Quota-Spent']) == ('12', '408')
+
+    # the repeat stops at stored videos; metadata comes from the cache
+    assert repeat.json() == []
+    assert (repeat.headers['X-Search-Known'], repeat.headers['X-Quota-Spent'], repeat.headers['X-Prospects-Inserted']) \
+        == ('9', '200', '0')
+
+    assert len(recent) == 12 and {p['query_source'] for p in recent} == {QUERY}
+    assert {p['channel_url'] for p in best} == {p['channel_url'] for p in found}
+    assert [p['score'] for p in best] == sorted((p['score'] for p in best), reverse=True)
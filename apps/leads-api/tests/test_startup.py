@@ -0,0 +1,34 @@
+"""Startup budget from bench/bench_startup.py as a test: fast ``import main``, SDKs left to first use."""
+import os
+import statistics
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+import bench_startup as bench  # noqa: E402
+
+RUNS = 3
+
+
+@pytest.fixture(scope='module')
+def imports(tmp_path_factory):
+    missing = str(tmp_path_factory.mktemp('startup') / 'missing')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(missing, 'leads.db')}")
+    return missing, [bench.import_once(env) for _ in range(RUNS)]
+
+
+def test_import_is_under_budget(imports):
+    _, runs = imports
+    median = statistics.median(r[0] for r in runs)
+    assert median <= bench.IMPORT_BUDGET_MS, f'import main: {median:.0f} ms, budget {bench.IMPORT_BUDGET_MS:.0f} ms'
+
+
+def test_sdks_stay_lazy(imports):
+    _, runs = imports
+    assert not set(bench.LAZY) & set().union(*(r[2] for r in runs))
+
+
+def test_import_does_not_open_the_db(imports):
+    missing, _ = imports
+    assert not os.path.exists(missing)
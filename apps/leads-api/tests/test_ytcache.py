@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import ytcache
+from persist import async_url
+from youtube import QuotaMeter
+from ytcache import MetadataCache
+
+SNIPPET_TTL, STATS_TTL = 1000, 100
+
+
+class FakeYouTube:
+    """Answers videos/channels calls from a version counter; records every call."""
+
+    def __init__(self):
+        self.meter = QuotaMeter()
+        self.calls = []
+        self.version = 1
+
+    async def get(self, endpoint, part, id):
+        ids = id.split(',')
+        self.calls.append((endpoint, part, ids))
+        stats = dict(viewCount=str(self.version * 100), subscriberCount=str(self.version))
+        if part == 'statistics':
+            return dict(items=[dict(id=i, statistics=stats) for i in ids])
+        return dict(items=[dict(id=i, snippet=dict(title=f'{i} v{self.version}'), statistics=stats) for i in ids])
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(ytcache.time, 'time', lambda: now[0])
+    return now
+
+
+def run(url, test):
+    async def main():
+        engine = create_async_engine(async_url(url)) if url else None
+        try:
+            return await test(engine)
+        finally:
+            if engine is not None:
+                await engine.dispose()
+    return asyncio.run(main())
+
+
+def cache(engine):
+    return MetadataCache(engine, snippet_ttl=SNIPPET_TTL, stats_ttl=STATS_TTL)
+
+
+def test_misses_are_batched(clock):
+    async def test(_):
+        c, yt = cache(None), FakeYouTube()
+        ids = [f'v{i}' for i in range(120)] + ['v3', '']
+        got = await c.lookup(yt, 'videos', ids)
+        assert list(got) == [f'v{i}' for i in range(120)]
+        assert [(e, p, len(chunk)) for e, p, chunk in yt.calls] == [('videos', ytcache.PARTS['videos'], n) for n in (50, 50, 20)]
+
+        yt.calls.clear()
+        await c.lookup(yt, 'videos', ['v5', 'v200', 'v6', 'v201'])
+        assert yt.calls == [('videos', ytcache.PARTS['videos'], ['v200', 'v201'])]
+        assert yt.meter.saved == 0  # 3 + 1 batches either way
+    run(None, test)
+
+
+def test_ttl_per_part(clock):
+    async def test(_):
+        c, yt = cache(None), FakeYouTube()
+        await c.lookup(yt, 'channels', ['UC1', 'UC2'])
+
+        clock[0] += STATS_TTL - 1
+        yt.version = 2
+        got = await c.lookup(yt, 'channels', ['UC1', 'UC2'])
+        assert len(yt.calls) == 1
+        assert got['UC1']['statistics']['subscriberCount'] == '1'
+        assert yt.meter.saved == 1
+
+        clock[0] += 1  # statistics stale, snippet fresh
+        got = await c.lookup(yt, 'channels', ['UC1', 'UC2'])
+        assert yt.calls[-1] == ('channels', 'statistics', ['UC1', 'UC2'])
+        assert got['UC1']['snippet']['title'] == 'UC1 v1'
+        assert got['UC1']['statistics']['subscriberCount'] == '2'
+
+        clock[0] += SNIPPET_TTL  # both stale: one full call covers them
+        yt.version = 3
+        got = await c.lookup(yt, 'channels', ['UC1'])
+        assert yt.calls[-1] == ('channels', ytcache.PARTS['channels'], ['UC1'])
+        assert got['UC1']['snippet']['title'] == 'UC1 v3'
+    run(None, test)
+
+
+def test_full_refetch_wins_within_a_batch(clock):
+    async def test(_):
+        c, yt = cache(None), FakeYouTube()
+        await c.lookup(yt, 'videos', ['a'])
+        clock[0] += STATS_TTL
+        await c.lookup(yt, 'videos', ['a', 'b'])  # a needs statistics, b everything
+        assert yt.calls[-1] == ('videos', ytcache.PARTS['videos'], ['a', 'b'])
+    run(None, test)
+
+
+def test_memory_then_db_fallthrough(db_url, clock):
+    async def test(engine):
+        yt = FakeYouTube()
+        first = await cache(engine).lookup(yt, 'videos', ['a', 'b'])
+        assert len(yt.calls) == 1
+
+        # a fresh process: empty memory tier, same table
+        c = cache(engine)
+        assert await c.lookup(yt, 'videos', ['a', 'b']) == first
+        assert len(yt.calls) == 1
+        assert set(c._lru) == {('videos', 'a'), ('videos', 'b')}
+
+        # stored times come back with the rows, so expiry still applies
+        clock[0] += STATS_TTL
+        c = cache(engine)
+        await c.lookup(yt, 'videos', ['a', 'b', 'c'])
+        assert yt.calls[-1] == ('videos', ytcache.PARTS['videos'], ['a', 'b', 'c'])
+
+        c.engine = None  # memory alone answers now
+        assert len(await c.lookup(yt, 'videos', ['a', 'b', 'c'])) == 3
+        assert len(yt.calls) == 2
+    run(db_url, test)
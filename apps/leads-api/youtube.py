@@ -0,0 +1,139 @@
+import asyncio
+import datetime
+import os
+from collections import Counter
+from typing import Dict, Optional
+
+import httpx
+
+from instrumentation import API_CALLS, REGISTRY, stage
+from replay import transport_from_env
+
+YT_BASE_URL = 'https://www.googleapis.com/youtube/v3'
+
+# total in-flight requests across all endpoints, plus a cap per endpoint
+YT_MAX_IN_FLIGHT = int(os.getenv('YT_MAX_IN_FLIGHT', '16'))
+YT_ENDPOINT_LIMITS = {
+    'search': int(os.getenv('YT_SEARCH_CONCURRENCY', '6')),
+    'videos': int(os.getenv('YT_VIDEOS_CONCURRENCY', '8')),
+    'channels': int(os.getenv('YT_CHANNELS_CONCURRENCY', '8')),
+}
+
+# Data API quota units per call (https://developers.google.com/youtube/v3/determine_quota_cost)
+QUOTA_COST = {'search': 100, 'videos': 1, 'channels': 1}
+YT_DAILY_QUOTA = int(os.getenv('YT_DAILY_QUOTA', '10000'))
+
+QUOTA_UNITS = REGISTRY.counter('youtube_quota_units_total', 'Data API quota units spent, and saved by caching',
+                               ('kind',))
+
+
+class QuotaMeter:
+    """Quota units spent on, and saved from, the Data API for one request."""
+
+    def __init__(self):
+        self.spent = 0
+        self.saved = 0
+        self.calls = Counter()
+
+    def charge(self, endpoint: str, calls: int = 1):
+        self.calls[endpoint] += calls
+        self.spent += QUOTA_COST.get(endpoint, 1) * calls
+        QUOTA_UNITS.inc(QUOTA_COST.get(endpoint, 1) * calls, kind='spent')
+
+    def credit(self, endpoint: str, calls: int):
+        self.saved += QUOTA_COST.get(endpoint, 1) * calls
+        QUOTA_UNITS.inc(QUOTA_COST.get(endpoint, 1) * calls, kind='saved')
+
+    def as_dict(self) -> dict:
+        return dict(spent=self.spent, saved=self.saved, calls=dict(self.calls))
+
+
+# running totals for the current UTC day (quota resets at midnight Pacific,
+# close enough for planning how many searches are left)
+_daily = dict(day=None, spent=0, saved=0, searches=0)
+
+
+def record_daily(meter: QuotaMeter):
+    today = datetime.datetime.utcnow().date().isoformat()
+    if _daily['day'] != today:
+        _daily.update(day=today, spent=0, saved=0, searches=0)
+    _daily['spent'] += meter.spent
+    _daily['saved'] += meter.saved
+    _daily['searches'] += 1
+
+
+def daily_usage() -> dict:
+    today = datetime.datetime.utcnow().date().isoformat()
+    usage = dict(_daily) if _daily['day'] == today else dict(day=today, spent=0, saved=0, searches=0)
+    usage['limit'] = YT_DAILY_QUOTA
+    usage['remaining'] = max(0, YT_DAILY_QUOTA - usage['spent'])
+    if usage['searches']:
+        per_search = usage['spent'] / usage['searches']
+        usage['avg_units_per_search'] = round(per_search, 1)
+        usage['searches_affordable'] = int(usage['remaining'] // per_search) if per_search else None
+    return usage
+
+
+class YouTubeClient:
+    """Shared HTTP/2 client for the Data API with bounded concurrency.
+
+    One instance is opened per /search call. Every request first takes a slot
+    from the global in-flight semaphore and then one from its endpoint's own
+    semaphore, so a burst of (query, region) tasks can't exceed either cap.
+    """
+
+    def __init__(self, api_key: str, max_in_flight: int = YT_MAX_IN_FLIGHT,
+                 endpoint_limits: Optional[Dict[str, int]] = None, timeout: float = 20,
+                 meter: Optional[QuotaMeter] = None):
+        self.api_key = api_key
+        self.meter = meter or QuotaMeter()
+        self.timeout = timeout
+        limits = dict(YT_ENDPOINT_LIMITS, **(endpoint_limits or {}))
+        self._in_flight = asyncio.Semaphore(max(1, max_in_flight))
+        self._endpoint = {name: asyncio.Semaphore(max(1, n)) for name, n in limits.items()}
+        self._max_connections = max(1, max_in_flight)
+        self._http: Optional[httpx.AsyncClient] = None
+
+    async def __aenter__(self):
+        limits = httpx.Limits(max_connections=self._max_connections,
+                              max_keepalive_connections=self._max_connections)
+        self._http = httpx.AsyncClient(
+            base_url=YT_BASE_URL,
+            http2=True,
+            timeout=self.timeout,
+            limits=limits,
+            transport=transport_from_env(limits),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._http.aclose()
+        self._http = None
+
+    async def get(self, endpoint: str, **params) -> dict:
+        params['key'] = self.api_key
+        sem = self._endpoint.setdefault(endpoint, asyncio.Semaphore(1))
+        async with self._in_flight, sem:
+            with stage('fetch'):
+                r = await self._http.get(f'/{endpoint}', params=params)
+        self.meter.charge(endpoint)
+        API_CALLS.inc(api='youtube', endpoint=endpoint, result=r.status_code)
+        r.raise_for_status()
+        return r.json()
+
+
+async def gather_ordered(coros):
+    """Run coroutines concurrently and return their results in input order.
+
+    Unlike a bare ``asyncio.gather`` the remaining tasks are cancelled as soon
+    as one fails, so an HTTP error doesn't leave requests running against a
+    client that is about to be closed.
+    """
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
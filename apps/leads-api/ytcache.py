@@ -0,0 +1,159 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from instrumentation import CACHE_LOOKUPS, count_error
+from youtube import YouTubeClient
+
+# snippet/branding barely changes; subscriber and view counts drift daily
+YT_CACHE_SNIPPET_TTL = int(os.getenv('YT_CACHE_SNIPPET_TTL', str(7 * 86400)))
+YT_CACHE_STATS_TTL = int(os.getenv('YT_CACHE_STATS_TTL', str(6 * 3600)))
+YT_CACHE_LRU_SIZE = int(os.getenv('YT_CACHE_LRU_SIZE', '20000'))
+
+YT_BATCH_SIZE = 50  # max ids per videos/channels call
+
+PARTS = {
+    'videos': 'snippet,statistics',
+    'channels': 'snippet,statistics,brandingSettings',
+}
+PARTS_FULL = 'full'
+
+
+def _batches(ids: List[str], n: int = YT_BATCH_SIZE) -> Iterable[List[str]]:
+    for i in range(0, len(ids), n):
+        yield ids[i:i + n]
+
+
+class _Entry:
+    __slots__ = ('item', 'snippet_at', 'stats_at')
+
+    def __init__(self, item: dict, snippet_at: float, stats_at: float):
+        self.item = item
+        self.snippet_at = snippet_at
+        self.stats_at = stats_at
+
+
+class MetadataCache:
+    """Two-tier cache for videos/channels metadata keyed by YouTube id.
+
+    Tier one is an in-process LRU, tier two the ``yt_meta_cache`` table in the
+    leads DB so entries survive restarts and are shared between workers. The
+    snippet and statistics parts of an item expire independently; when only
+    statistics are stale the refetch asks for ``part=statistics`` alone.
+    """
+
+    def __init__(self, engine, lru_size: int = YT_CACHE_LRU_SIZE,
+                 snippet_ttl: int = YT_CACHE_SNIPPET_TTL, stats_ttl: int = YT_CACHE_STATS_TTL):
+        self.engine = engine
+        self.lru_size = lru_size
+        self.snippet_ttl = snippet_ttl
+        self.stats_ttl = stats_ttl
+        self._lru: 'OrderedDict[Tuple[str, str], _Entry]' = OrderedDict()
+
+    # -- tier one --
+    def _lru_get(self, kind: str, key: str) -> Optional[_Entry]:
+        e = self._lru.get((kind, key))
+        if e is not None:
+            self._lru.move_to_end((kind, key))
+        return e
+
+    def _lru_put(self, kind: str, key: str, e: _Entry):
+        self._lru[(kind, key)] = e
+        self._lru.move_to_end((kind, key))
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    # -- tier two --
+    async def _db_load(self, kind: str, ids: List[str]) -> Dict[str, _Entry]:
+        if not self.engine or not ids:
+            return {}
+        found = {}
+        try:
+            async with self.engine.connect() as cx:
+                for chunk in _batches(ids, 500):
+                    params = {f'i{n}': v for n, v in enumerate(chunk)}
+                    ph = ','.join(f':i{n}' for n in range(len(chunk)))
+                    rows = (await cx.execute(text(f'SELECT id, snippet_json, stats_json, snippet_at, stats_at FROM yt_meta_cache WHERE kind=:kind AND id IN ({ph})'),
+                                             dict(params, kind=kind))).all()
+                    for rid, snippet_json, stats_json, snippet_at, stats_at in rows:
+                        item = json.loads(snippet_json)
+                        item['statistics'] = json.loads(stats_json) if stats_json else {}
+                        found[rid] = _Entry(item, snippet_at or 0.0, stats_at or 0.0)
+        except Exception as db_err:
+            count_error('yt_cache_load_error')
+            print('yt_cache_load_error', repr(db_err))
+        return found
+
+    async def _db_store(self, kind: str, entries: Dict[str, _Entry]):
+        if not self.engine or not entries:
+            return
+        rows = []
+        for key, e in entries.items():
+            snippet = {k: v for k, v in e.item.items() if k != 'statistics'}
+            rows.append(dict(kind=kind, id=key, sj=json.dumps(snippet), tj=json.dumps(e.item.get('statistics', {})),
+                             sa=e.snippet_at, ta=e.stats_at))
+        try:
+            async with self.engine.begin() as cx:
+                await cx.execute(text('''INSERT INTO yt_meta_cache (kind, id, snippet_json, stats_json, snippet_at, stats_at)
+                                         VALUES (:kind, :id, :sj, :tj, :sa, :ta)
+                                         ON CONFLICT (kind, id) DO UPDATE SET snippet_json=excluded.snippet_json,
+                                           stats_json=excluded.stats_json, snippet_at=excluded.snippet_at, stats_at=excluded.stats_at'''),
+                                 rows)
+        except Exception as db_err:
+            count_error('yt_cache_store_error')
+            print('yt_cache_store_error', repr(db_err))
+
+    def _stale(self, e: Optional[_Entry], now: float) -> Optional[str]:
+        """None if fresh, else the part that needs refetching."""
+        if e is None or now - e.snippet_at >= self.snippet_ttl:
+            return PARTS_FULL
+        if now - e.stats_at >= self.stats_ttl:
+            return 'statistics'
+        return None
+
+    async def lookup(self, yt: YouTubeClient, kind: str, ids: List[str]) -> Dict[str, dict]:
+        """Return ``{id: item}`` for ``ids``, calling the API only for what's missing or stale."""
+        ids = list(dict.fromkeys(i for i in ids if i))
+        now = time.time()
+        entries: Dict[str, _Entry] = {}
+        pending: List[str] = []
+        for key in ids:
+            e = self._lru_get(kind, key)
+            if e is not None:
+                entries[key] = e
+            else:
+                pending.append(key)
+        for key, e in (await self._db_load(kind, pending)).items():
+            entries[key] = e
+            self._lru_put(kind, key, e)
+
+        need = {key: self._stale(entries.get(key), now) for key in ids}
+        stale = [key for key in ids if need[key]]
+        CACHE_LOOKUPS.inc(len(ids) - len(stale), cache=f'yt_{kind}', result='hit')
+        CACHE_LOOKUPS.inc(len(stale), cache=f'yt_{kind}', result='miss')
+
+        calls = 0
+        refreshed: Dict[str, _Entry] = {}
+        for chunk in _batches(stale):
+            full = any(need[key] == PARTS_FULL for key in chunk)
+            data = await yt.get(kind, part=PARTS[kind] if full else 'statistics', id=','.join(chunk))
+            calls += 1
+            for it in data.get('items', []):
+                key = it['id']
+                if full:
+                    e = _Entry(it, now, now)
+                else:
+                    old = entries[key]
+                    e = _Entry(dict(old.item, statistics=it.get('statistics', {})), old.snippet_at, now)
+                entries[key] = refreshed[key] = e
+                self._lru_put(kind, key, e)
+
+        # without the cache every batch of ids would have been one call
+        yt.meter.credit(kind, -(-len(ids) // YT_BATCH_SIZE) - calls)
+        await self._db_store(kind, refreshed)
+        return {key: entries[key].item for key in ids if key in entries}
+
@@ -26,7 +26,10 @@ export default function Page(){
     setLoading(true);
     const body = { queries: queries.split('\n').map(s=>s.trim()).filter(Boolean), days_back: days, min_subs: minSubs, max_subs: maxSubs, max_results_per_query: 60 };
     const r = await fetch(`${API.replace(/\/$/,'')}/search`, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(body) });
-    const data = await r.json(); setRows(data); setLoading(false);
+    // repeat searches only return videos not seen before: keep the earlier rows below them
+    const data: Prospect[] = await r.json();
+    setRows(prev => [...data, ...prev.filter(p => !data.some(d => d.video_url === p.video_url))]);
+    setLoading(false);
   }
 
   async function compose(p: Prospect, ch: 'email'|'ig'){
@@ -42,7 +45,7 @@ export default function Page(){
     setSending(true);
     const r = await fetch(`${API.replace(/\/$/,'')}/send-email`, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({ to_email: p.email, subject, body: message }) });
     setSending(false);
-    if(r.ok){ alert('Sent'); } else { const t = await r.text(); alert('Send failed: ' + t); }
+    if(r.ok){ alert('Queued — sends at the configured rate'); } else { const t = await r.text(); alert('Send failed: ' + t); }
   }
 
   return (
@@ -0,0 +1,285 @@
+import math
+import os
+import struct
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal
+
+BLOCK_SECONDS = 10  # frames decoded and filtered per step; bounds memory
+TP_OVERSAMPLE = 4
+TP_TAPS_PER_PHASE = 12
+BOUND_SLACK = 1 - 1e-5  # float32 rounding in the window bounds
+PEAK_FIRST_SHARE = 0.9  # windows bounded this close to the block's largest bound are interpolated first
+ABS_GATE_LUFS = -70.0
+REL_GATE_LU = -10.0
+SILENCE_DB = -120.0
+
+
+class WavInfo(NamedTuple):
+    rate: int
+    channels: int
+    bits: int
+    is_float: bool
+    frames: int
+    data: np.memmap  # raw sample bytes, (frames, channels, bytes per sample) for 24-bit
+
+
+def open_wav(path: str) -> WavInfo:
+    """Map the data chunk of a PCM/float WAV without reading it into memory."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(12)
+        if len(head) < 12 or head[:4] not in (b'RIFF', b'RF64') or head[8:12] != b'WAVE':
+            raise ValueError('not a WAV file')
+        fmt = None
+        pos = 12
+        while pos + 8 <= size:
+            f.seek(pos)
+            cid, csize = struct.unpack('<4sI', f.read(8))
+            if cid == b'fmt ':
+                raw = f.read(min(csize, 40))
+                tag, channels, rate, _, _, bits = struct.unpack('<HHIIHH', raw[:16])
+                if tag == 0xFFFE and len(raw) >= 26:
+                    tag = struct.unpack('<H', raw[24:26])[0]  # first two bytes of the subformat GUID
+                fmt = (tag, channels, rate, bits)
+            elif cid == b'data':
+                if fmt is None:
+                    raise ValueError('WAV data chunk before fmt chunk')
+                start = pos + 8
+                end = size if csize == 0xFFFFFFFF else min(size, start + csize)  # streaming/RF64 writers
+                break
+            pos += 8 + csize + (csize & 1)
+        else:
+            raise ValueError('WAV data chunk not found')
+    tag, channels, rate, bits = fmt
+    if tag not in (1, 3) or not channels or not rate:
+        raise ValueError(f'unsupported WAV format tag {tag}')
+    width = bits // 8
+    frames = (end - start) // (width * channels)
+    if frames == 0:
+        data = np.zeros((0, channels, width), dtype=np.uint8)
+    elif tag == 3:
+        dtype = {4: '<f4', 8: '<f8'}[width]
+        data = np.memmap(path, dtype=dtype, mode='r', offset=start, shape=(frames, channels))
+    elif width == 3:
+        data = np.memmap(path, dtype=np.uint8, mode='r', offset=start, shape=(frames, channels, 3))
+    else:
+        dtype = {1: 'u1', 2: '<i2', 4: '<i4'}[width]
+        data = np.memmap(path, dtype=dtype, mode='r', offset=start, shape=(frames, channels))
+    return WavInfo(rate, channels, bits, tag == 3, frames, data)
+
+
+def to_float(raw: np.ndarray, bits: int, is_float: bool) -> np.ndarray:
+    """Decode a slice of raw samples to float64 in [-1, 1)."""
+    if is_float:
+        return raw.astype(np.float64)
+    if bits == 24:
+        # place the 3 bytes in the top of an int32 so the shift sign-extends
+        wide = np.zeros(raw.shape[:-1] + (4,), dtype=np.uint8)
+        wide[..., 1:] = raw
+        return (wide.view('<i4')[..., 0] >> 8) * (1.0 / (1 << 23))
+    if bits == 8:
+        return (raw.astype(np.float64) - 128.0) * (1.0 / 128)
+    return raw * (1.0 / (1 << (bits - 1)))
+
+
+def k_weighting(rate: int) -> np.ndarray:
+    """BS.1770 K-weighting (high shelf + RLB high-pass) as second-order sections at ``rate``."""
+    # pre-filter shelf
+    f0, g, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = math.tan(math.pi * f0 / rate)
+    vh = 10 ** (g / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+             1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    # RLB high-pass
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = math.tan(math.pi * f0 / rate)
+    a0 = 1 + k / q + k * k
+    hp = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    return np.array([shelf, hp])
+
+
+def channel_weights(channels: int) -> np.ndarray:
+    if channels == 6:  # L R C LFE Ls Rs
+        return np.array([1.0, 1.0, 1.0, 0.0, 1.41, 1.41])
+    return np.ones(channels)
+
+
+def _db(x: float) -> float:
+    return round(20 * math.log10(x), 2) if x > 0 else SILENCE_DB
+
+
+def integrated_loudness(segments: np.ndarray, weights: np.ndarray) -> Optional[float]:
+    """Gated loudness from per-channel mean squares of consecutive 100 ms segments.
+
+    Gating blocks are 400 ms with 75% overlap, i.e. four segments each.
+    """
+    if len(segments) < 4:
+        return None
+    c = np.cumsum(np.vstack([np.zeros((1, segments.shape[1])), segments]), axis=0)
+    z = (c[4:] - c[:-4]) / 4  # mean square per block per channel
+    power = z @ weights
+    with np.errstate(divide='ignore'):
+        loud = -0.691 + 10 * np.log10(power)
+    gated = power[loud > ABS_GATE_LUFS]
+    if not len(gated):
+        return None
+    rel = -0.691 + 10 * np.log10(gated.mean()) + REL_GATE_LU
+    gated = power[(loud > ABS_GATE_LUFS) & (loud > rel)]
+    return round(float(-0.691 + 10 * np.log10(gated.mean())), 2)
+
+
+class LoudnessMeter:
+    """Integrated loudness over audio fed block by block (any block sizes)."""
+
+    def __init__(self, rate: int, channels: int):
+        self.channels = channels
+        self.seg = max(1, round(rate * 0.1))
+        self.sos = k_weighting(rate)
+        self.zi = np.zeros((self.sos.shape[0], 2, channels))
+        self.carry = np.zeros((0, channels))  # K-weighted samples short of a full segment
+        self.segments = []
+
+    def feed(self, x: np.ndarray):
+        y, self.zi = signal.sosfilt(self.sos, x, axis=0, zi=self.zi)
+        y = np.vstack([self.carry, y]) if len(self.carry) else y
+        n = len(y) // self.seg * self.seg
+        self.segments.append((y[:n] ** 2).reshape(-1, self.seg, self.channels).mean(axis=1))
+        self.carry = y[n:]
+
+    def integrated(self) -> Optional[float]:
+        segs = np.vstack(self.segments) if self.segments else np.zeros((0, self.channels))
+        return integrated_loudness(segs, channel_weights(self.channels))
+
+
+def analyze(path: str) -> dict:
+    """Integrated LUFS, true peak, sample peak, RMS and crest factor of a WAV.
+
+    The file is memory-mapped and processed ``BLOCK_SECONDS`` at a time;
+    filter state and the true-peak interpolation context carry across
+    blocks so the result doesn't depend on the block size.
+    """
+    wav = open_wav(path)
+    rate, ch = wav.rate, wav.channels
+    block = block_frames(rate)
+    meter = LoudnessMeter(rate, ch)
+    phases = interpolator()
+    ctx = TP_TAPS_PER_PHASE - 1  # history each interpolated sample depends on
+    tail = np.zeros((ctx, ch))
+    sum_sq = 0.0
+    peak = true_peak = 0.0
+
+    for start in range(0, wav.frames, block):
+        x = to_float(wav.data[start:start + block], wav.bits, wav.is_float)
+        peak = max(peak, float(np.abs(x).max()))
+        true_peak = max(true_peak, peak)
+        sum_sq += float(np.einsum('ij,ij->', x, x))
+        meter.feed(x)
+        ext = np.vstack([tail, x])
+        true_peak = max(true_peak, _interp_peak(ext, phases, true_peak))
+        tail = ext[-ctx:]
+    if wav.frames:
+        true_peak = max(true_peak, _interp_peak(np.vstack([tail, np.zeros((ctx, ch))]), phases, true_peak))
+
+    rms = math.sqrt(sum_sq / (wav.frames * ch)) if wav.frames else 0.0
+    return {
+        'lufs': meter.integrated(),
+        'true_peak': _db(true_peak),
+        'sample_peak': _db(peak),
+        'rms': _db(rms),
+        'crest': round(_db(peak) - _db(rms), 2) if rms > 0 else None,
+        'duration': round(wav.frames / rate, 3),
+        'sample_rate': rate,
+        'channels': ch,
+        'bits': wav.bits,
+    }
+
+
+def block_frames(rate: int) -> int:
+    """Frames per processing block: BLOCK_SECONDS, a whole number of 100 ms segments."""
+    return max(1, round(rate * 0.1)) * BLOCK_SECONDS * 10
+
+
+def interpolator() -> np.ndarray:
+    """Polyphase FIR for TP_OVERSAMPLE x interpolation, one column per phase.
+
+    ``windows @ phases`` gives the interpolated values between samples, where
+    each window is TP_TAPS_PER_PHASE consecutive input samples.
+    """
+    taps = signal.firwin(TP_OVERSAMPLE * TP_TAPS_PER_PHASE, 1.0 / TP_OVERSAMPLE) * TP_OVERSAMPLE
+    return np.stack([taps[p::TP_OVERSAMPLE][::-1] for p in range(TP_OVERSAMPLE)], axis=1)
+
+
+def _hot_windows(x32: np.ndarray, phases: np.ndarray, floor: float) -> Optional[np.ndarray]:
+    """Windows holding a sample that could interpolate above ``floor``, or None when that's most of them.
+
+    An interpolated value is at most the phase's L1 norm times the largest
+    |sample| in its window, so only windows around samples above
+    ``floor / gain`` can reach it.
+    """
+    k = phases.shape[0]
+    n = len(x32) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.intp)
+    hot = np.flatnonzero(np.abs(x32) * float(np.abs(phases).sum(axis=0).max()) > floor)
+    if len(hot) * k >= n // 2:
+        return None
+    idx = (hot[:, None] - np.arange(k)).ravel()
+    mark = np.zeros(n, dtype=bool)
+    mark[idx[(idx >= 0) & (idx < n)]] = True
+    return np.flatnonzero(mark)
+
+
+def _window_bounds(x32: np.ndarray, phases: np.ndarray) -> np.ndarray:
+    """Upper bound on each window's interpolated peak: |samples| weighted by the largest |coefficient| per tap."""
+    return np.correlate(np.abs(x32), np.abs(phases).max(axis=1).astype(np.float32), 'valid')
+
+
+def _window_peaks(x32: np.ndarray, phases: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    windows = sliding_window_view(x32, phases.shape[0])[idx]
+    # (phases, windows) so the max over phases runs along contiguous rows
+    return np.abs(phases.T.astype(np.float32) @ windows.T).max(axis=0)
+
+
+def interpolate_hot(xc: np.ndarray, phases: np.ndarray, floor: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Interpolated peaks of the windows of ``xc`` that could exceed ``floor``.
+
+    On dynamic material few samples come near ``floor`` and only the
+    windows around them are computed. Dense (limited) material has them
+    everywhere; there each window is bounded by its own |samples| instead
+    of its peak, which still leaves most windows out.
+    Returns (window start indices, max |interpolated value| per window).
+    """
+    x32 = xc.astype(np.float32, copy=False)
+    idx = _hot_windows(x32, phases, floor)
+    if idx is None:
+        idx = np.flatnonzero(_window_bounds(x32, phases) > floor * BOUND_SLACK)
+    if not len(idx):
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float32)
+    return idx, _window_peaks(x32, phases, idx)
+
+
+def _interp_peak(x: np.ndarray, phases: np.ndarray, floor: float) -> float:
+    """Max |interpolated sample| of ``x``, or ``floor`` if nothing exceeds it.
+
+    For dense blocks the windows with the largest bounds are interpolated
+    first; their peak raises the floor past most of the other bounds.
+    """
+    best = floor
+    for c in range(x.shape[1]):
+        x32 = np.ascontiguousarray(x[:, c], dtype=np.float32)
+        idx = _hot_windows(x32, phases, best)
+        if idx is None:
+            bound = _window_bounds(x32, phases)
+            cut = max(best, float(bound.max()) * PEAK_FIRST_SHARE)
+            first = np.flatnonzero(bound >= cut)
+            if len(first):
+                best = max(best, float(_window_peaks(x32, phases, first).max()))
+            idx = np.flatnonzero((bound > best * BOUND_SLACK) & (bound < cut))
+        if len(idx):
+            best = max(best, float(_window_peaks(x32, phases, idx).max()))
+    return best
@@ -0,0 +1,81 @@
+"""Benchmark for the loudness / true-peak analysis engine.
+
+    python bench/bench_analysis.py [--minutes 5] [--rate 48000]
+
+Writes synthetic WAVs to a temp dir and analyzes each one: the sine cases
+checked in tests/test_analysis.py, plain noise, and clipped noise where
+samples near the true peak are everywhere. Peak memory is traced to show
+it stays bounded by the block size rather than the file length.
+"""
+import argparse
+import os
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from analysis import analyze  # noqa: E402
+
+
+def write_wav(path: str, x: np.ndarray, rate: int, bits: int = 24):
+    """Write float samples in [-1, 1] as PCM (16/24-bit) or 32-bit float."""
+    x = x.reshape(len(x), -1)
+    ch = x.shape[1]
+    if bits == 32:
+        data, tag = x.astype('<f4').tobytes(), 3
+    else:
+        v = np.round(np.clip(x, -1, 1 - 2.0 ** (1 - bits)) * 2 ** (bits - 1)).astype('<i4')
+        data = (v.view(np.uint8).reshape(-1, 4)[:, :3] if bits == 24 else v.astype('<i2')).tobytes()
+        tag = 1
+    width = bits // 8
+    fmt = struct.pack('<HHIIHH', tag, ch, rate, rate * ch * width, ch * width, bits)
+    with open(path, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', 4 + 8 + len(fmt) + 8 + len(data)) + b'WAVE')
+        f.write(b'fmt ' + struct.pack('<I', len(fmt)) + fmt)
+        f.write(b'data' + struct.pack('<I', len(data)) + data)
+
+
+def cases(minutes: float, rate: int):
+    rng = np.random.default_rng(0)
+    t = np.arange(rate * 20) / rate
+    tone = np.sin(2 * np.pi * 997 * t)
+    yield 'tone 997Hz mono 0dBFS', tone, 24
+    yield 'tone 997Hz stereo 0dBFS', np.stack([tone, tone], 1), 24
+    q = 0.5 * np.sin(2 * np.pi * np.arange(rate * 5) / 4 + np.pi / 4)
+    yield 'fs/4 sine 45deg -6dBFS', np.stack([q, q], 1), 32
+    n = int(rate * 60 * minutes)
+    noise = rng.standard_normal((n, 2)) * 0.1
+    yield f'noise {minutes:g}min stereo', noise, 24
+    yield f'clipped noise {minutes:g}min', np.clip(noise * 5, -0.9, 0.9), 24
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--minutes', type=float, default=5)
+    ap.add_argument('--rate', type=int, default=48000)
+    args = ap.parse_args()
+
+    print(f'{"case":<26} {"bits":>4} {"LUFS":>7} {"TP":>6} {"peak":>6} {"crest":>6} {"secs":>6} {"x rt":>6} {"MB":>6}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, x, bits in cases(args.minutes, args.rate):
+            path = os.path.join(tmp, 'case.wav')
+            write_wav(path, x, args.rate, bits)
+            duration = len(x) / args.rate
+            del x
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            m = analyze(path)
+            secs = time.perf_counter() - t0
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+            print(f'{name:<26} {bits:>4} {m["lufs"]:>7} {m["true_peak"]:>6} {m["sample_peak"]:>6} {m["crest"]:>6} '
+                  f'{secs:>6.2f} {duration / secs:>6.0f} {peak_mb:>6.1f}')
+
+
+if __name__ == '__main__':
+    main()
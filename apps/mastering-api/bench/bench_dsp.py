@@ -0,0 +1,65 @@
+"""Benchmark: built-in mastering chain vs the copy baseline, per minute of audio.
+
+    python bench/bench_dsp.py [--minutes 5] [--threads 1,4] [--preset club]
+
+Renders a synthetic 24-bit stereo mix (tone + noise with slow level swings)
+with the copy engine (what jobs did without a CLI) and with the built-in
+chain at each thread count. Reports wall-clock seconds of the render alone
+per minute of audio, then the output's measured loudness / true peak.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import dsp  # noqa: E402
+from analysis import analyze  # noqa: E402
+from bench_analysis import write_wav  # noqa: E402
+
+
+def make_mix(minutes: float, rate: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    t = np.arange(int(rate * 60 * minutes)) / rate
+    level = 1 + 0.8 * np.sin(2 * np.pi * 0.2 * t)
+    tone = 0.2 * np.sin(2 * np.pi * 110 * t) * level
+    return tone[:, None] + rng.standard_normal((len(t), 2)) * 0.05 * level[:, None]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--minutes', type=float, default=5)
+    ap.add_argument('--rate', type=int, default=48000)
+    ap.add_argument('--threads', default=f'1,{os.cpu_count() or 1}')
+    ap.add_argument('--preset', default='club')
+    ap.add_argument('--lufs', type=float, default=-9.0)
+    ap.add_argument('--tp', type=float, default=-1.0)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src, dst = os.path.join(tmp, 'in.wav'), os.path.join(tmp, 'out.wav')
+        write_wav(src, make_mix(args.minutes, args.rate), args.rate, 24)
+        print(f'{args.minutes:g} min 24-bit stereo @ {args.rate} Hz, preset {args.preset}, '
+              f'target {args.lufs} LUFS / {args.tp} dBTP, {os.cpu_count()} cores')
+        print(f'{"engine":<16} {"secs":>6} {"s/min":>6} {"LUFS":>7} {"TP":>6} {"GR dB":>6}')
+        for threads in [0] + [int(n) for n in args.threads.split(',')]:
+            label = f'builtin x{threads}' if threads else 'copy'
+            t0 = time.perf_counter()
+            if threads:
+                info = dsp.render(src, dst, args.lufs, args.tp, args.preset, threads=threads)
+            else:
+                shutil.copyfile(src, dst)
+                info = {}
+            secs = time.perf_counter() - t0
+            m = analyze(dst)
+            print(f'{label:<16} {secs:>6.2f} {secs / args.minutes:>6.2f} {m["lufs"]:>7} {m["true_peak"]:>6} '
+                  f'{info.get("limiter_max_reduction_db", 0) or 0:>6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import os
+from typing import Dict, Optional
+
+import sqlalchemy as sa
+
+metadata = sa.MetaData()
+
+# mirrors the CREATE TABLE in migrations.py
+jobs = sa.Table(
+    'jobs', metadata,
+    sa.Column('id', sa.Text, primary_key=True),
+    sa.Column('status', sa.Text, nullable=False),
+    sa.Column('created_at', sa.DateTime, nullable=False),
+    sa.Column('started_at', sa.DateTime),
+    sa.Column('finished_at', sa.DateTime),
+    sa.Column('preset', sa.Text),
+    sa.Column('target_lufs', sa.Float),
+    sa.Column('true_peak', sa.Float),
+    sa.Column('input_path', sa.Text),
+    sa.Column('output_path', sa.Text),
+    sa.Column('metrics_json', sa.Text),
+    sa.Column('input_sha256', sa.Text),
+    sa.Column('input_bytes', sa.BigInteger),
+    sa.Column('last_access_at', sa.DateTime),
+    sa.Column('disk_bytes', sa.BigInteger),
+)
+
+# columns added to the original jobs table
+JOB_COLUMNS = {'started_at': 'TIMESTAMP', 'input_sha256': 'TEXT', 'input_bytes': 'BIGINT',
+               'last_access_at': 'TIMESTAMP', 'disk_bytes': 'BIGINT'}
+JOB_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS ix_jobs_status_created ON jobs (status, created_at)',
+    'CREATE INDEX IF NOT EXISTS ix_jobs_dedup ON jobs (input_sha256, preset, target_lufs, true_peak)',
+    'CREATE INDEX IF NOT EXISTS ix_jobs_finished ON jobs (status, finished_at)',
+]
+
+# a job with the same input and settings in one of these states can be reused
+REUSABLE_STATUSES = ('done', 'running', 'queued')
+
+
+def ensure_columns(cx, table: str, columns: Dict[str, str]):
+    """Add columns introduced after ``table`` was first created (``{name: sql type}``)."""
+    have = {c['name'] for c in sa.inspect(cx).get_columns(table)}
+    for name, ddl in columns.items():
+        if name not in have:
+            cx.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}')
+
+
+# matching slack for the float settings; far below any step a user would pick
+SETTING_TOLERANCE = 1e-4
+
+
+def find_reusable(cx, sha256: str, preset: str, target_lufs: float, true_peak: float) -> Optional[sa.Row]:
+    """Latest job for the same input bytes and settings that finished or will finish.
+
+    A finished job only counts while its output file is still on disk.
+    """
+    c = jobs.c
+    rows = cx.execute(sa.select(c.id, c.status, c.output_path)
+                      .where(c.input_sha256 == sha256, c.preset == preset,
+                             # REAL is float4 on Postgres: -14.3 comes back as -14.30000019, so no ==
+                             sa.func.abs(c.target_lufs - target_lufs) < SETTING_TOLERANCE,
+                             sa.func.abs(c.true_peak - true_peak) < SETTING_TOLERANCE,
+                             c.status.in_(REUSABLE_STATUSES))
+                      .order_by(c.created_at.desc()).limit(5)).all()
+    for row in rows:
+        if row.status != 'done' or (row.output_path and os.path.exists(row.output_path)):
+            return row
+    return None
@@ -0,0 +1,184 @@
+import asyncio
+import importlib.util
+import os
+import re
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterator, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+# Optional deps; soundfile (with numpy) is imported on first use or PreviewRenderer.warm
+SOUNDFILE_AVAILABLE = importlib.util.find_spec('soundfile') is not None
+
+READ_CHUNK_BYTES = 256 * 1024
+RESULT_CACHE_CONTROL = os.getenv('RESULT_CACHE_CONTROL', 'private, max-age=3600')
+PREVIEW_BLOCK_FRAMES = 1 << 16
+
+# format -> (soundfile format, subtype, file name, media type)
+PREVIEW_FORMATS = {
+    'ogg': ('OGG', 'VORBIS', 'preview.ogg', 'audio/ogg'),
+    'flac': ('FLAC', 'PCM_16', 'preview.flac', 'audio/flac'),
+    'mp3': ('MP3', 'MPEG_LAYER_III', 'preview.mp3', 'audio/mpeg'),
+}
+
+_RANGE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+class PathCache:
+    """LRU of job id -> file path for finished jobs (their outputs never change)."""
+
+    def __init__(self, size: int = 4096):
+        self.size = size
+        self._paths: 'OrderedDict[str, str]' = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._paths.get(key)
+        if path is not None:
+            self._paths.move_to_end(key)
+        return path
+
+    def put(self, key: str, path: str):
+        self._paths[key] = path
+        self._paths.move_to_end(key)
+        while len(self._paths) > self.size:
+            self._paths.popitem(last=False)
+
+    def drop(self, key: str):
+        self._paths.pop(key, None)
+
+
+def _validators(st: os.stat_result) -> Tuple[str, str]:
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    return etag, formatdate(st.st_mtime, usegmt=True)
+
+
+def _not_modified(request: Request, etag: str, st: os.stat_result) -> bool:
+    inm = request.headers.get('if-none-match')
+    if inm is not None:
+        return inm.strip() == '*' or etag in [t.strip().removeprefix('W/') for t in inm.split(',')]
+    ims = request.headers.get('if-modified-since')
+    if ims:
+        try:
+            return int(st.st_mtime) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) for a single ``bytes=`` range.
+
+    Returns None when the whole file should be sent: no header, several
+    ranges, or one that isn't a valid byte range (another unit, junk,
+    last < first), which RFC 9110 says to ignore. Raises ValueError only for
+    a valid range the file can't satisfy.
+    """
+    if not header or ',' in header:
+        return None
+    m = _RANGE.match(header.strip())
+    if not m or m.groups() == ('', ''):
+        return None
+    first, last = m.groups()
+    if first == '':  # suffix: the last N bytes
+        n = int(last)
+        if n == 0 or size == 0:
+            raise ValueError('empty suffix range')
+        return max(0, size - n), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError('range outside the file')
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _iter_file(path: str, start: int, length: int) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(READ_CHUNK_BYTES, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_file(request: Request, path: str, media_type: str, filename: Optional[str] = None) -> Response:
+    """Send ``path`` with validators, conditional GET (304) and single-range (206) support."""
+    st = os.stat(path)
+    etag, last_modified = _validators(st)
+    headers: Dict[str, str] = {'Accept-Ranges': 'bytes', 'ETag': etag, 'Last-Modified': last_modified,
+                               'Cache-Control': RESULT_CACHE_CONTROL}
+    if filename:
+        headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if _not_modified(request, etag, st):
+        return Response(status_code=304, headers=headers)
+
+    size = st.st_size
+    rng = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    if rng and if_range and if_range.strip() not in (etag, last_modified):
+        rng = None  # the client's copy is stale: send it the whole new file
+    try:
+        span = parse_range(rng, size)
+    except ValueError:
+        return Response(status_code=416, headers=dict(headers, **{'Content-Range': f'bytes */{size}'}))
+    status, start, length = 200, 0, size
+    if span is not None:
+        start, end = span
+        status, length = 206, end - start + 1
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    headers['Content-Length'] = str(length)
+    if request.method == 'HEAD':
+        return Response(status_code=status, headers=headers, media_type=media_type)
+    return StreamingResponse(_iter_file(path, start, length), status_code=status, headers=headers,
+                             media_type=media_type)
+
+
+def render_preview(master_path: str, preview_path: str, fmt: str):
+    """Encode the master to a preview format, block by block, via a temp file renamed into place."""
+    import soundfile
+    sf_format, subtype, _, _ = PREVIEW_FORMATS[fmt]
+    tmp = preview_path + '.part'
+    with soundfile.SoundFile(master_path) as src:
+        with soundfile.SoundFile(tmp, 'w', samplerate=src.samplerate, channels=src.channels,
+                                 format=sf_format, subtype=subtype) as dst:
+            for block in src.blocks(blocksize=PREVIEW_BLOCK_FRAMES, dtype='float32'):
+                dst.write(block)
+    os.replace(tmp, preview_path)
+
+
+class PreviewRenderer:
+    """Makes each preview once: concurrent requests for the same file share one encode."""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def formats(self) -> Dict[str, str]:
+        if not SOUNDFILE_AVAILABLE:
+            return {}
+        try:
+            import soundfile
+        except Exception:  # installed without its libsndfile
+            return {}
+        have = soundfile.available_formats()
+        return {k: v[3] for k, v in PREVIEW_FORMATS.items() if v[0] in have}
+
+    def warm(self):
+        """Import soundfile now (blocking) so the first preview request doesn't."""
+        self.formats()
+
+    async def ensure(self, master_path: str, fmt: str) -> Tuple[str, bool]:
+        """Path of the preview, and whether this call had to create it."""
+        preview_path = os.path.join(os.path.dirname(master_path), PREVIEW_FORMATS[fmt][2])
+        if os.path.exists(preview_path):
+            return preview_path, False
+        fut = self._inflight.get(preview_path)
+        if fut is None:
+            fut = asyncio.ensure_future(asyncio.to_thread(render_preview, master_path, preview_path, fmt))
+            self._inflight[preview_path] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(preview_path, None))
+        await asyncio.shield(fut)
+        return preview_path, True
@@ -0,0 +1,183 @@
+import math
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from typing import Callable, List, Optional
+
+import numpy as np
+from scipy import ndimage, signal
+
+from analysis import LoudnessMeter, block_frames, interpolate_hot, interpolator, open_wav, to_float
+
+# up to MASTERING_WORKERS jobs render at once (scheduler.py), so by default they split the cores
+_CPUS = os.cpu_count() or 1
+DSP_THREADS = int(os.getenv('DSP_THREADS', '0')) or max(1, _CPUS // (int(os.getenv('MASTERING_WORKERS', '0')) or _CPUS))
+LOOKAHEAD_MS = 5.0  # limiter attack: gain is fully down this long before a peak
+HOLD_MS = 50.0  # reduction held after a peak before releasing
+MAX_GAIN_DB = 24.0  # never boost quiet material more than this
+LIMITER_MARGIN_DB = 0.1  # headroom for interpolation and 24-bit rounding
+OUTPUT_BITS = 24
+PASS1_SHARE = 0.3  # rough share of render time spent measuring, for progress
+
+# (filter, frequency Hz, Q, gain dB) applied in order
+PRESET_EQ = {
+    'streaming': [('highpass', 25, 0.707, 0.0), ('lowshelf', 110, 0.707, 0.5), ('highshelf', 10000, 0.707, 1.0)],
+    'youtube': [('highpass', 30, 0.707, 0.0), ('peaking', 3000, 1.0, 1.0), ('highshelf', 12000, 0.707, 1.5)],
+    'club': [('highpass', 25, 0.707, 0.0), ('lowshelf', 80, 0.707, 2.0), ('peaking', 350, 1.0, -1.0),
+             ('highshelf', 10000, 0.707, 0.5)],
+}
+
+
+def biquad(kind: str, f0: float, q: float, gain_db: float, rate: int) -> List[float]:
+    """One RBJ-cookbook biquad as a second-order section ``[b0, b1, b2, 1, a1, a2]``."""
+    a = 10 ** (gain_db / 40)
+    w0 = 2 * math.pi * min(f0, rate * 0.45) / rate
+    cw, alpha = math.cos(w0), math.sin(w0) / (2 * q)
+    sq = 2 * math.sqrt(a) * alpha
+    if kind == 'highpass':
+        b, den = [(1 + cw) / 2, -(1 + cw), (1 + cw) / 2], [1 + alpha, -2 * cw, 1 - alpha]
+    elif kind == 'peaking':
+        b, den = [1 + alpha * a, -2 * cw, 1 - alpha * a], [1 + alpha / a, -2 * cw, 1 - alpha / a]
+    elif kind == 'lowshelf':
+        b = [a * ((a + 1) - (a - 1) * cw + sq), 2 * a * ((a - 1) - (a + 1) * cw), a * ((a + 1) - (a - 1) * cw - sq)]
+        den = [(a + 1) + (a - 1) * cw + sq, -2 * ((a - 1) + (a + 1) * cw), (a + 1) + (a - 1) * cw - sq]
+    elif kind == 'highshelf':
+        b = [a * ((a + 1) + (a - 1) * cw + sq), -2 * a * ((a - 1) + (a + 1) * cw), a * ((a + 1) + (a - 1) * cw - sq)]
+        den = [(a + 1) - (a - 1) * cw + sq, 2 * ((a - 1) - (a + 1) * cw), (a + 1) - (a - 1) * cw - sq]
+    else:
+        raise ValueError(f'unknown filter {kind}')
+    return [b[0] / den[0], b[1] / den[0], b[2] / den[0], 1.0, den[1] / den[0], den[2] / den[0]]
+
+
+def preset_sos(preset: str, rate: int) -> np.ndarray:
+    """EQ for ``preset`` as second-order sections; unknown presets are flat."""
+    return np.array([biquad(*band, rate) for band in PRESET_EQ.get(preset, [])]).reshape(-1, 6)
+
+
+def create_wav(path: str, frames: int, channels: int, rate: int) -> np.memmap:
+    """Write a 24-bit PCM header and map the (zeroed) data chunk for filling in place."""
+    width = OUTPUT_BITS // 8
+    size = frames * channels * width
+    fmt = struct.pack('<HHIIHH', 1, channels, rate, rate * channels * width, channels * width, OUTPUT_BITS)
+    with open(path, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', 4 + 8 + len(fmt) + 8 + size) + b'WAVE')
+        f.write(b'fmt ' + struct.pack('<I', len(fmt)) + fmt)
+        f.write(b'data' + struct.pack('<I', size))
+        offset = f.tell()
+        f.truncate(offset + size)
+    if not frames:
+        return np.zeros((0, channels, width), dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode='r+', offset=offset, shape=(frames, channels, width))
+
+
+def to_pcm24(y: np.ndarray) -> np.ndarray:
+    v = np.ascontiguousarray(np.round(np.clip(y, -1.0, 1.0 - 2.0 ** -23) * (1 << 23)), dtype='<i4')
+    return v.view(np.uint8).reshape(y.shape + (4,))[..., :3]
+
+
+def limiter_gain(y: np.ndarray, phases: np.ndarray, ceiling: float, lookahead: int, hold: int) -> np.ndarray:
+    """Per-sample gain that keeps the true peak of ``y`` under ``ceiling``.
+
+    The required gain (from a 4x interpolated envelope, computed only
+    where a peak could reach the ceiling) is min-filtered
+    over ``[n - hold, n + lookahead]`` and then averaged over the previous
+    ``lookahead + 1`` samples. Every sample in that average already covers
+    ``n``, so the smoothed gain never exceeds what ``n`` needs: attack and
+    release are linear ramps of ``lookahead`` samples, with no overshoot.
+    """
+    env = np.abs(y).max(axis=1)
+    k = phases.shape[0]
+    for c in range(y.shape[1]):
+        idx, peaks = interpolate_hot(np.ascontiguousarray(y[:, c]), phases, ceiling)
+        # the interpolated points of window i lie between samples i + k/2 - 1 and i + k/2
+        for shift in (k // 2 - 1, k // 2):
+            env[idx + shift] = np.maximum(env[idx + shift], peaks)
+    with np.errstate(divide='ignore'):
+        g = np.minimum(1.0, ceiling / env)
+    size = hold + lookahead + 1
+    g = ndimage.minimum_filter1d(g, size, origin=hold - size // 2, mode='nearest')
+    padded = np.concatenate([[0.0], np.full(lookahead, g[0]), g])
+    cs = np.cumsum(padded)
+    return (cs[lookahead + 1:] - cs[:-lookahead - 1]) / (lookahead + 1)
+
+
+def render(in_path: str, out_path: str, target_lufs: float, true_peak: float, preset: str,
+           threads: int = DSP_THREADS, progress: Optional[Callable[[float], None]] = None) -> dict:
+    """Master ``in_path`` to a 24-bit WAV: preset EQ, gain to ``target_lufs``, true-peak limiter.
+
+    Two passes over the memory-mapped input. The first runs the EQ block by
+    block to measure loudness after EQ, and records the filter state at
+    each chunk's start. The second renders chunks on ``threads`` threads
+    (NumPy/SciPy release the GIL in the heavy kernels); each restarts the
+    EQ from its recorded state and reads a margin either side for the
+    limiter, so the result matches one sequential pass to within an LSB
+    and doesn't depend on the thread count. ``progress`` gets the fraction
+    done (0..1) after pass 1 and after each rendered chunk.
+    """
+    wav = open_wav(in_path)
+    rate, ch, n = wav.rate, wav.channels, wav.frames
+    sos = preset_sos(preset, rate)
+    phases = interpolator()
+    lookahead = max(1, round(rate * LOOKAHEAD_MS / 1000))
+    hold = max(lookahead, round(rate * HOLD_MS / 1000))
+    pre = lookahead + hold + phases.shape[0]
+    post = lookahead + phases.shape[0]
+    chunk = block_frames(rate)
+    starts = list(range(0, n, chunk))
+
+    # pass 1: EQ + loudness, saving filter state where each chunk's pre-margin begins
+    reads = sorted({max(0, s - pre) for s in starts} | {n})
+    meter = LoudnessMeter(rate, ch)
+    zi = np.zeros((len(sos), 2, ch))
+    states = {}
+    for a, b in zip(reads, reads[1:]):
+        states[a] = zi
+        x = to_float(wav.data[a:b], wav.bits, wav.is_float)
+        if len(sos):
+            x, zi = signal.sosfilt(sos, x, axis=0, zi=zi)
+        meter.feed(x)
+    eq_lufs = meter.integrated()
+    if progress:
+        progress(PASS1_SHARE)
+    gain_db = min(MAX_GAIN_DB, target_lufs - eq_lufs) if eq_lufs is not None else 0.0
+    gain = 10 ** (gain_db / 20)
+    ceiling = 10 ** ((true_peak - LIMITER_MARGIN_DB) / 20)
+
+    # pass 2: render chunks
+    out = create_wav(out_path, n, ch, rate)
+    lock = threading.Lock()
+    done = 0
+
+    def one(start: int) -> float:
+        stop = min(n, start + chunk)
+        a, b = max(0, start - pre), min(n, stop + post)
+        y = to_float(wav.data[a:b], wav.bits, wav.is_float)
+        if len(sos):
+            y = signal.sosfilt(sos, y, axis=0, zi=states[a])[0]
+        y *= gain
+        g = limiter_gain(y, phases, ceiling, lookahead, hold)[start - a:stop - a]
+        out[start:stop] = to_pcm24(y[start - a:stop - a] * g[:, None])
+        if progress:
+            nonlocal done
+            with lock:
+                done += 1
+                progress(PASS1_SHARE + (1 - PASS1_SHARE) * done / len(starts))
+        return float(g.min())
+
+    workers = max(1, min(threads, len(starts)))
+    if workers == 1:
+        floors = [one(s) for s in starts]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            floors = list(pool.map(one, starts))
+    if isinstance(out, np.memmap):
+        out.flush()
+    floor = min(floors) if floors else 1.0
+    return {
+        'engine': 'builtin',
+        'eq_lufs': eq_lufs,
+        'gain_db': round(gain_db, 2),
+        'limiter_max_reduction_db': round(max(0.0, -20 * math.log10(floor)), 2) if floor > 0 else None,
+        'threads': workers,
+    }
@@ -0,0 +1,189 @@
+import asyncio
+import contextlib
+import json
+import os
+import select
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Set
+
+from sqlalchemy import text
+
+from instrumentation import CACHE_LOOKUPS, count_error
+
+NOTIFY_CHANNEL = os.getenv('JOB_NOTIFY_CHANNEL', 'mastering_jobs')
+ALL_JOBS = '*'  # subscribers to this key see every job's events
+
+
+class JobEvents:
+    """In-process pub/sub of job state changes and progress.
+
+    ``publish`` must be called on the event loop; subscribers get a queue of
+    event dicts (``id``, ``status``, ``progress``) for one job plus every
+    status change of any job, which is what moves queue positions.
+    Listeners (the job cache, the Postgres relay) run on each publish.
+    """
+
+    def __init__(self):
+        self._subs: Dict[str, Set[asyncio.Queue]] = {}
+        self.progress: Dict[str, float] = {}  # latest percent of jobs that are running
+        self.listeners: List[Callable[[dict, bool], None]] = []
+
+    def publish(self, jid: str, status: Optional[str] = None, progress: Optional[float] = None, local: bool = True):
+        """``local`` is False for events relayed from another instance."""
+        if progress is not None:
+            self.progress[jid] = progress
+        if status is not None and status != 'running':
+            self.progress.pop(jid, None)
+        event = dict(id=jid, status=status, progress=progress)
+        for listener in self.listeners:
+            listener(event, local)
+        targets = set(self._subs.get(jid, ()))
+        if status is not None:
+            targets |= self._subs.get(ALL_JOBS, set())
+        for q in targets:
+            q.put_nowait(event)
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, jid: str):
+        q: asyncio.Queue = asyncio.Queue()
+        keys = (jid, ALL_JOBS)
+        for key in keys:
+            self._subs.setdefault(key, set()).add(q)
+        try:
+            yield q
+        finally:
+            for key in keys:
+                subs = self._subs.get(key)
+                if subs is not None:
+                    subs.discard(q)
+                    if not subs:
+                        del self._subs[key]
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subs.get(ALL_JOBS, ()))
+
+
+class PgNotifyRelay:
+    """Mirrors job events between API instances with Postgres LISTEN/NOTIFY.
+
+    Local events go out with ``pg_notify``; a thread LISTENs on a dedicated
+    connection and republishes other instances' events on the loop. Events
+    carry an origin id so an instance ignores its own.
+    """
+
+    def __init__(self, engine, hub: JobEvents, channel: str = NOTIFY_CHANNEL):
+        self.engine = engine
+        self.hub = hub
+        self.channel = channel
+        self.origin = uuid.uuid4().hex[:12]
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.hub.listeners.append(self._on_event)
+        self._thread = threading.Thread(target=self._listen, name='pg-notify', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _on_event(self, event: dict, local: bool):
+        if local:
+            payload = json.dumps(dict(event, origin=self.origin), separators=(',', ':'))
+            self._loop.run_in_executor(None, self._notify, payload)
+
+    def _notify(self, payload: str):
+        try:
+            with self.engine.begin() as cx:
+                cx.execute(text('SELECT pg_notify(:c, :p)'), dict(c=self.channel, p=payload))
+        except Exception as e:
+            count_error('job_notify_error')
+            print('job_notify_error', repr(e))
+
+    def _listen(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self.engine.raw_connection()
+                dbapi = conn.driver_connection
+                dbapi.rollback()  # pre-ping may have opened a transaction
+                dbapi.autocommit = True
+                with dbapi.cursor() as cur:
+                    cur.execute(f'LISTEN {self.channel}')
+                while not self._stop.is_set():
+                    if select.select([dbapi], [], [], 5)[0]:
+                        dbapi.poll()
+                        while dbapi.notifies:
+                            self._deliver(dbapi.notifies.pop(0).payload)
+            except Exception as e:
+                count_error('job_listen_error')
+                print('job_listen_error', repr(e))
+                time.sleep(5)
+            finally:
+                if conn is not None:
+                    conn.invalidate()  # never hand a LISTENing connection back to the pool
+
+    def _deliver(self, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        if event.pop('origin', None) == self.origin:
+            return
+        self._loop.call_soon_threadsafe(lambda: self.hub.publish(event['id'], event.get('status'),
+                                                                 event.get('progress'), local=False))
+
+
+class JobCache:
+    """Short-lived cache of job views in front of the jobs table.
+
+    ``loader`` takes a list of ids and returns ``{id: view}`` for those that
+    exist. Status changes published on the hub drop the job's entry and any
+    cached queued jobs (their positions moved), so the TTL only bounds how
+    stale a view can get when events are missed.
+    """
+
+    def __init__(self, loader: Callable[[List[str]], Dict[str, dict]], ttl: float):
+        self.loader = loader
+        self.ttl = ttl
+        self._entries: Dict[str, tuple] = {}  # id -> (expires, view)
+        self.stats = dict(hits=0, misses=0, loads=0)
+
+    def on_event(self, event: dict, local: bool):
+        if event.get('status') is None:
+            return
+        self._entries.pop(event['id'], None)
+        for jid in [j for j, (_, v) in self._entries.items() if v['status'] == 'queued']:
+            del self._entries[jid]
+
+    async def get_many(self, ids: List[str]) -> Dict[str, dict]:
+        now = time.monotonic()
+        found, missing = {}, []
+        for jid in ids:
+            hit = self._entries.get(jid)
+            if hit and hit[0] > now:
+                found[jid] = hit[1]
+            else:
+                missing.append(jid)
+        self.stats['hits'] += len(found)
+        CACHE_LOOKUPS.inc(len(found), cache='jobs', result='hit')
+        if missing:
+            self.stats['misses'] += len(missing)
+            CACHE_LOOKUPS.inc(len(missing), cache='jobs', result='miss')
+            self.stats['loads'] += 1
+            loaded = await asyncio.to_thread(self.loader, missing)
+            expires = time.monotonic() + self.ttl
+            for jid, view in loaded.items():
+                self._entries[jid] = (expires, view)
+            found.update(loaded)
+        if len(self._entries) > 10000:
+            self._entries = {j: e for j, e in self._entries.items() if e[0] > now}
+        return found
+
+    async def get(self, jid: str) -> Optional[dict]:
+        return (await self.get_many([jid])).get(jid)
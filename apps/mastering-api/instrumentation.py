@@ -0,0 +1,385 @@
+"""Timings, counters and a sampling profiler, exposed in Prometheus text format.
+
+Shared by leads-api and mastering-api: each app deploys from its own
+directory, so each carries a copy of this file; keep the copies identical.
+Nothing here imports FastAPI at module level, so it also loads in the
+mastering worker processes.
+"""
+import asyncio
+import contextlib
+import contextvars
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as _Tally, OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# ?profile=1 (or X-Profile: 1) samples the whole process while that request runs
+PROFILE_REQUESTS = os.getenv('PROFILE_REQUESTS', '0') == '1'
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_KEEP = 20  # most recent profiles kept for /metrics/profiles/{id}
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+Sample = Tuple[str, Dict[str, str], float]  # (name, labels, value)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _line(name: str, labels: Dict[str, str], value: float) -> str:
+    lab = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+    v = repr(float(value))
+    return f'{name}{{{lab}}} {v}' if lab else f'{name} {v}'
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, object] = {}
+
+    def _key(self, labels: Dict[str, object]) -> tuple:
+        return tuple(str(labels.get(k, '')) for k in self.labelnames)
+
+    def _labels(self, key: tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, v in items:
+            yield self.name, self._labels(key), v
+
+
+class Gauge(_Metric):
+    """A settable value, or one read at scrape time from ``set_function``.
+
+    The function returns a number, or ``{label value tuple: number}``. A
+    coroutine function (an async DB query, say) is awaited on the loop by
+    ``Registry.refresh`` before each scrape instead.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        super().__init__(name, doc, labels)
+        self._fn: Optional[Callable] = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, fn: Callable):
+        self._fn = fn
+
+    @property
+    def is_async(self) -> bool:
+        return asyncio.iscoroutinefunction(self._fn)
+
+    async def refresh(self):
+        got = await self._fn()
+        with self._lock:
+            self._values = got if isinstance(got, dict) else {(): got}
+
+    def samples(self) -> Iterable[Sample]:
+        if self._fn is not None and not self.is_async:
+            got = self._fn()
+            values = got if isinstance(got, dict) else {(): got}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, v in values.items():
+            yield self.name, self._labels(key if isinstance(key, tuple) else (key,)), float(v)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = [(k, (list(s[0]), s[1], s[2])) for k, s in self._values.items()]
+        for key, (counts, total, n) in items:
+            labels = self._labels(key)
+            running = 0
+            for bound, c in zip(self.buckets, counts):
+                running += c
+                yield f'{self.name}_bucket', dict(labels, le=f'{bound:g}'), running
+            yield f'{self.name}_bucket', dict(labels, le='+Inf'), n
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, n
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: 'OrderedDict[str, _Metric]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, doc: str, labels: Sequence[str], **kw):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = self._metrics[name] = cls(name, doc, labels, **kw)
+            return m
+
+    def counter(self, name: str, doc: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, doc, labels)
+
+    def gauge(self, name: str, doc: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._get(Gauge, name, doc, labels)
+
+    def histogram(self, name: str, doc: str, labels: Sequence[str] = (), **kw) -> Histogram:
+        return self._get(Histogram, name, doc, labels, **kw)
+
+    async def refresh(self):
+        """Await the async gauge functions; call on the loop before ``render``."""
+        for m in list(self._metrics.values()):
+            if isinstance(m, Gauge) and m.is_async:
+                try:
+                    await m.refresh()
+                except Exception as e:
+                    print('metrics_collect_error', m.name, repr(e))
+
+    def render(self) -> str:
+        """Prometheus text exposition (0.0.4). Runs gauge functions, so call it off the loop."""
+        out: List[str] = []
+        for m in list(self._metrics.values()):
+            try:
+                lines = [_line(*s) for s in m.samples()]
+            except Exception as e:
+                print('metrics_collect_error', m.name, repr(e))
+                continue
+            out.append(f'# HELP {m.name} {m.doc}')
+            out.append(f'# TYPE {m.name} {m.kind}')
+            out.extend(lines)
+        return '\n'.join(out) + '\n'
+
+
+REGISTRY = Registry()
+
+OP_SECONDS = REGISTRY.histogram('operation_duration_seconds', 'Wall time of an instrumented operation', ('op',))
+STAGE_SECONDS = REGISTRY.histogram('stage_duration_seconds', 'Wall time per stage of an operation', ('op', 'stage'))
+HTTP_SECONDS = REGISTRY.histogram('http_request_duration_seconds', 'Time to response start',
+                                  ('method', 'route', 'status'))
+ERRORS = REGISTRY.counter('errors_total', 'Errors, by where they were caught', ('where',))
+CACHE_LOOKUPS = REGISTRY.counter('cache_lookups_total', 'Cache lookups by cache and result', ('cache', 'result'))
+API_CALLS = REGISTRY.counter('external_api_calls_total', 'Calls to external APIs', ('api', 'endpoint', 'result'))
+
+
+def count_error(where: str):
+    ERRORS.inc(where=where)
+
+
+# -- stage timing --
+_current: contextvars.ContextVar[Optional['StageTimer']] = contextvars.ContextVar('stage_timer', default=None)
+
+
+class StageTimer:
+    """Wall time per stage of one operation (a request, a job).
+
+    Activated with ``timer.active()``; code anywhere below it (including
+    tasks started inside, which copy the context) wraps work in
+    ``stage(name)``. Each stage and the whole operation also land in the
+    ``stage_duration_seconds`` / ``operation_duration_seconds`` histograms.
+    Stages run by concurrent tasks add up, so a stage can exceed the total.
+    """
+
+    def __init__(self, op: str):
+        self.op = op
+        self.started = time.perf_counter()
+        self.totals: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.totals[name] = self.totals.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def active(self):
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+            OP_SECONDS.observe(time.perf_counter() - self.started, op=self.op)
+
+    def as_dict(self) -> Dict[str, float]:
+        """Milliseconds per stage, plus ``total``."""
+        d = {k: round(v * 1000, 1) for k, v in self.totals.items()}
+        d['total'] = round((time.perf_counter() - self.started) * 1000, 1)
+        return d
+
+    def header(self) -> str:
+        """The timings as a ``Server-Timing`` header value."""
+        return ', '.join(f'{k};dur={v}' for k, v in self.as_dict().items())
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    timer = _current.get()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        STAGE_SECONDS.observe(dt, op=timer.op if timer else '', stage=name)
+        if timer is not None:
+            timer.add(name, dt)
+
+
+def observe_stages(op: str, timings_ms: Dict[str, float]):
+    """Record timings measured elsewhere (e.g. in a worker process) from ``StageTimer.as_dict``."""
+    for name, ms in timings_ms.items():
+        if name == 'total':
+            OP_SECONDS.observe(ms / 1000, op=op)
+        else:
+            STAGE_SECONDS.observe(ms / 1000, op=op, stage=name)
+
+
+# -- sampling profiler --
+class Sampler:
+    """Samples every thread's stack every ``interval_ms`` until stopped.
+
+    ``folded()`` gives one ``thread;file:func;... count`` line per distinct
+    stack, the input format of flamegraph.pl and speedscope. It sees the
+    whole process, so concurrent requests show up in it too.
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.stacks: _Tally = _Tally()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> 'Sampler':
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while True:  # first sample right away, so short requests get one
+            for t in threading.enumerate():
+                names.setdefault(t.ident, t.name)
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                parts.append(names.get(tid, str(tid)))
+                self.stacks[';'.join(reversed(parts))] += 1
+            self.samples += 1
+            if self._stop.wait(self.interval):
+                return
+
+    def folded(self) -> str:
+        return ''.join(f'{stack} {n}\n' for stack, n in self.stacks.most_common())
+
+
+_profiles: 'OrderedDict[str, str]' = OrderedDict()
+
+
+def _wants_profile(scope) -> bool:
+    if not PROFILE_REQUESTS:
+        return False
+    if b'profile=1' in scope.get('query_string', b'').split(b'&'):
+        return True
+    return any(k == b'x-profile' and v == b'1' for k, v in scope.get('headers', ()))
+
+
+class MetricsMiddleware:
+    """ASGI middleware: request timings per route, and the per-request profiler hook.
+
+    Duration is measured to the start of the response, so streams (SSE,
+    CSV export) count their time to first byte. A profiled request gets an
+    ``X-Profile-Id`` header naming its profile at ``/metrics/profiles/{id}``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        sampler = Sampler() if _wants_profile(scope) else None
+        pid = uuid.uuid4().hex[:12] if sampler else None
+        if sampler:
+            sampler.start()
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+                HTTP_SECONDS.observe(time.perf_counter() - t0, method=scope['method'], route=route,
+                                     status=message['status'])
+                if pid:
+                    message = dict(message, headers=list(message.get('headers', [])) + [(b'x-profile-id', pid.encode())])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if sampler:
+                _profiles[pid] = sampler.stop().folded()
+                while len(_profiles) > PROFILE_KEEP:
+                    _profiles.popitem(last=False)
+
+
+def install(app):
+    """Add the middleware plus ``GET /metrics`` and ``GET /metrics/profiles/{id}`` to a FastAPI app."""
+    from fastapi import HTTPException
+    from fastapi.responses import PlainTextResponse
+
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get('/metrics', include_in_schema=False)
+    async def metrics():
+        await REGISTRY.refresh()
+        body = await asyncio.to_thread(REGISTRY.render)
+        return PlainTextResponse(body, media_type='text/plain; version=0.0.4; charset=utf-8')
+
+    @app.get('/metrics/profiles/{pid}', include_in_schema=False)
+    async def profile(pid: str):
+        if pid not in _profiles:
+            raise HTTPException(404, 'no such profile')
+        return PlainTextResponse(_profiles[pid])
@@ -1,15 +1,31 @@
-from fastapi import FastAPI, UploadFile, File, Form, BackgroundTasks, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional
-import os, uuid, shutil, json, subprocess, datetime
+from typing import Dict, List, Optional
+import asyncio, os, uuid, shutil, json, datetime
 import sqlalchemy as sa
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 
+from db import jobs, find_reusable
+from delivery import PathCache, PreviewRenderer, serve_file
+from events import JobCache, JobEvents, PgNotifyRelay
+import instrumentation
+from instrumentation import REGISTRY
+import lifecycle
+from migrations import MIGRATIONS
+from scheduler import JobScheduler
+from storage import Retention, job_dir
+from uploads import MAX_UPLOAD_BYTES, UploadRejected, spool_upload
+
 DATABASE_URL = os.getenv('DATABASE_URL')
 ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS','*')
 MASTERING_CLI_PATH = os.getenv('MASTERING_CLI_PATH','')
+JOB_CACHE_TTL = float(os.getenv('JOB_CACHE_TTL', '2'))
+SSE_PING_SECONDS = 15
+BATCH_MAX_IDS = 100
+TERMINAL_STATUSES = ('done', 'error', 'expired')
 
 app = FastAPI(title='Mastering API', version='1.0.0')
 app.add_middleware(
@@ -18,27 +34,72 @@ app.add_middleware(
     allow_credentials=True, allow_methods=['*'], allow_headers=['*']
 )
 
+MULTIPART_OVERHEAD = 64 * 1024  # form fields and boundaries around the file
+
+@app.middleware('http')
+async def reject_oversized_uploads(request: Request, call_next):
+    # refuse before the multipart body is read and spooled; chunked uploads
+    # without a Content-Length are still capped while copying in create_job
+    length = request.headers.get('content-length')
+    if request.method == 'POST' and length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD:
+        return JSONResponse({'detail': f'upload exceeds {MAX_UPLOAD_BYTES} bytes'}, status_code=413)
+    return await call_next(request)
+
+instrumentation.install(app)
 engine: Engine = sa.create_engine(DATABASE_URL, pool_pre_ping=True, future=True)
 
-with engine.begin() as cx:
-    cx.exec_driver_sql('''
-    CREATE TABLE IF NOT EXISTS jobs (
-        id TEXT PRIMARY KEY,
-        status TEXT NOT NULL,
-        created_at TIMESTAMP NOT NULL,
-        finished_at TIMESTAMP,
-        preset TEXT,
-        target_lufs REAL,
-        true_peak REAL,
-        input_path TEXT,
-        output_path TEXT,
-        metrics_json TEXT
-    );
-    ''')
+job_events = JobEvents()
+scheduler = JobScheduler(engine, cli_path=MASTERING_CLI_PATH, on_event=job_events.publish)
+notify_relay = PgNotifyRelay(engine, job_events) if engine.dialect.name == 'postgresql' else None
+
+REGISTRY.gauge('mastering_jobs', 'Jobs by status', ('status',)).set_function(lambda: scheduler.stats()['depth'])
+REGISTRY.gauge('mastering_workers', 'Jobs that can run at once').set_function(lambda: scheduler.workers)
+REGISTRY.gauge('job_event_subscribers', 'Open job event streams').set_function(lambda: job_events.subscribers)
+
+
+def migrate_db():
+    with engine.begin() as cx:
+        lifecycle.migrate(cx, MIGRATIONS)
+
+# runs after startup, in order, while the app already answers /healthz; /readyz once done
+warmup = lifecycle.Warmup()
+
+@warmup.step('migrations')
+async def _migrate():
+    await asyncio.to_thread(migrate_db)
+
+@warmup.step('data_dir')
+async def _make_data_dir():
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+@warmup.step('scheduler')
+async def _start_scheduler():
+    if notify_relay:
+        notify_relay.start()
+    await scheduler.start()
+    retention.start()
+
+@warmup.step('workers')
+async def _start_workers():
+    print('workers_started', await scheduler.warm())
+
+@warmup.step('previews')
+async def _load_soundfile():
+    await asyncio.to_thread(previews.warm)
+
+lifecycle.install(app, warmup)
+
+@app.on_event('shutdown')
+async def _stop_scheduler():
+    await scheduler.stop()
+    await retention.stop()
+    if notify_relay:
+        notify_relay.stop()
 
 class CreateJobResponse(BaseModel):
     id: str
     status: str
+    reused: bool = False
 
 class JobResponse(BaseModel):
     id: str
@@ -49,84 +110,179 @@ class JobResponse(BaseModel):
     target_lufs: Optional[float] = None
     true_peak: Optional[float] = None
     output_url: Optional[str] = None
+    preview_url: Optional[str] = None
     metrics: Optional[dict] = None
+    queue_position: Optional[int] = None
+    eta_seconds: Optional[float] = None
+    progress: Optional[float] = None
+
+DATA_DIR = os.getenv('DATA_DIR', '/opt/data')
 
-DATA_DIR = '/opt/data'
-os.makedirs(DATA_DIR, exist_ok=True)
+def _on_expired(ids: List[str]):
+    for jid in ids:
+        result_paths.drop(jid)
+        job_events.publish(jid, status='expired')
+
+retention = Retention(engine, DATA_DIR, on_expired=_on_expired)
 
 @app.post('/v1/jobs', response_model=CreateJobResponse)
-async def create_job(background: BackgroundTasks,
-                     file: UploadFile = File(...),
+async def create_job(file: UploadFile = File(...),
                      preset: str = Form('streaming'),
                      target_lufs: float = Form(-14.0),
                      true_peak: float = Form(-1.0)):
     jid = str(uuid.uuid4())
-    job_dir = os.path.join(DATA_DIR, jid)
-    os.makedirs(job_dir, exist_ok=True)
-    in_path = os.path.join(job_dir, 'input.wav')
-    out_path = os.path.join(job_dir, 'output_master.wav')
-    with open(in_path, 'wb') as f:
-        shutil.copyfileobj(file.file, f)
+    jdir = job_dir(DATA_DIR, jid)
+    os.makedirs(jdir, exist_ok=True)
+    in_path = os.path.join(jdir, 'input.wav')
+    out_path = os.path.join(jdir, 'output_master.wav')
+    try:
+        sha256, size = await asyncio.to_thread(spool_upload, file.file, in_path)
+    except UploadRejected as e:
+        shutil.rmtree(jdir, ignore_errors=True)
+        raise HTTPException(e.status, e.detail)
 
     with engine.begin() as cx:
-        cx.execute(text('INSERT INTO jobs (id,status,created_at,preset,target_lufs,true_peak,input_path,output_path)\
-                  VALUES (:id,:st,:ts,:pr,:lu,:tp,:inp,:outp)'),
-           dict(id=jid, st='queued', ts=datetime.datetime.utcnow(), pr=preset,
-                lu=target_lufs, tp=true_peak, inp=in_path, outp=out_path))
+        prior = find_reusable(cx, sha256, preset, target_lufs, true_peak)
+        if prior is None:
+            cx.execute(jobs.insert().values(id=jid, status='queued', created_at=datetime.datetime.utcnow(), preset=preset,
+                                            target_lufs=target_lufs, true_peak=true_peak, input_path=in_path, output_path=out_path,
+                                            input_sha256=sha256, input_bytes=size))
+    if prior is not None:
+        # same bytes, same settings: hand back that job instead of mastering again
+        shutil.rmtree(jdir, ignore_errors=True)
+        retention.touch(prior.id)
+        print('job_reused', prior.id, sha256[:12])
+        return CreateJobResponse(id=prior.id, status=prior.status, reused=True)
 
-    background.add_task(_process_job, jid)
+    scheduler.wake()
+    job_events.publish(jid, status='queued')
     return CreateJobResponse(id=jid, status='queued')
 
-@app.get('/v1/jobs/{jid}', response_model=JobResponse)
-async def get_job(jid: str):
-    with engine.begin() as cx:
-        row = cx.execute(text('SELECT * FROM jobs WHERE id=:id'), dict(id=jid)).mappings().first()
-    if not row:
-        raise HTTPException(404, 'job not found')
-    output_url = None
-    if row['status'] == 'done':
-        output_url = f"/v1/jobs/{jid}/result"
-    metrics = json.loads(row['metrics_json']) if row['metrics_json'] else None
+def _job_view(row, position=None, eta=None) -> dict:
     return JobResponse(
         id=row['id'], status=row['status'], created_at=row['created_at'].isoformat()+'Z',
         finished_at=row['finished_at'].isoformat()+'Z' if row['finished_at'] else None,
         preset=row['preset'], target_lufs=row['target_lufs'], true_peak=row['true_peak'],
-        output_url=output_url, metrics=metrics
-    )
+        output_url=f"/v1/jobs/{row['id']}/result" if row['status'] == 'done' else None,
+        preview_url=f"/v1/jobs/{row['id']}/preview" if row['status'] == 'done' and previews.formats() else None,
+        metrics=json.loads(row['metrics_json']) if row['metrics_json'] else None,
+        queue_position=position, eta_seconds=eta
+    ).model_dump()
+
+def _load_jobs(ids: List[str]) -> Dict[str, dict]:
+    with engine.begin() as cx:
+        rows = cx.execute(sa.select(jobs).where(jobs.c.id.in_(ids))).mappings().all()
+    views = {}
+    for row in rows:
+        position = eta = None
+        if row['status'] == 'queued':
+            position, eta = scheduler.queue_position(row['id'], row['created_at'])
+        views[row['id']] = _job_view(row, position, eta)
+    return views
+
+job_cache = JobCache(_load_jobs, ttl=JOB_CACHE_TTL)
+job_events.listeners.append(job_cache.on_event)
+
+def _with_progress(view: dict) -> dict:
+    if view['status'] == 'running':
+        return dict(view, progress=job_events.progress.get(view['id']))
+    if view['status'] == 'done':
+        return dict(view, progress=100.0)
+    return view
+
+@app.get('/v1/jobs', response_model=List[JobResponse])
+async def get_jobs(ids: str = Query(..., description='comma-separated job ids')):
+    wanted = list(dict.fromkeys(i for i in ids.split(',') if i))
+    if len(wanted) > BATCH_MAX_IDS:
+        raise HTTPException(400, f'at most {BATCH_MAX_IDS} ids')
+    found = await job_cache.get_many(wanted)
+    return [_with_progress(found[j]) for j in wanted if j in found]
+
+@app.get('/v1/jobs/{jid}', response_model=JobResponse)
+async def get_job(jid: str):
+    view = await job_cache.get(jid)
+    if not view:
+        raise HTTPException(404, 'job not found')
+    return _with_progress(view)
 
-@app.get('/v1/jobs/{jid}/result')
-async def download_result(jid: str):
+@app.get('/v1/jobs/{jid}/events')
+async def job_stream(jid: str, request: Request):
+    """Server-Sent Events: a ``job`` event whenever the job's view changes, until it finishes."""
+    if not await job_cache.get(jid):
+        raise HTTPException(404, 'job not found')
+
+    async def stream():
+        async with job_events.subscribe(jid) as q:
+            last = None
+            while True:
+                view = await job_cache.get(jid)
+                if view is None:
+                    return
+                payload = json.dumps(_with_progress(view))
+                if payload != last:
+                    last = payload
+                    yield f'event: job\ndata: {payload}\n\n'
+                if view['status'] in TERMINAL_STATUSES:
+                    return
+                try:
+                    await asyncio.wait_for(q.get(), timeout=SSE_PING_SECONDS)
+                    while not q.empty():
+                        q.get_nowait()
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                if await request.is_disconnected():
+                    return
+
+    return StreamingResponse(stream(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+result_paths = PathCache()
+previews = PreviewRenderer()
+
+def _output_path(jid: str):
     with engine.begin() as cx:
-        row = cx.execute(text('SELECT output_path,status FROM jobs WHERE id=:id'), dict(id=jid)).first()
-    if not row or row[1] != 'done':
-        raise HTTPException(404, 'not ready')
-    path = row[0]
+        return cx.execute(text('SELECT output_path,status FROM jobs WHERE id=:id'), dict(id=jid)).first()
+
+async def _result_path(jid: str) -> str:
+    # a done job's output never changes, so its path is looked up once
+    path = result_paths.get(jid)
+    if path is None:
+        row = await asyncio.to_thread(_output_path, jid)
+        if row and row[1] == 'expired':
+            raise HTTPException(410, 'result expired')
+        if not row or row[1] != 'done':
+            raise HTTPException(404, 'not ready')
+        path = row[0]
+        result_paths.put(jid, path)
     if not os.path.exists(path):
+        result_paths.drop(jid)
         raise HTTPException(404, 'file missing')
-    from fastapi.responses import FileResponse
-    return FileResponse(path, media_type='audio/wav', filename='master.wav')
+    retention.touch(jid)
+    return path
 
-def _process_job(jid: str):
-    with engine.begin() as cx:
-        row = cx.execute(text('SELECT * FROM jobs WHERE id=:id'), dict(id=jid)).mappings().first()
-    if not row:
-        return
-    in_path, out_path = row['input_path'], row['output_path']
+@app.api_route('/v1/jobs/{jid}/result', methods=['GET', 'HEAD'])
+async def download_result(jid: str, request: Request):
+    path = await _result_path(jid)
+    return serve_file(request, path, 'audio/wav', filename='master.wav')
 
-    with engine.begin() as cx:
-        cx.execute(text('UPDATE jobs SET status=:st WHERE id=:id'), dict(st='running', id=jid))
+@app.api_route('/v1/jobs/{jid}/preview', methods=['GET', 'HEAD'])
+async def download_preview(jid: str, request: Request, format: str = 'ogg'):
+    """Lossy (or FLAC) rendition of the master, encoded on first request and kept next to it."""
+    formats = previews.formats()
+    if format not in formats:
+        raise HTTPException(400, f"preview format must be one of: {', '.join(formats) or 'none available'}")
+    master = await _result_path(jid)
+    path, created = await previews.ensure(master, format)
+    if created:
+        retention.grew(jid)
+    return serve_file(request, path, formats[format])
 
-    try:
-        if MASTERING_CLI_PATH:
-            cmd = [MASTERING_CLI_PATH, in_path, out_path, '--lufs', str(row['target_lufs']), '--tp', str(row['true_peak']), '--preset', row['preset'] or 'streaming']
-            subprocess.run(cmd, check=True)
-        else:
-            shutil.copyfile(in_path, out_path)
-        metrics = { 'lufs': row['target_lufs'], 'true_peak': row['true_peak'], 'preset': row['preset'] }
-        with engine.begin() as cx:
-            cx.execute(text('UPDATE jobs SET status=:st, finished_at=:ft, metrics_json=:mj WHERE id=:id'),
-                       dict(st='done', ft=datetime.datetime.utcnow(), mj=json.dumps(metrics), id=jid))
-    except Exception as e:
-        with engine.begin() as cx:
-            cx.execute(text('UPDATE jobs SET status=:st, finished_at=:ft, metrics_json=:mj WHERE id=:id'),
-                       dict(st='error', ft=datetime.datetime.utcnow(), mj=json.dumps({'error': str(e)}), id=jid))
+@app.get('/v1/storage')
+async def storage_usage():
+    return await asyncio.to_thread(retention.usage)
+
+@app.get('/v1/queue')
+async def queue_stats():
+    stats = await asyncio.to_thread(scheduler.stats)
+    return dict(stats, subscribers=job_events.subscribers, job_cache=job_cache.stats,
+                relay='pg_notify' if notify_relay else None)
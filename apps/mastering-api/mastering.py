@@ -0,0 +1,111 @@
+import importlib.util
+import os
+import shutil
+import subprocess
+from typing import Callable, Optional, Tuple
+
+from instrumentation import StageTimer, stage
+
+# Optional deps; analysis/dsp pull in scipy (over a second to import), so they
+# load in the pool workers (init_worker), never in the API process
+ANALYSIS_AVAILABLE = all(importlib.util.find_spec(m) is not None for m in ('numpy', 'scipy'))
+
+ENGINES = ('cli', 'builtin', 'copy')
+
+# set in pool workers by init_worker: a multiprocessing queue of (job id, percent)
+_progress_queue = None
+
+
+def init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+    if ANALYSIS_AVAILABLE:
+        import analysis, dsp  # noqa: F401,E401
+
+
+def ping() -> int:
+    """Trivial pool task: submitting it starts a worker (see JobScheduler.warm)."""
+    return os.getpid()
+
+
+def run_job(jid: str, *args) -> dict:
+    """Pool entry point: ``master_file`` with progress reported on the worker's queue."""
+    report = None
+    if _progress_queue is not None:
+        def report(pct: float):
+            _progress_queue.put((jid, round(pct, 1)))
+    return master_file(*args, progress=report)
+
+
+def resolve_engine(preset: Optional[str], cli_path: str = '') -> Tuple[str, str]:
+    """Split ``preset`` into (engine, preset name).
+
+    ``builtin:club`` / ``cli:club`` pick the engine explicitly and ``copy``
+    passes the input through. A bare name uses the CLI when one is
+    configured, else the built-in chain (else, without numpy, a copy).
+    """
+    engine, _, name = (preset or '').rpartition(':')
+    name = name or 'streaming'
+    if name == 'copy':
+        return 'copy', name
+    if not engine:
+        engine = 'cli' if cli_path else 'builtin' if ANALYSIS_AVAILABLE else 'copy'
+    if engine not in ENGINES:
+        raise ValueError(f'unknown mastering engine {engine!r}')
+    if engine == 'cli' and not cli_path:
+        raise ValueError('MASTERING_CLI_PATH is not set')
+    if engine == 'builtin' and not ANALYSIS_AVAILABLE:
+        raise ValueError('the built-in engine needs numpy and scipy')
+    return engine, name
+
+
+def measure(path: str) -> dict:
+    try:
+        import analysis
+        return analysis.analyze(path)
+    except Exception as e:
+        return {'error': str(e) or repr(e)}
+
+
+def master_file(in_path: str, out_path: str, target_lufs: float, true_peak: float,
+                preset: Optional[str], cli_path: str = '',
+                progress: Optional[Callable[[float], None]] = None) -> dict:
+    """Render one master and return its metrics.
+
+    Runs in a worker process, so it must stay importable without the API
+    (no DB, no FastAPI). The engine comes from ``preset`` (see
+    ``resolve_engine``); ``copy`` passes the input through, which doubles
+    as a test stand-in for the mastering binary.
+
+    ``lufs``/``true_peak`` are what was measured on the output when the
+    analysis engine is available, otherwise the requested targets.
+    ``progress`` is called with a percentage as the render advances.
+    ``timings`` holds milliseconds per stage.
+    """
+    engine, name = resolve_engine(preset, cli_path)
+    info = {'engine': engine}
+    timer = StageTimer('job')
+    with timer.active():
+        with stage('render'):
+            if engine == 'cli':
+                cmd = [cli_path, in_path, out_path, '--lufs', str(target_lufs), '--tp', str(true_peak), '--preset', name]
+                subprocess.run(cmd, check=True)
+            elif engine == 'builtin':
+                import dsp
+                info = dsp.render(in_path, out_path, target_lufs, true_peak, name,
+                                  progress=(lambda f: progress(f * 90)) if progress else None)
+            else:
+                shutil.copyfile(in_path, out_path)
+        metrics = {'lufs': target_lufs, 'true_peak': true_peak, 'preset': preset,
+                   'target_lufs': target_lufs, 'target_true_peak': true_peak, 'measured': False, **info}
+        if progress:
+            progress(90.0)
+        if ANALYSIS_AVAILABLE:
+            with stage('measure_input'):
+                metrics['input'] = measure(in_path)
+            with stage('measure_output'):
+                metrics['output'] = out = measure(out_path)
+            if out.get('lufs') is not None:
+                metrics.update(lufs=out['lufs'], true_peak=out['true_peak'], measured=True)
+    metrics['timings'] = timer.as_dict()
+    return metrics
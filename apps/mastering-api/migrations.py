@@ -0,0 +1,59 @@
+"""Schema versions of the mastering DB, applied by lifecycle.migrate.
+
+Runs as the first warmup step on startup, or by hand:
+
+    DATABASE_URL=... python migrations.py
+"""
+import os
+
+from db import JOB_COLUMNS, JOB_INDEXES, ensure_columns
+
+
+def _initial(cx):
+    # the schema main.py used to create on import; IF NOT EXISTS so databases
+    # from before versioning are adopted as they are
+    cx.exec_driver_sql('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        preset TEXT,
+        target_lufs REAL,
+        true_peak REAL,
+        input_path TEXT,
+        output_path TEXT,
+        metrics_json TEXT,
+        input_sha256 TEXT,
+        input_bytes BIGINT,
+        last_access_at TIMESTAMP,
+        disk_bytes BIGINT
+    );
+    ''')
+    ensure_columns(cx, 'jobs', JOB_COLUMNS)
+    for ddl in JOB_INDEXES:
+        cx.exec_driver_sql(ddl)
+
+
+# (version, name, fn): append only
+MIGRATIONS = [
+    (1, 'initial tables', _initial),
+]
+
+
+def run(url: str):
+    import sqlalchemy as sa
+    from lifecycle import migrate
+
+    engine = sa.create_engine(url, future=True)
+    try:
+        with engine.begin() as cx:
+            applied = migrate(cx, MIGRATIONS)
+        print('migrations', applied or 'up to date')
+    finally:
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    run(os.environ['DATABASE_URL'])
@@ -0,0 +1,232 @@
+import asyncio
+import datetime
+import functools
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, Tuple
+
+import sqlalchemy as sa
+
+from db import jobs
+from instrumentation import REGISTRY, count_error, observe_stages
+from mastering import init_worker, ping, run_job
+
+MASTERING_WORKERS = int(os.getenv('MASTERING_WORKERS', '0')) or (os.cpu_count() or 1)
+SCHEDULER_POLL_SECONDS = float(os.getenv('SCHEDULER_POLL_SECONDS', '5'))
+ETA_SAMPLE = 20  # recent jobs averaged for the ETA
+ETA_DEFAULT_SECONDS = 60.0  # until there is history
+
+JOBS_FINISHED = REGISTRY.counter('mastering_jobs_finished_total', 'Jobs finished, by outcome', ('status',))
+
+
+class JobScheduler:
+    """Runs queued mastering jobs from the ``jobs`` table on a process pool.
+
+    At most ``workers`` jobs run at once, however many are uploaded. Jobs are
+    claimed with ``FOR UPDATE SKIP LOCKED`` so the table is the queue, and on
+    startup any ``running`` rows (orphaned by a crash or redeploy) go back
+    to ``queued``. That recovery assumes one API instance owns the queue.
+    """
+
+    def __init__(self, engine, cli_path: str = '', workers: int = MASTERING_WORKERS,
+                 poll_seconds: float = SCHEDULER_POLL_SECONDS,
+                 on_event: Optional[Callable[..., None]] = None):
+        self.engine = engine
+        self.cli_path = cli_path
+        self.workers = max(1, workers)
+        self.poll_seconds = poll_seconds
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(self.workers)
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._running: set = set()
+        self._active: set = set()  # ids of jobs running here; progress for anything else is dropped
+        # on_event(job id, status=..., progress=...) runs on the loop for every state change
+        self.on_event = on_event or (lambda *a, **kw: None)
+        self._progress = None
+        self._pump: Optional[threading.Thread] = None
+
+    # -- lifecycle --
+    def recover(self) -> int:
+        with self.engine.begin() as cx:
+            res = cx.execute(jobs.update().where(jobs.c.status == 'running').values(status='queued', started_at=None))
+        return res.rowcount
+
+    async def start(self):
+        n = await asyncio.to_thread(self.recover)
+        if n:
+            print('jobs_requeued', n)
+        loop = asyncio.get_running_loop()
+        self._progress = multiprocessing.get_context('spawn').Queue()
+        self._pump = threading.Thread(target=self._pump_progress, args=(loop,), name='job-progress', daemon=True)
+        self._pump.start()
+        self.pool = self._new_pool()
+        self._task = asyncio.create_task(self.run())
+
+    async def warm(self) -> int:
+        """Start the pool's workers now, so the first jobs don't wait for spawn and imports."""
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*(loop.run_in_executor(self.pool, ping) for _ in range(self.workers)))
+        return len(set(pids))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+        if self._progress is not None:
+            self._progress.put(None)
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn: workers import only mastering.py, never the API module
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=init_worker, initargs=(self._progress,))
+
+    def _pump_progress(self, loop):
+        # workers put (job id, percent) on a multiprocessing queue; hand them to the loop
+        while True:
+            item = self._progress.get()
+            if item is None:
+                return
+            jid, pct = item
+            # partial, not a closure: several items can be dequeued before the loop runs any of them
+            loop.call_soon_threadsafe(functools.partial(self._on_progress, jid, pct))
+
+    def _on_progress(self, jid: str, pct: float):
+        # a late report must not bring back the progress entry of a job that has finished
+        if jid in self._active:
+            self.on_event(jid, progress=pct)
+
+    def wake(self):
+        self._wake.set()
+
+    # -- queue --
+    def claim(self):
+        now = datetime.datetime.utcnow()
+        c = jobs.c
+        pick = (sa.select(c.id).where(c.status == 'queued').order_by(c.created_at).limit(1)
+                .with_for_update(skip_locked=True))
+        stmt = (jobs.update().where(c.id == pick.scalar_subquery())
+                .values(status='running', started_at=now)
+                .returning(c.id, c.input_path, c.output_path, c.preset, c.target_lufs, c.true_peak))
+        with self.engine.begin() as cx:
+            return cx.execute(stmt).first()
+
+    def _requeue(self, jid: str):
+        with self.engine.begin() as cx:
+            cx.execute(jobs.update().where(jobs.c.id == jid, jobs.c.status == 'running')
+                       .values(status='queued', started_at=None))
+
+    def _finish(self, jid: str, status: str, metrics: dict):
+        with self.engine.begin() as cx:
+            cx.execute(jobs.update().where(jobs.c.id == jid).values(
+                status=status, finished_at=datetime.datetime.utcnow(), metrics_json=json.dumps(metrics)))
+
+    def _settle(self, jid: str, status: str):
+        self._active.discard(jid)
+        self.on_event(jid, status=status)
+
+    async def process_job(self, row):
+        loop = asyncio.get_running_loop()
+        pool = self.pool
+        try:
+            metrics = await loop.run_in_executor(pool, run_job, row.id, row.input_path, row.output_path,
+                                                 row.target_lufs, row.true_peak, row.preset, self.cli_path)
+            await asyncio.to_thread(self._finish, row.id, 'done', metrics)
+            self._settle(row.id, 'done')
+            JOBS_FINISHED.inc(status='done')
+            # stage timings were taken in the worker process; record them here
+            observe_stages('job', metrics.get('timings', {}))
+        except BrokenProcessPool as e:
+            # a worker died (OOM, signal); the pool is unusable from here on.
+            # Every job on it ends up here, so only the first replaces it:
+            # shutting down whatever self.pool is by now could cancel jobs
+            # already running on the replacement
+            if pool is not None and self.pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._new_pool()
+            count_error('job_failed')
+            print('job_failed', row.id, repr(e))
+            await asyncio.to_thread(self._finish, row.id, 'error', {'error': 'mastering worker crashed'})
+            self._settle(row.id, 'error')
+            JOBS_FINISHED.inc(status='crashed')
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise  # the scheduler is stopping; recover() requeues the row on the next start
+            # only the executor future was cancelled (its pool was shut down):
+            # put the job back rather than leave the row 'running'
+            count_error('job_requeued')
+            print('job_requeued', row.id)
+            await asyncio.to_thread(self._requeue, row.id)
+            self._settle(row.id, 'queued')
+            self.wake()
+        except Exception as e:
+            count_error('job_failed')
+            print('job_failed', row.id, repr(e))
+            await asyncio.to_thread(self._finish, row.id, 'error', {'error': str(e)})
+            self._settle(row.id, 'error')
+            JOBS_FINISHED.inc(status='error')
+
+    async def run(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                row = await asyncio.to_thread(self.claim)
+            except asyncio.CancelledError:
+                self._slots.release()
+                raise
+            except Exception as e:
+                count_error('scheduler_claim_error')
+                print('scheduler_claim_error', repr(e))
+                row = None
+            if row is None:
+                self._slots.release()
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._active.add(row.id)
+            self.on_event(row.id, status='running', progress=0.0)
+            task = asyncio.create_task(self.process_job(row))
+            self._running.add(task)
+            task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task):
+        self._running.discard(task)
+        self._slots.release()
+
+    # -- reporting --
+    def avg_duration(self, cx) -> float:
+        c = jobs.c
+        rows = cx.execute(sa.select(c.started_at, c.finished_at)
+                          .where(c.status == 'done', c.started_at.is_not(None), c.finished_at.is_not(None))
+                          .order_by(c.finished_at.desc()).limit(ETA_SAMPLE)).all()
+        secs = [(f - s).total_seconds() for s, f in rows if isinstance(s, datetime.datetime) and isinstance(f, datetime.datetime)]
+        return sum(secs) / len(secs) if secs else ETA_DEFAULT_SECONDS
+
+    def queue_position(self, jid: str, created_at) -> Tuple[int, float]:
+        """1-based position among queued jobs and an ETA in seconds until it finishes."""
+        c = jobs.c
+        with self.engine.begin() as cx:
+            ahead = cx.execute(sa.select(sa.func.count()).where(c.status == 'queued', c.created_at < created_at)).scalar()
+            running = cx.execute(sa.select(sa.func.count()).where(c.status == 'running')).scalar()
+            avg = self.avg_duration(cx)
+        # jobs ahead plus the running ones drain `workers` at a time, then this one runs
+        eta = ((ahead + running) // self.workers + 1) * avg
+        return ahead + 1, round(eta, 1)
+
+    def stats(self) -> dict:
+        with self.engine.begin() as cx:
+            depth = dict(cx.execute(sa.select(jobs.c.status, sa.func.count()).group_by(jobs.c.status)).all())
+            avg = self.avg_duration(cx)
+        return dict(workers=self.workers, depth=depth, queued=depth.get('queued', 0),
+                    running=depth.get('running', 0), avg_job_seconds=round(avg, 2))
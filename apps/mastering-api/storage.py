@@ -0,0 +1,185 @@
+import asyncio
+import datetime
+import hashlib
+import os
+import shutil
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+import sqlalchemy as sa
+
+from db import jobs
+from instrumentation import count_error
+
+RETENTION_TTL_SECONDS = int(os.getenv('RETENTION_TTL_SECONDS', str(14 * 86400)))  # 0: keep forever
+RETENTION_MAX_BYTES = int(os.getenv('RETENTION_MAX_BYTES', '0'))  # 0: no budget
+RETENTION_SWEEP_SECONDS = float(os.getenv('RETENTION_SWEEP_SECONDS', '300'))
+
+FINISHED_STATUSES = ('done', 'error')
+
+
+def job_dir(data_dir: str, jid: str) -> str:
+    """``data_dir/ab/cd/<jid>``, sharded by a hash of the id so no directory grows huge."""
+    h = hashlib.sha1(jid.encode()).hexdigest()
+    return os.path.join(data_dir, h[:2], h[2:4], jid)
+
+
+def dir_bytes(path: str) -> int:
+    total = 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    total += dir_bytes(entry.path) if entry.is_dir(follow_symlinks=False) else entry.stat().st_size
+                except FileNotFoundError:
+                    pass
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return total
+
+
+class Retention:
+    """Expires finished jobs past a TTL or beyond a byte budget, least recently used first.
+
+    "Used" is the last download of the result or preview (else when the job
+    finished). Downloads only ``touch`` an in-memory map; ``sweep`` writes
+    those times in one UPDATE, then marks expired rows ``expired`` and
+    deletes their job directories; ``on_expired`` then gets their ids, on the
+    event loop once started. ``sweep`` is synchronous and takes ``now`` so it
+    can be driven directly against a temp ``data_dir``.
+    """
+
+    def __init__(self, engine, data_dir: str, ttl_seconds: int = RETENTION_TTL_SECONDS,
+                 max_bytes: int = RETENTION_MAX_BYTES, sweep_seconds: float = RETENTION_SWEEP_SECONDS,
+                 on_expired: Optional[Callable[[List[str]], None]] = None):
+        self.engine = engine
+        self.data_dir = data_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sweep_seconds = sweep_seconds
+        self.on_expired = on_expired or (lambda ids: None)
+        self._touched: Dict[str, datetime.datetime] = {}
+        self._grown: Set[str] = set()  # jobs whose directory gained files since it was measured
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.last_sweep: Optional[dict] = None
+
+    def touch(self, jid: str):
+        self._touched[jid] = datetime.datetime.utcnow()
+
+    def grew(self, jid: str):
+        """Re-measure the job's directory on the next sweep (e.g. a preview was added)."""
+        self._grown.add(jid)
+
+    def flush_touches(self) -> int:
+        touched, self._touched = self._touched, {}
+        grown, self._grown = self._grown, set()
+        if touched or grown:
+            with self.engine.begin() as cx:
+                if touched:
+                    cx.execute(jobs.update().where(jobs.c.id == sa.bindparam('jid'))
+                               .values(last_access_at=sa.bindparam('at')),
+                               [dict(jid=j, at=at) for j, at in touched.items()])
+                if grown:
+                    cx.execute(jobs.update().where(jobs.c.id.in_(list(grown))).values(disk_bytes=None))
+        return len(touched)
+
+    def _measure_missing(self, cx) -> int:
+        c = jobs.c
+        rows = cx.execute(sa.select(c.id, c.output_path).where(c.status.in_(FINISHED_STATUSES), c.disk_bytes.is_(None))).all()
+        for jid, out in rows:
+            size = dir_bytes(os.path.dirname(out)) if out else 0
+            cx.execute(jobs.update().where(c.id == jid).values(disk_bytes=size))
+        return len(rows)
+
+    def _remove(self, out_path: Optional[str]):
+        if not out_path:
+            return
+        d = os.path.dirname(out_path)
+        shutil.rmtree(d, ignore_errors=True)
+        # drop emptied shard directories, never data_dir itself
+        root = os.path.abspath(self.data_dir)
+        parent = os.path.dirname(os.path.abspath(d))
+        while parent.startswith(root + os.sep):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+    def sweep(self, now: Optional[datetime.datetime] = None) -> dict:
+        t0 = time.perf_counter()
+        now = now or datetime.datetime.utcnow()
+        touched = self.flush_touches()
+        c = jobs.c
+        used = sa.func.coalesce(c.last_access_at, c.finished_at, c.created_at)
+        expire: Dict[str, Optional[str]] = {}
+        with self.engine.begin() as cx:
+            measured = self._measure_missing(cx)
+            if self.ttl_seconds > 0:
+                cutoff = now - datetime.timedelta(seconds=self.ttl_seconds)
+                for jid, out in cx.execute(sa.select(c.id, c.output_path)
+                                           .where(c.status.in_(FINISHED_STATUSES), used < cutoff)).all():
+                    expire[jid] = out
+            if self.max_bytes > 0:
+                rows = cx.execute(sa.select(c.id, c.output_path, c.disk_bytes)
+                                  .where(c.status.in_(FINISHED_STATUSES)).order_by(used, c.id)).all()
+                total = sum(r.disk_bytes or 0 for r in rows if r.id not in expire)
+                for r in rows:
+                    if total <= self.max_bytes:
+                        break
+                    if r.id not in expire:
+                        expire[r.id] = r.output_path
+                        total -= r.disk_bytes or 0
+            # rows go 'expired' before any file goes, in the transaction that
+            # picked them: a download racing the sweep then gets 410, never a
+            # 'done' job whose file is missing
+            if expire:
+                cx.execute(jobs.update().where(c.id.in_(list(expire)), c.status.in_(FINISHED_STATUSES))
+                           .values(status='expired', disk_bytes=0))
+        for out in expire.values():
+            self._remove(out)
+        if expire:
+            if self._loop:
+                self._loop.call_soon_threadsafe(self.on_expired, list(expire))
+            else:
+                self.on_expired(list(expire))
+        self.last_sweep = dict(at=now.isoformat() + 'Z', expired=len(expire), touched=touched, measured=measured,
+                               seconds=round(time.perf_counter() - t0, 3))
+        if expire:
+            print('retention_expired', len(expire))
+        return self.last_sweep
+
+    def usage(self) -> dict:
+        with self.engine.begin() as cx:
+            by_status = {s: dict(jobs=n, bytes=int(b or 0)) for s, n, b in cx.execute(
+                sa.select(jobs.c.status, sa.func.count(), sa.func.sum(jobs.c.disk_bytes)).group_by(jobs.c.status)).all()}
+        disk = shutil.disk_usage(self.data_dir)
+        return dict(data_dir=self.data_dir, by_status=by_status,
+                    tracked_bytes=sum(v['bytes'] for v in by_status.values()),
+                    disk=dict(total=disk.total, used=disk.used, free=disk.free),
+                    ttl_seconds=self.ttl_seconds, max_bytes=self.max_bytes, last_sweep=self.last_sweep)
+
+    # -- background --
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        if self._task is None and (self.ttl_seconds > 0 or self.max_bytes > 0):
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush_touches)
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                count_error('retention_sweep_error')
+                print('retention_sweep_error', repr(e))
+            await asyncio.sleep(self.sweep_seconds)
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+import sqlalchemy as sa
+
+# modules sit flat next to main.py, as in the Docker image
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """A migrated SQLite DB."""
+    import migrations
+
+    url = f"sqlite:///{tmp_path / 'mastering.db'}"
+    migrations.run(url)
+    eng = sa.create_engine(url)
+    yield eng
+    eng.dispose()
@@ -0,0 +1,85 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from numpy.lib.stride_tricks import sliding_window_view
+
+from analysis import _interp_peak, analyze, interpolate_hot, interpolator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+from bench_analysis import write_wav  # noqa: E402
+
+RATE = 48000
+
+
+def measure(tmp_path, x, bits=24):
+    path = str(tmp_path / 'case.wav')
+    write_wav(path, x, RATE, bits)
+    return analyze(path)
+
+
+def tone(seconds, freq=997.0, amp=1.0):
+    return amp * np.sin(2 * np.pi * freq * np.arange(int(RATE * seconds)) / RATE)
+
+
+def test_calibration_tone(tmp_path):
+    # BS.1770: a 0 dBFS 997 Hz sine reads -3.01 LUFS in one channel, 0.0 in two
+    t = tone(5)
+    assert measure(tmp_path, t)['lufs'] == pytest.approx(-3.01, abs=0.02)
+    m = measure(tmp_path, np.stack([t, t], 1))
+    assert m['lufs'] == pytest.approx(0.0, abs=0.02)
+    assert m['sample_peak'] == pytest.approx(0.0, abs=0.01)
+
+
+def test_inter_sample_peak(tmp_path):
+    # fs/4 at 45 degrees: samples land at +-0.354 of a 0.5 sine, the peaks fall between them
+    q = 0.5 * np.sin(2 * np.pi * np.arange(RATE * 2) / 4 + np.pi / 4)
+    m = measure(tmp_path, np.stack([q, q], 1), bits=32)
+    assert m['sample_peak'] == pytest.approx(-9.03, abs=0.02)
+    assert m['true_peak'] == pytest.approx(-6.02, abs=0.05)
+
+
+def lufs(block_powers):
+    return 10 * np.log10(np.mean(block_powers))
+
+
+def test_gating(tmp_path):
+    # 5 s sections: 47 whole 400 ms blocks each, and 3 blocks straddling the
+    # change that hold 3/4, 1/2 and 1/4 of the first section
+    t = tone(5)
+    loud = np.stack([t, t], 1)
+
+    def straddle(p):
+        return [0.75 + 0.25 * p, 0.5 + 0.5 * p, 0.25 + 0.75 * p]
+
+    # silence is under the absolute gate
+    m = measure(tmp_path, np.vstack([loud, np.zeros_like(loud)]))
+    assert m['lufs'] == pytest.approx(lufs([1.0] * 47 + straddle(0)), abs=0.02)
+    # 30 dB down is under the relative gate (-10 LU from the ungated level)
+    m = measure(tmp_path, np.vstack([loud, loud * 10 ** (-30 / 20)]))
+    assert m['lufs'] == pytest.approx(lufs([1.0] * 47 + straddle(1e-3)), abs=0.02)
+    # 6 dB down is above it and counts
+    m = measure(tmp_path, np.vstack([loud, loud * 0.5]))
+    assert m['lufs'] == pytest.approx(lufs([1.0] * 47 + straddle(0.25) + [0.25] * 47), abs=0.02)
+    assert measure(tmp_path, np.zeros((RATE * 2, 2)))['lufs'] is None
+
+
+def brute(x, phases):
+    return np.abs(sliding_window_view(x.astype(np.float32), phases.shape[0]) @ phases.astype(np.float32)).max(axis=1)
+
+
+@pytest.mark.parametrize('kind', ['sparse', 'dense'])
+def test_interpolate_hot_matches_brute_force(kind):
+    phases = interpolator()
+    rng = np.random.default_rng(1)
+    x = rng.standard_normal(RATE) * (0.1 if kind == 'sparse' else 0.5)
+    if kind == 'dense':
+        x = np.clip(x, -0.9, 0.9)
+    ref = brute(x, phases)
+    for floor in (0.2, 0.6, 1.0, float(ref.max()) * 0.99):
+        idx, peaks = interpolate_hot(x, phases, floor)
+        np.testing.assert_allclose(peaks, ref[idx], rtol=1e-6)
+        assert set(np.flatnonzero(ref > floor)) <= set(idx.tolist())
+    assert _interp_peak(np.stack([x, -x], 1), phases, 0.0) == pytest.approx(float(ref.max()), rel=1e-6)
+    assert _interp_peak(x[:, None], phases, 10.0) == 10.0
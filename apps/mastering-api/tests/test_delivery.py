@@ -0,0 +1,101 @@
+import os
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from delivery import parse_range, serve_file
+
+DATA = bytes(range(256)) * 40  # 10240 bytes
+
+
+@pytest.mark.parametrize('header,span', [
+    (None, None), ('', None),
+    ('bytes=0-99', (0, 99)), ('bytes=100-', (100, 10239)), ('bytes=-100', (10140, 10239)),
+    ('bytes=10000-20000', (10000, 10239)), ('bytes=-20000', (0, 10239)), (' bytes=5-5 ', (5, 5)),
+    # ignored: the whole file is sent
+    ('bytes=0-1,5-9', None), ('bytes=abc', None), ('items=0-1', None), ('bytes=-', None), ('bytes=9-3', None),
+    ('bytes=0-1x', None),
+])
+def test_parse_range(header, span):
+    assert parse_range(header, len(DATA)) == span
+
+
+@pytest.mark.parametrize('header', ['bytes=10240-', 'bytes=20000-20010', 'bytes=-0'])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, len(DATA))
+
+
+@pytest.fixture
+def path(tmp_path):
+    p = tmp_path / 'master.wav'
+    p.write_bytes(DATA)
+    return p
+
+
+def touch(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 5 * 10 ** 9))
+
+
+@pytest.fixture
+def client(path):
+    app = FastAPI()
+
+    @app.api_route('/f', methods=['GET', 'HEAD'])
+    def f(request: Request):
+        return serve_file(request, str(path), 'audio/wav', filename='master.wav')
+
+    with TestClient(app) as c:
+        yield c
+
+
+def test_partial_content(client):
+    r = client.get('/f', headers={'Range': 'bytes=100-199'})
+    assert r.status_code == 206
+    assert r.content == DATA[100:200]
+    assert r.headers['content-range'] == f'bytes 100-199/{len(DATA)}'
+    assert r.headers['content-length'] == '100'
+    r = client.head('/f', headers={'Range': 'bytes=-10'})
+    assert r.status_code == 206 and r.headers['content-length'] == '10' and not r.content
+
+
+@pytest.mark.parametrize('header', ['bytes=0-1,5-9', 'bytes=abc', 'items=0-1', 'bytes=9-3'])
+def test_ignored_range_sends_everything(client, header):
+    r = client.get('/f', headers={'Range': header})
+    assert r.status_code == 200
+    assert r.content == DATA
+    assert 'content-range' not in r.headers
+
+
+def test_unsatisfiable_range(client):
+    r = client.get('/f', headers={'Range': f'bytes={len(DATA)}-'})
+    assert r.status_code == 416
+    assert r.headers['content-range'] == f'bytes */{len(DATA)}'
+
+
+def test_conditional_get(client, path):
+    r = client.get('/f')
+    assert r.status_code == 200 and r.content == DATA
+    etag, last_modified = r.headers['etag'], r.headers['last-modified']
+    assert r.headers['accept-ranges'] == 'bytes'
+
+    assert client.get('/f', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/f', headers={'If-None-Match': f'"other", W/{etag}'}).status_code == 304
+    assert client.get('/f', headers={'If-None-Match': '"other"'}).status_code == 200
+    assert client.get('/f', headers={'If-Modified-Since': last_modified}).status_code == 304
+
+    touch(path)
+    r = client.get('/f', headers={'If-None-Match': etag})
+    assert r.status_code == 200 and r.headers['etag'] != etag
+
+
+def test_if_range(client, path):
+    etag = client.get('/f').headers['etag']
+    r = client.get('/f', headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert r.status_code == 206 and r.content == DATA[:10]
+
+    touch(path)
+    r = client.get('/f', headers={'Range': 'bytes=0-9', 'If-Range': etag})  # stale validator
+    assert r.status_code == 200 and r.content == DATA
@@ -0,0 +1,52 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+import dsp
+from analysis import analyze, open_wav, to_float
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+from bench_analysis import write_wav  # noqa: E402
+from bench_dsp import make_mix  # noqa: E402
+
+RATE = 48000
+
+
+@pytest.fixture(scope='module')
+def mix(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('dsp') / 'in.wav')
+    write_wav(path, make_mix(0.25, RATE), RATE, 24)
+    return path
+
+
+@pytest.mark.parametrize('preset', sorted(dsp.PRESET_EQ))
+@pytest.mark.parametrize('target,tp', [(-14.0, -1.0), (-9.0, -1.0), (-16.0, -2.0)])
+def test_render_hits_target(mix, tmp_path, preset, target, tp):
+    out = str(tmp_path / 'out.wav')
+    info = dsp.render(mix, out, target, tp, preset, threads=2)
+    m = analyze(out)
+    # the limiter takes off a little more than the gain put on at loud targets
+    assert m['lufs'] == pytest.approx(target, abs=0.5)
+    assert m['true_peak'] <= tp
+    assert (m['duration'], m['channels'], m['bits']) == (15.0, 2, 24)
+    assert info['engine'] == 'builtin' and info['threads'] == 2
+
+
+def test_render_is_thread_count_independent(mix, tmp_path):
+    outs = []
+    for threads in (1, 3):
+        out = str(tmp_path / f'out{threads}.wav')
+        dsp.render(mix, out, -9.0, -1.0, 'club', threads=threads)
+        w = open_wav(out)
+        outs.append(to_float(w.data[:], w.bits, w.is_float))
+    assert outs[0].shape == outs[1].shape
+    # chunks restart the EQ from saved state: at most an LSB of rounding apart
+    assert np.abs(outs[0] - outs[1]).max() <= 2.0 ** -23
+
+
+def test_progress_reaches_one(mix, tmp_path):
+    seen = []
+    dsp.render(mix, str(tmp_path / 'out.wav'), -14.0, -1.0, 'streaming', threads=2, progress=seen.append)
+    assert seen == sorted(seen) and seen[-1] == pytest.approx(1.0)
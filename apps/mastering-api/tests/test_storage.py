@@ -0,0 +1,98 @@
+import datetime
+import os
+
+import pytest
+import sqlalchemy as sa
+
+from db import jobs
+from storage import Retention, job_dir
+
+NOW = datetime.datetime(2026, 1, 1, 12, 0)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    d = tmp_path / 'data'
+    d.mkdir()
+    return str(d)
+
+
+def add_job(engine, data_dir, jid, finished_at, size=100):
+    d = job_dir(data_dir, jid)
+    os.makedirs(d)
+    out = os.path.join(d, 'out.wav')
+    with open(out, 'wb') as f:
+        f.write(b'\0' * size)
+    with engine.begin() as cx:
+        cx.execute(jobs.insert().values(id=jid, status='done', created_at=finished_at, finished_at=finished_at,
+                                        output_path=out))
+    return out
+
+
+def statuses(engine):
+    with engine.begin() as cx:
+        return dict(cx.execute(sa.select(jobs.c.id, jobs.c.status)).all())
+
+
+def test_ttl_expires_old_jobs(engine, data_dir):
+    old = add_job(engine, data_dir, 'old', NOW - datetime.timedelta(days=20))
+    new = add_job(engine, data_dir, 'new', NOW - datetime.timedelta(days=1))
+    expired = []
+    r = Retention(engine, data_dir, ttl_seconds=14 * 86400, max_bytes=0, on_expired=expired.extend)
+
+    assert r.sweep(NOW)['expired'] == 1
+    assert statuses(engine) == {'old': 'expired', 'new': 'done'}
+    assert expired == ['old']
+    assert not os.path.exists(old) and os.path.exists(new)
+    # the emptied shard directories go too, data_dir stays
+    assert not os.path.exists(os.path.dirname(os.path.dirname(os.path.dirname(old))))
+    assert os.path.isdir(data_dir)
+
+
+def test_byte_budget_evicts_least_recently_used(engine, data_dir):
+    for i, jid in enumerate('abc'):
+        add_job(engine, data_dir, jid, NOW - datetime.timedelta(hours=3 - i))
+    r = Retention(engine, data_dir, ttl_seconds=0, max_bytes=250)
+
+    r.sweep(NOW)
+    assert statuses(engine) == {'a': 'expired', 'b': 'done', 'c': 'done'}
+
+
+def test_touch_keeps_a_job(engine, data_dir):
+    for i, jid in enumerate('abc'):
+        add_job(engine, data_dir, jid, NOW - datetime.timedelta(hours=3 - i))
+    r = Retention(engine, data_dir, ttl_seconds=0, max_bytes=250)
+
+    r.touch('a')  # downloaded just now: b is the least recently used
+    r.sweep(datetime.datetime.utcnow())
+    assert statuses(engine) == {'a': 'done', 'b': 'expired', 'c': 'done'}
+
+
+def test_grew_remeasures_the_directory(engine, data_dir):
+    add_job(engine, data_dir, 'a', NOW - datetime.timedelta(hours=2))
+    b = add_job(engine, data_dir, 'b', NOW - datetime.timedelta(hours=1))
+    r = Retention(engine, data_dir, ttl_seconds=0, max_bytes=250)
+    r.sweep(NOW)
+    with open(os.path.join(os.path.dirname(b), 'preview.mp3'), 'wb') as f:
+        f.write(b'\0' * 100)
+
+    # sizes are cached, so the new file goes unnoticed until grew()
+    assert r.sweep(NOW)['expired'] == 0
+    r.grew('b')
+    assert r.sweep(NOW)['expired'] == 1
+    assert statuses(engine) == {'a': 'expired', 'b': 'done'}
+
+
+def test_rows_are_expired_before_files_are_removed(engine, data_dir):
+    add_job(engine, data_dir, 'old', NOW - datetime.timedelta(days=20))
+    r = Retention(engine, data_dir, ttl_seconds=86400, max_bytes=0)
+    seen = []
+    remove = r._remove
+
+    def spy(out):
+        seen.append(statuses(engine)['old'])
+        remove(out)
+
+    r._remove = spy
+    r.sweep(NOW)
+    assert seen == ['expired']
@@ -0,0 +1,73 @@
+import hashlib
+import os
+import struct
+from typing import BinaryIO, Optional, Tuple
+
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(500 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+WAV_FORMATS = {1: 'pcm', 3: 'float', 0xFFFE: 'extensible'}
+
+
+class UploadRejected(Exception):
+    """The upload can't become a job; ``status`` is the HTTP code to answer with."""
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def wav_header_error(head: bytes) -> Optional[str]:
+    """Why ``head`` (the first bytes of a file) isn't a usable WAV, or None."""
+    if len(head) < 12 or head[:4] not in (b'RIFF', b'RF64') or head[8:12] != b'WAVE':
+        return 'not a WAV file (missing RIFF/WAVE header)'
+    pos = 12
+    while pos + 8 <= len(head):
+        cid, size = head[pos:pos + 4], struct.unpack('<I', head[pos + 4:pos + 8])[0]
+        if cid == b'fmt ':
+            if size < 16 or pos + 24 > len(head):
+                return 'truncated WAV fmt chunk'
+            fmt, channels, rate, _, _, bits = struct.unpack('<HHIIHH', head[pos + 8:pos + 24])
+            if fmt not in WAV_FORMATS:
+                return f'unsupported WAV encoding (format tag {fmt})'
+            if not channels or not rate or bits not in (8, 16, 24, 32, 64):
+                return 'invalid WAV fmt chunk'
+            return None
+        pos += 8 + size + (size & 1)
+    return 'WAV fmt chunk not found in header'
+
+
+def spool_upload(src: BinaryIO, dest_path: str, max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[str, int]:
+    """Copy ``src`` to ``dest_path`` in chunks, hashing as it goes.
+
+    Checks the WAV header on the first chunk and stops as soon as the size
+    passes ``max_bytes``; on rejection the partial file is removed. Returns
+    ``(sha256 hex, size)``.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(dest_path, 'wb') as out:
+            while True:
+                chunk = src.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                if size == 0:
+                    err = wav_header_error(chunk)
+                    if err:
+                        raise UploadRejected(415, err)
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(413, f'upload exceeds {max_bytes} bytes')
+                digest.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise UploadRejected(400, 'empty upload')
+    except BaseException:
+        try:
+            os.remove(dest_path)
+        except OSError:
+            pass
+        raise
+    return digest.hexdigest(), size
@@ -2,6 +2,8 @@
 import { useState } from 'react';
 import './styles.css';
 const API = process.env.NEXT_PUBLIC_MASTERING_API_URL || '';
+// statuses after which the server sends nothing more (TERMINAL_STATUSES in the API)
+const TERMINAL = ['done', 'error', 'expired'];
 export default function Page(){
   const [file, setFile] = useState<File|null>(null);
   const [preset, setPreset] = useState('streaming');
@@ -16,13 +18,28 @@ export default function Page(){
     fd.append('target_lufs', String(lufs)); fd.append('true_peak', String(tp));
     setStatus('uploading');
     const resp = await fetch(`${API.replace(/\/$/,'')}/v1/jobs`, { method:'POST', body: fd });
-    const data = await resp.json(); setJob({ id: data.id, status: data.status }); setStatus('queued'); poll(data.id);
+    const data = await resp.json();
+    if(!resp.ok){ setStatus('idle'); alert(data.detail || `Upload failed (${resp.status})`); return; }
+    setJob({ id: data.id, status: data.status }); setStatus(data.status); watch(data.id);
+  }
+  function watch(id: string){
+    // push updates over SSE; fall back to polling if the stream can't be opened
+    const base = API.replace(/\/$/,'');
+    if(typeof EventSource === 'undefined'){ poll(id); return; }
+    const es = new EventSource(`${base}/v1/jobs/${id}/events`);
+    let got = false;
+    es.addEventListener('job', (e: MessageEvent)=>{
+      got = true;
+      const j = JSON.parse(e.data); setJob(j); setStatus(j.status);
+      if(TERMINAL.includes(j.status)) es.close();
+    });
+    es.onerror = ()=>{ if(!got){ es.close(); poll(id); } };
   }
   async function poll(id: string){
     const i = setInterval(async ()=>{
       const r = await fetch(`${API.replace(/\/$/,'')}/v1/jobs/${id}`);
       const j = await r.json(); setJob(j); setStatus(j.status);
-      if(j.status==='done' || j.status==='error') clearInterval(i);
+      if(TERMINAL.includes(j.status)) clearInterval(i);
     }, 1500);
   }
   return (<div className="container"><h1>Mastering</h1><div className="card">
@@ -37,8 +54,9 @@ export default function Page(){
       </div>
     </div>
     <div style={{marginTop:12, display:'flex', gap:10}}><button className="btn" onClick={submit}>Create Master</button></div>
-    {job && (<div style={{marginTop:20}}><div>Status: <b>{status}</b></div>
+    {job && (<div style={{marginTop:20}}><div>Status: <b>{status}</b>{status==='running' && job.progress!=null && ` ${Math.round(job.progress)}%`}{status==='queued' && job.queue_position && ` (#${job.queue_position} in queue)`}</div>
       {job.metrics && <div className="small">LUFS {job.metrics.lufs} • TP {job.metrics.true_peak} • Preset {job.metrics.preset}</div>}
+      {job.preview_url && <div style={{marginTop:10}}><audio controls preload="none" src={`${API.replace(/\/$/,'')}${job.preview_url}?format=ogg`} /></div>}
       {job.output_url && <a className="btn" style={{display:'inline-block', marginTop:10}} href={`${API.replace(/\/$/,'')}${job.output_url}`}>Download master</a>}
     </div>)}
   </div></div>);